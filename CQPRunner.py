@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2022 franka.beyer@fau.de
+
+import time
+import queue
+import shlex
+import threading
+import subprocess
+from typing import List, Tuple, Callable, Any
+from Profiling import PROFILER
+
+EOL = "-::-EOL-::-"                               #Ausgabe von '.EOL.;' im Child-Modus von CQP
+
+class CQPProcess:
+    """
+    Langlebiger CQP-Prozess im Child-Modus (cqp -c), der Befehle über stdin erhält. Das Ende der Ausgabe eines Befehls wird über den Befehl '.EOL.;' erkannt, auf den CQP mit einer Markierungszeile antwortet.
+
+    :param command: Befehl zum Starten von CQP als Liste, z.B. ['cqp', '-c']
+    :param setup: Befehle, die nach dem Start einmal ausgeführt werden, z.B. Aktivierung des Korpus
+    """
+    def __init__(self, command:List[str], setup:List[str]):
+        self.command = command
+        self.setup = setup
+        self.proc = None
+        self.start()
+
+    def start(self) -> None:
+        """
+        Startet den CQP-Prozess und führt die einmaligen Befehle aus.
+        """
+        self.proc = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1)
+        self.execute(self.setup)
+
+    def execute(self, commands:List[str]) -> List[str]:
+        """
+        Führt Befehle aus und gibt die Ausgabezeilen bis zur nächsten Markierung zurück. Löst RuntimeError aus, wenn der Prozess vorher endet.
+
+        :param commands: Liste von CQP-Befehlen, je mit abschließendem Semikolon
+        """
+        for c in commands:
+            self.proc.stdin.write(c + "\n")
+        self.proc.stdin.write(".EOL.;\n")
+        self.proc.stdin.flush()
+        lines = []
+        for line in self.proc.stdout:
+            if line.rstrip("\n") == EOL:
+                return lines
+            lines.append(line)
+        raise RuntimeError("CQP-Prozess wurde unerwartet beendet: " + " ".join(self.command))
+
+    def close(self) -> None:
+        """
+        Beendet den CQP-Prozess.
+        """
+        if self.proc.poll() is None:
+            try:
+                self.proc.stdin.write("exit;\n")
+                self.proc.stdin.close()
+            except OSError:
+                pass
+            try:
+                self.proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+
+class CQPPool:
+    """
+    Pool aus nprocs langlebigen CQP-Prozessen. Die Kosten für den Start von CQP und die Aktivierung des Korpus fallen so nur einmal je Prozess statt einmal je Wortpaar an.
+
+    :param nprocs: Anzahl der CQP-Prozesse
+    :param corpusname: Name bzw. Aktivierung des CQP-Korpus, das verwendet werden soll
+    :param command: Befehl zum Starten von CQP als String; '-c' für den Child-Modus wird ergänzt
+    """
+    def __init__(self, nprocs:int, corpusname:str, command:str='cqp'):
+        self.nprocs = nprocs
+        self.command = shlex.split(command) + ['-c']
+        self.setup = [corpusname, 'set Context 0;']
+
+    def run(self, jobs:List[Tuple[Any, List[str]]], sink:Callable[[Any, List[List[str]]], None]) -> List[Any]:
+        """
+        Führt Aufträge auf den CQP-Prozessen aus. Ein Auftrag besteht aus einem Schlüssel, z.B. dem Wortpaar, und einer Liste von Anfragen; nach jeder Anfrage wird deren Ergebnis mit 'cat' ausgegeben. Die Ergebnisse werden als Liste von Ausgabezeilen je Anfrage an sink(Schlüssel, Ergebnisse) übergeben. Bricht ein CQP-Prozess ab, wird er neu gestartet und der Auftrag einmal wiederholt. Gibt die Schlüssel der Aufträge zurück, die dennoch fehlschlugen.
+
+        :param jobs: Liste von Tupeln aus Schlüssel und Liste von CQP-Anfragen der Form 'rs = ...;'
+        :param sink: Funktion, die die Ergebnisse eines Auftrags entgegennimmt; wird nacheinander aus mehreren Threads aufgerufen
+        """
+        q = queue.Queue()
+        for job in jobs:
+            q.put(job)
+        failed = []
+        lock = threading.Lock()
+        def work():
+            try:
+                p = CQPProcess(self.command, self.setup)
+            except (OSError, RuntimeError):
+                p = None
+            while True:
+                try:
+                    key, queries = q.get_nowait()
+                except queue.Empty:
+                    break
+                results = None
+                for attempt in range(2):
+                    try:
+                        if p is None:
+                            p = CQPProcess(self.command, self.setup)
+                        done = []                        #erst nach der letzten Anfrage übernehmen, sonst gälte ein Abbruch als "keine Treffer"
+                        for query in queries:
+                            start = time.perf_counter()
+                            done.append(p.execute([query, 'cat rs;']))
+                            PROFILER.observe("cqp_query_seconds", time.perf_counter() - start)
+                        results = done
+                        break
+                    except (OSError, RuntimeError):
+                        if p is not None:
+                            p.close()
+                        p = None
+                with lock:
+                    if results is None:
+                        failed.append(key)
+                    else:
+                        sink(key, results)
+            if p is not None:
+                p.close()
+        threads = [threading.Thread(target=work) for _ in range(min(self.nprocs, max(1, len(jobs))))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return failed
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2022 franka.beyer@fau.de
+
+import os
+import time
+import shlex
+import asyncio
+from typing import List, Dict, Tuple, Iterable, Any, Optional
+from Profiling import PROFILER
+
+class AdaptiveLimit:
+    """
+    Obergrenze für die Anzahl gleichzeitig laufender Aufträge, die während des Laufs verändert werden kann.
+
+    :param limit: anfängliche Obergrenze
+    :param minimum: kleinste erlaubte Obergrenze
+    :param maximum: größte erlaubte Obergrenze
+    """
+    def __init__(self, limit:int, minimum:int=1, maximum:Optional[int]=None):
+        self.minimum = minimum
+        self.maximum = maximum if maximum is not None else limit
+        self.limit = max(minimum, min(limit, self.maximum))
+        self.active = 0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        """
+        Wartet, bis weniger Aufträge laufen als erlaubt, und belegt einen Platz.
+        """
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+
+    async def release(self) -> None:
+        """
+        Gibt einen Platz wieder frei.
+        """
+        async with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    async def set(self, limit:int) -> None:
+        """
+        Setzt die Obergrenze innerhalb von minimum und maximum neu. Laufende Aufträge werden bei einer Senkung nicht abgebrochen.
+
+        :param limit: neue Obergrenze
+        """
+        async with self.condition:
+            self.limit = max(self.minimum, min(limit, self.maximum))
+            self.condition.notify_all()
+
+class ThroughputTuner:
+    """
+    Passt die Obergrenze einer AdaptiveLimit schrittweise an den beobachteten Durchsatz an (Hill Climbing): Solange der Durchsatz je Messintervall um mehr als tolerance steigt, wird weiter in dieselbe Richtung verändert, sonst die Richtung umgekehrt. Übersteigt die Systemlast die Anzahl der Kerne, wird die Obergrenze gesenkt.
+
+    :param limit: anzupassende AdaptiveLimit
+    :param tolerance: relative Änderung des Durchsatzes, ab der sie als Verbesserung gilt
+    """
+    def __init__(self, limit:AdaptiveLimit, tolerance:float=0.05):
+        self.limit = limit
+        self.tolerance = tolerance
+        self.direction = 1
+        self.last = None
+
+    def step(self, throughput:float, load:float, ncpus:int) -> int:
+        """
+        Gibt die neue Obergrenze für ein abgeschlossenes Messintervall zurück.
+
+        :param throughput: abgeschlossene Aufträge je Sekunde im Intervall
+        :param load: durchschnittliche Systemlast der letzten Minute
+        :param ncpus: Anzahl der Kerne
+        """
+        current = self.limit.limit
+        if load > ncpus:
+            self.direction = -1
+        elif self.last is not None and throughput < self.last * (1 + self.tolerance):
+            self.direction = -self.direction
+        self.last = throughput
+        return current + self.direction
+
+def default_jobs() -> int:
+    """
+    Gibt die Anzahl der Kerne zurück, mit der --jobs=auto beginnt.
+    """
+    return os.cpu_count() or 1
+
+class CQPScheduler:
+    """
+    Führt CQP-Scripte mit asyncio als Unterprozesse aus. Jeder Auftrag hat eine Zeitbeschränkung; schlägt er fehl oder läuft er zu lange, wird der Prozess beendet, seine Ausgabedateien werden gelöscht und er wird bis zu retries Mal wiederholt. Aufträge, die dennoch fehlschlagen, werden mit Grund in failures gesammelt, getrennt von Wortpaaren ohne Treffer.
+    Die Aufträge werden erst bei Bedarf aus dem übergebenen Iterable gelesen, höchstens zwei je möglichem gleichzeitigen Auftrag im Voraus (Backpressure), sodass z.B. Scripte erst kurz vor ihrer Ausführung geschrieben werden.
+
+    :param jobs: Anzahl gleichzeitig laufender CQP-Prozesse oder 'auto', um sie anhand von Durchsatz und Systemlast zwischen 1 und dem Vierfachen der Kerne anzupassen
+    :param timeout: Zeitbeschränkung je Auftrag in Sekunden, None für keine
+    :param retries: Anzahl der Wiederholungen eines fehlgeschlagenen Auftrags
+    :param command: Befehl zum Starten von CQP als String; '-f <script>' wird ergänzt
+    :param interval: Mindestlänge eines Messintervalls in Sekunden für 'auto'; es endet erst, wenn so viele Aufträge abgeschlossen sind, wie gleichzeitig laufen dürfen
+    """
+    def __init__(self, jobs:Any=8, timeout:Optional[float]=600, retries:int=2, command:str='cqp', interval:float=2.0):
+        self.auto = jobs == 'auto'
+        self.jobs = default_jobs() if self.auto else int(jobs)
+        self.maximum = 4 * default_jobs() if self.auto else self.jobs
+        self.timeout = timeout
+        self.retries = retries
+        self.command = shlex.split(command)
+        self.interval = interval
+        self.failures = {}
+        self.stats = {"completed": 0, "retried": 0, "timeouts": 0, "failed": 0, "limits": []}
+
+    def run(self, jobs:Iterable[Tuple[Any, str, List[str]]]) -> Dict[Any, str]:
+        """
+        Führt alle Aufträge aus und gibt die fehlgeschlagenen als Dictionary von Schlüssel und Grund zurück.
+
+        :param jobs: Iterable von Tupeln aus Schlüssel, z.B. dem Wortpaar, Name des CQP-Scripts und Liste der Ausgabedateien, die das Script beschreibt
+        """
+        self.failures = {}
+        asyncio.run(self._run(jobs))
+        return self.failures
+
+    async def _run(self, jobs:Iterable[Tuple[Any, str, List[str]]]) -> None:
+        limit = AdaptiveLimit(self.jobs, 1, self.maximum)
+        queue = asyncio.Queue(maxsize=2 * self.maximum)
+        nworkers = self.maximum
+        async def produce():
+            for job in jobs:
+                await queue.put(job)
+            for _ in range(nworkers):
+                await queue.put(None)
+        async def work():
+            while True:
+                job = await queue.get()
+                if job is None:
+                    return
+                await limit.acquire()
+                try:
+                    await self._execute(*job)
+                finally:
+                    await limit.release()
+        tuner = asyncio.create_task(self._tune(limit)) if self.auto else None
+        await asyncio.gather(produce(), *(work() for _ in range(nworkers)))
+        if tuner is not None:
+            tuner.cancel()
+        self.stats["limits"].append(limit.limit)
+
+    async def _tune(self, limit:AdaptiveLimit) -> None:
+        tuner = ThroughputTuner(limit)
+        ncpus = default_jobs()
+        done = self.stats["completed"]
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            while self.stats["completed"] - done < limit.limit:  #Intervall verlängern, bis je Platz ein Auftrag fertig ist; sonst verglichen lange Scripte 0 mit 0
+                await asyncio.sleep(self.interval)
+            throughput = (self.stats["completed"] - done) / (time.monotonic() - start)
+            done = self.stats["completed"]
+            load = os.getloadavg()[0] if hasattr(os, "getloadavg") else 0.0
+            self.stats["limits"].append(limit.limit)
+            await limit.set(tuner.step(throughput, load, ncpus))
+
+    async def _execute(self, key:Any, script:str, outputs:List[str]) -> None:
+        reason = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.stats["retried"] += 1
+                for name in outputs:                      #Teilergebnisse des abgebrochenen Versuchs verwerfen
+                    if os.path.exists(name):
+                        os.remove(name)
+                await asyncio.sleep(min(0.1 * 2 ** attempt, 5))
+            start = time.perf_counter()
+            try:
+                proc = await asyncio.create_subprocess_exec(*self.command, '-f', script, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+            except OSError as e:
+                reason = "CQP konnte nicht gestartet werden: " + str(e)
+                continue
+            try:
+                _, err = await asyncio.wait_for(proc.communicate(), self.timeout)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                self.stats["timeouts"] += 1
+                reason = "Zeitüberschreitung nach " + str(self.timeout) + " s"
+                continue
+            PROFILER.observe("cqp_script_seconds", time.perf_counter() - start)
+            if proc.returncode == 0:
+                self.stats["completed"] += 1
+                return
+            reason = "Rückgabewert " + str(proc.returncode) + (": " + err.decode(errors="replace").strip().splitlines()[-1] if err.strip() else "")
+        for name in outputs:
+            if os.path.exists(name):
+                os.remove(name)
+        self.stats["failed"] += 1
+        self.failures[key] = reason
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2022 franka.beyer@fau.de
+
+"""
+Positioneller invertierter Index über ein tokenisiertes Korpus als Alternative zu CQP. Der Index wird einmal aus einer Klartextdatei oder einer vertikalen Datei im Stil der CWB aufgebaut und als Verzeichnis von NumPy-Arrays gespeichert, die beim Öffnen nur in den Speicher gemappt werden:
+
+vocab.npy       Bytes aller Tokens (UTF-8) hintereinander
+vocaboffsets.npy Anfang jedes Tokens in vocab.npy, Länge Vokabulargröße+1
+vocabtable.npy  offene Hashtabelle der Token-IDs wie Lexicon.hash_table(), zum Nachschlagen ohne das Vokabular zu dekodieren
+tokens.npy      Token-IDs des Korpus in Textreihenfolge (int32)
+postings.npy    Positionen aller Tokens, nach Token-ID und innerhalb einer ID aufsteigend sortiert (int64)
+offsets.npy     Anfang der Positionen jeder Token-ID in postings.npy, Länge Vokabulargröße+1
+"""
+
+import os
+import click
+from array import array
+from typing import List, Tuple, Iterator, Any
+import numpy
+from Lexicon import StringTable, hash_table
+from Profiling import PROFILER, profile_options
+
+def read_tokens(file:str) -> Iterator[str]:
+    """
+    Generiert die Tokens eines Korpus nacheinander. Zeilen, die mit '<' beginnen, gelten als Strukturauszeichnung einer vertikalen Datei und werden übersprungen; enthält eine Zeile Tabulatoren, wird nur die erste Spalte verwendet, sonst jedes durch Leerzeichen getrennte Wort.
+
+    :param file: Pfad zu bzw. Name einer Klartextdatei oder vertikalen Datei
+    """
+    with open(file) as f:
+        for line in f:
+            if line.startswith("<"):
+                continue
+            if "\t" in line:
+                yield line.split("\t")[0]
+            else:
+                yield from line.split()
+
+def build_index(corpusfile:str, indexdir:str) -> None:
+    """
+    Baut den Index für ein Korpus auf und speichert ihn im Verzeichnis indexdir. Token-IDs werden in der Reihenfolge des ersten Auftretens vergeben.
+
+    :param corpusfile: Pfad zu bzw. Name einer Klartextdatei oder vertikalen Datei
+    :param indexdir: Verzeichnis, in das der Index geschrieben wird
+    """
+    ids = {}
+    stream = array("i")
+    for t in read_tokens(corpusfile):
+        i = ids.get(t)
+        if i is None:
+            i = ids[t] = len(ids)
+        stream.append(i)
+    tokens = numpy.frombuffer(stream, dtype=numpy.int32) if len(stream) else numpy.zeros(0, dtype=numpy.int32)
+    encoded = [t.encode("utf-8") for t in ids]
+    vocaboffsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+    numpy.cumsum([len(b) for b in encoded], out=vocaboffsets[1:])
+    postings = numpy.argsort(tokens, kind="stable").astype(numpy.int64)  #stabil, also Positionen je ID aufsteigend
+    offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+    numpy.cumsum(numpy.bincount(tokens, minlength=len(encoded)), out=offsets[1:])
+    os.makedirs(indexdir, exist_ok=True)
+    numpy.save(os.path.join(indexdir, "vocab.npy"), numpy.frombuffer(b"".join(encoded), dtype=numpy.uint8))
+    numpy.save(os.path.join(indexdir, "vocaboffsets.npy"), vocaboffsets)
+    numpy.save(os.path.join(indexdir, "vocabtable.npy"), hash_table(ids))
+    numpy.save(os.path.join(indexdir, "tokens.npy"), tokens)
+    numpy.save(os.path.join(indexdir, "postings.npy"), postings)
+    numpy.save(os.path.join(indexdir, "offsets.npy"), offsets)
+
+class CorpusIndex:
+    """
+    Geöffneter Index aus build_index(). Beantwortet die Fensteranfrage '[]? "x" []{0,3} "y" []' aus write_cqp_scripts() durch Schneiden der Positionslisten von x und y mit einer Abstandsbedingung. Die Wortformen werden anders als bei CQP wörtlich und nicht als reguläre Ausdrücke verglichen. Das Vokabular wird wie bei Lexicon über eine gemappte Hashtabelle nachgeschlagen und nie vollständig dekodiert.
+
+    :param indexdir: Verzeichnis des Index
+    """
+    def __init__(self, indexdir:str):
+        load = lambda name: numpy.load(os.path.join(indexdir, name + ".npy"), mmap_mode="r")
+        self.vocab = load("vocab")
+        self.vocaboffsets = load("vocaboffsets")
+        self.tokens = load("tokens")
+        self.postings = load("postings")
+        self.offsets = load("offsets")
+        if os.path.exists(os.path.join(indexdir, "vocabtable.npy")):
+            table = load("vocabtable")
+        else:                                                     #Index aus einer älteren Version ohne Hashtabelle
+            blob = self.vocab.tobytes()
+            bounds = self.vocaboffsets.tolist()
+            table = hash_table(blob[bounds[i]:bounds[i+1]].decode("utf-8") for i in range(len(bounds) - 1))
+        self.vocabulary = StringTable(self.vocab, self.vocaboffsets, table)
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def words(self) -> Iterator[str]:
+        """
+        Generiert alle Wortformen in der Reihenfolge ihrer Token-IDs.
+        """
+        for i in range(len(self.vocabulary)):
+            yield self.vocabulary.string(i)
+
+    def positions(self, forms:List[str]) -> Any:
+        """
+        Gibt die sortierten Positionen aller Wortformen als Array zurück. Unbekannte Wortformen werden übergangen.
+
+        :param forms: Liste von Wortformen
+        """
+        parts = []
+        for form in dict.fromkeys(forms):
+            i = self.vocabulary.find(form)
+            if i >= 0:
+                parts.append(self.postings[self.offsets[i]:self.offsets[i+1]])
+        if not parts:
+            return numpy.zeros(0, dtype=numpy.int64)
+        if len(parts) == 1:
+            return numpy.asarray(parts[0])
+        return numpy.sort(numpy.concatenate(parts))
+
+    def window_query(self, xs:List[str], ys:List[str], maxgap:int=3) -> List[Tuple[int, int]]:
+        """
+        Gibt die Treffer der Anfrage '[]? "x" []{0,maxgap} "y" []' mit x aus xs und y aus ys als Liste von Tupeln aus Anfangs- und Endposition (exklusiv) zurück, in der Reihenfolge, in der CQP sie ausgibt: Je Anfangsposition wird der kürzeste Treffer gewählt, und ein Treffer, der nicht hinter dem vorherigen endet, entfällt.
+
+        :param xs: Liste der ersten Wortformen
+        :param ys: Liste der zweiten Wortformen
+        :param maxgap: größte Anzahl von Tokens zwischen x und y
+        """
+        xpos = self.positions(xs)
+        ypos = self.positions(ys)
+        if not len(xpos) or not len(ypos):
+            return []
+        idx = numpy.searchsorted(ypos, xpos + 1)                  #nächstes y hinter jedem x
+        ok = idx < len(ypos)
+        q = numpy.where(ok, ypos[numpy.minimum(idx, len(ypos) - 1)], -1)
+        ok &= (q <= xpos + maxgap + 1) & (q + 1 < len(self.tokens))  #Abstand und erzwungenes Wort am Schluss
+        xpos = xpos[ok]
+        ends = q[ok] + 2
+        if not len(xpos):
+            return []
+        before = xpos - 1                                         #Anfänge mit vorangestelltem Token für []?
+        keep = (before >= 0) & ~numpy.isin(before, xpos)          #ist das Token davor selbst ein x, beginnt dort der kürzere Treffer
+        starts = numpy.concatenate((xpos, before[keep]))
+        allends = numpy.concatenate((ends, ends[keep]))
+        order = numpy.argsort(starts, kind="stable")
+        starts = starts[order]
+        allends = allends[order]
+        last = numpy.concatenate(([-1], numpy.maximum.accumulate(allends)[:-1]))
+        hit = allends > last
+        return list(zip(starts[hit].tolist(), allends[hit].tolist()))
+
+    def lines(self, hits:List[Tuple[int, int]]) -> List[str]:
+        """
+        Gibt Treffer als Ergebniszeilen im Format von 'cat' bei CQP mit 'set Context 0;' zurück.
+
+        :param hits: Liste von Tupeln aus Anfangs- und Endposition
+        """
+        string = self.vocabulary.string
+        return ["%8d: <%s>\n" % (s, " ".join(string(t) for t in self.tokens[s:e].tolist())) for s, e in hits]
+
+
+@click.command()
+@click.option('--corpusfile', default='corpus.txt', help='Name of plain text or CWB-style vertical file containing the tokenized corpus. Defaults to "corpus.txt".')
+@click.option('--indexdir', default='corpus.idx', help='Name of directory to write the index to. Defaults to "corpus.idx".')
+@profile_options
+def main(corpusfile, indexdir):
+    """
+    Build positional inverted index over corpus for PreprocessingCQP.py --runner=index.
+    """
+    with PROFILER.stage("build_index"):
+        build_index(corpusfile, indexdir)
+    index = CorpusIndex(indexdir)
+    PROFILER.count("tokens", len(index))
+    print(str(len(index)) + " Tokens, " + str(len(index.vocabulary)) + " Wortformen indexiert in " + indexdir)
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2022 franka.beyer@fau.de
+
+import os
+import shlex
+import pickle
+import hashlib
+import subprocess
+from typing import List, Dict, Tuple, Any
+
+def read_lexdecode(corpus:str, command:str='cwb-lexdecode') -> Dict[str, int]:
+    """
+    Liest das Lexikon eines CWB-Korpus mit Häufigkeiten über 'cwb-lexdecode -f' ein. Gibt Wortform-Häufigkeit-Dictionary zurück.
+
+    :param corpus: Name des CWB-Korpus, z.B. 'TAZ' oder 'TAZ;'
+    :param command: Befehl zum Starten von cwb-lexdecode, z.B. 'cwb-lexdecode -r /pfad/zur/registry'
+    """
+    out = subprocess.run(shlex.split(command) + ['-f', '-P', 'word', corpus.strip().rstrip(';')], stdout=subprocess.PIPE, check=True, text=True).stdout
+    freqs = {}
+    for line in out.splitlines():
+        freq, _, form = line.partition("\t")
+        if form:
+            freqs[form] = freqs.get(form, 0) + int(freq)
+    return freqs
+
+def lexdecode_signature(corpus:str, command:str='cwb-lexdecode') -> str:
+    """
+    Gibt einen Hash der Korpusstatistik von 'cwb-lexdecode -S' zurück. Sie enthält die Anzahl der Tokens und Wortformen und ändert sich daher, wenn das Korpus neu kodiert wird.
+
+    :param corpus: Name des CWB-Korpus, z.B. 'TAZ' oder 'TAZ;'
+    :param command: Befehl zum Starten von cwb-lexdecode, z.B. 'cwb-lexdecode -r /pfad/zur/registry'
+    """
+    out = subprocess.run(shlex.split(command) + ['-S', '-P', 'word', corpus.strip().rstrip(';')], stdout=subprocess.PIPE, check=True, text=True).stdout
+    return hashlib.sha1(out.encode("utf-8")).hexdigest()
+
+def index_signature(indexdir:str) -> str:
+    """
+    Gibt Name, Größe und Änderungszeit aller Dateien eines CorpusIndex als String zurück; wird der Index neu aufgebaut, ändert er sich.
+
+    :param indexdir: Verzeichnis des CorpusIndex
+    """
+    entries = []
+    for name in sorted(os.listdir(indexdir)):
+        st = os.stat(os.path.join(indexdir, name))
+        entries.append(name + ":" + str(st.st_size) + ":" + str(st.st_mtime_ns))
+    return os.path.abspath(indexdir) + ";" + ";".join(entries)
+
+def read_index_lexicon(index:Any) -> Dict[str, int]:
+    """
+    Liest das Lexikon mit Häufigkeiten aus einem CorpusIndex. Gibt Wortform-Häufigkeit-Dictionary zurück.
+
+    :param index: geöffneter CorpusIndex
+    """
+    return dict(zip(index.words(), (index.offsets[1:] - index.offsets[:-1]).tolist()))
+
+class CorpusLexicon:
+    """
+    Wortformen eines Korpus mit ihren Häufigkeiten, mit denen Kombinationen morphologischer Formen vor der Suche verworfen werden, die im Korpus nicht vorkommen können. Zählt die verworfenen und verbleibenden Anfragen.
+
+    :param freqs: Wortform-Häufigkeit-Dictionary
+    :param minfreq: kleinste Häufigkeit, die eine Wortform haben muss, damit nach ihr gesucht wird
+    """
+    def __init__(self, freqs:Dict[str, int], minfreq:int=1):
+        self.freqs = freqs
+        self.minfreq = minfreq
+        self.queries = 0
+        self.pruned = 0
+        self.emptied = 0
+
+    @classmethod
+    def load(cls, cachefile:str, source:Any, minfreq:int=1, signature:str='') -> 'CorpusLexicon':
+        """
+        Lädt das Lexikon aus cachefile oder, wenn es die Datei noch nicht gibt oder sie zu einer anderen Signatur des Korpus gehört, mit source und speichert es dort zusammen mit der Signatur.
+
+        :param cachefile: Pfad zu bzw. Name der Datei, in der das Lexikon zwischengespeichert wird
+        :param source: Funktion ohne Argumente, die das Wortform-Häufigkeit-Dictionary liefert, z.B. mit read_lexdecode() oder read_index_lexicon()
+        :param minfreq: kleinste Häufigkeit, die eine Wortform haben muss, damit nach ihr gesucht wird
+        :param signature: Signatur des Korpus, z.B. von lexdecode_signature() oder index_signature(); ändert sie sich, wird das Lexikon neu eingelesen
+        """
+        freqs = None
+        if os.path.exists(cachefile):
+            with open(cachefile, "rb") as f:
+                cached = pickle.load(f)
+            if isinstance(cached, tuple) and cached[0] == signature:  #Dateien ohne Signatur stammen aus älteren Versionen
+                freqs = cached[1]
+        if freqs is None:
+            freqs = source()
+            with open(cachefile + ".tmp", "wb") as f:
+                pickle.dump((signature, freqs), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(cachefile + ".tmp", cachefile)
+        return cls(freqs, minfreq)
+
+    def prune(self, forms:Dict[str, List[List[str]]]) -> Tuple[Dict[str, List[List[str]]], List[str]]:
+        """
+        Verwirft Kombinationen morphologischer Formen, von denen eine Form seltener als minfreq im Korpus vorkommt. Gibt das verkleinerte Dictionary ohne die Wortpaare, für die keine Kombination übrig bleibt, und die Liste dieser Wortpaare zurück.
+
+        :param forms: Dictionary mit Wortpaaren als Keys und Listen von Listen der möglichen Kombinationen der morphologischen Formen als Values
+        """
+        kept = {}
+        empty = []
+        for e, combinations in forms.items():
+            rest = [p for p in combinations if self.freqs.get(p[0], 0) >= self.minfreq and self.freqs.get(p[1], 0) >= self.minfreq]
+            self.queries += len(combinations)
+            self.pruned += len(combinations) - len(rest)
+            if rest:
+                kept[e] = rest
+            else:
+                empty.append(e)
+                self.emptied += 1
+        return kept, empty
+
+    def report(self) -> str:
+        """
+        Gibt die Statistik seit dem Laden als Text zurück.
+        """
+        return "Lexikon: " + str(self.pruned) + " von " + str(self.queries) + " Anfragen verworfen, " + str(self.queries - self.pruned) + " verbleiben; " + str(self.emptied) + " Wortpaare ohne Anfrage auf die Blacklist gesetzt"
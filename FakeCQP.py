@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2022 franka.beyer@fau.de
+
+"""
+Minimaler Ersatz für das Programm cqp der IMS Open Corpus Workbench, mit dem sich PreprocessingCQP ohne installiertes CWB-Korpus testen lässt.
+
+Unterstützt werden die Aufrufe 'FakeCQP.py -f <script>' und 'FakeCQP.py -c' (Child-Modus, Befehle über stdin) sowie die Befehle, die PreprocessingCQP verwendet: Aktivierung eines Korpus, 'set ...', benannte Anfragen aus Tokens der Form '[]', '[]?', '[]{m,n}' und '"regex"', 'cat <name>;', 'cat <name> >> "<datei>";' und '.EOL.;'.
+Das Korpus wird aus der Datei gelesen, die in der Umgebungsvariable FAKECQP_CORPUS steht; Klartext mit Leerzeichen zwischen den Tokens oder eine vertikale Datei mit einem Token je Zeile in der ersten Spalte.
+Mit FAKECQP_STARTUP und FAKECQP_LATENCY können Startzeit und Dauer je Anfrage in Sekunden simuliert werden.
+Fehler lassen sich gezielt auslösen: Passt der reguläre Ausdruck in FAKECQP_FAIL auf eine Anfrage, bricht das Programm mit Rückgabewert 1 ab; passt der in FAKECQP_HANG, bleibt es stehen. FAKECQP_FAILRATE und FAKECQP_HANGRATE geben stattdessen eine Wahrscheinlichkeit je Anfrage an.
+"""
+
+import os
+import sys
+import time
+import random
+import regex as re
+from typing import List, Dict, Tuple, Any
+
+EOL = "-::-EOL-::-"
+
+ELEMENT = re.compile(r'\[\]\{(\d+),(\d+)\}|\[\](\?|\*|\+)?|"((?:[^"\\]|\\.)*)"')
+
+def read_corpus(file:str) -> List[str]:
+    """
+    Liest ein Korpus als Liste von Tokens ein.
+
+    :param file: Pfad zu bzw. Name einer Klartextdatei oder vertikalen Datei
+    """
+    tokens = []
+    with open(file) as f:
+        for line in f:
+            if line.startswith("<"):
+                continue
+            if "\t" in line:
+                tokens.append(line.split("\t")[0])
+            else:
+                tokens.extend(line.split())
+    return tokens
+
+def parse_query(query:str) -> List[Tuple[Any, int, int]]:
+    """
+    Zerlegt eine Anfrage in eine Liste von Elementen aus regulärem Ausdruck (None für beliebiges Token), Mindest- und Höchstzahl der Wiederholungen.
+
+    :param query: CQP-Anfrage ohne Namen und Semikolon
+    """
+    elements = []
+    pos = 0
+    query = query.strip()
+    while pos < len(query):
+        if query[pos].isspace():
+            pos += 1
+            continue
+        m = ELEMENT.match(query, pos)
+        if m is None:
+            raise ValueError("Syntaxfehler in Anfrage: " + query)
+        if m.group(1) is not None:
+            elements.append((None, int(m.group(1)), int(m.group(2))))
+        elif m.group(4) is not None:
+            elements.append((re.compile(m.group(4)), 1, 1))
+        else:
+            elements.append((None,) + {None: (1, 1), "?": (0, 1), "*": (0, 100), "+": (1, 100)}[m.group(3)])
+        pos = m.end()
+    return elements
+
+class Corpus:
+    """
+    Korpus im Arbeitsspeicher mit Positionsindex je Token.
+
+    :param tokens: Liste der Tokens
+    """
+    def __init__(self, tokens:List[str]):
+        self.tokens = tokens
+        self.positions = {}
+        for i, t in enumerate(tokens):
+            self.positions.setdefault(t, []).append(i)
+
+    def _match(self, elements:List[Tuple[Any, int, int]], k:int, pos:int) -> Any:
+        if k == len(elements):
+            return pos
+        regex, lo, hi = elements[k]
+        for n in range(lo, hi + 1):                      #kürzeste Übereinstimmung zuerst
+            end = pos + n
+            if end > len(self.tokens):
+                return None
+            if regex is not None and n and not regex.fullmatch(self.tokens[pos]):
+                return None
+            res = self._match(elements, k + 1, end)
+            if res is not None:
+                return res
+        return None
+
+    def query(self, query:str) -> List[Tuple[int, int]]:
+        """
+        Gibt die Treffer einer Anfrage als Liste von Tupeln aus Anfangs- und Endposition (exklusiv) zurück. Je Anfangsposition wird der kürzeste Treffer gesucht; ein Treffer, der an derselben Position endet wie ein früher beginnender, entfällt, sodass optionale Elemente am Anfang wie bei CQP mitgenommen werden.
+
+        :param query: CQP-Anfrage ohne Namen und Semikolon
+        """
+        elements = parse_query(query)
+        anchor = next((k for k, e in enumerate(elements) if e[0] is not None), None)
+        if anchor is None:
+            starts = range(len(self.tokens))
+        else:
+            lo = sum(e[1] for e in elements[:anchor])
+            hi = sum(e[2] for e in elements[:anchor])
+            regex = elements[anchor][0]
+            starts = set()
+            for t, positions in self.positions.items():
+                if regex.fullmatch(t):
+                    for p in positions:
+                        starts.update(range(max(0, p - hi), p - lo + 1))
+            starts = sorted(starts)
+        res = []
+        last = -1
+        for s in starts:
+            end = self._match(elements, 0, s)
+            if end is not None and end > last:
+                res.append((s, end))
+                last = end
+        return res
+
+def split_commands(text:str) -> List[str]:
+    """
+    Zerlegt Text in einzelne Befehle an Semikolons außerhalb von Anführungszeichen.
+
+    :param text: CQP-Befehle
+    """
+    commands = []
+    current = []
+    quoted = False
+    escaped = False
+    for ch in text:
+        if escaped:
+            escaped = False
+        elif ch == "\\":
+            escaped = True
+        elif ch == '"':
+            quoted = not quoted
+        elif ch == ";" and not quoted:
+            commands.append("".join(current).strip())
+            current = []
+            continue
+        current.append(ch)
+    rest = "".join(current).strip()
+    if rest:
+        commands.append(rest)
+    return commands
+
+def triggered(name:str, command:str) -> bool:
+    """
+    Prüft, ob ein simulierter Fehler für eine Anfrage ausgelöst wird, weil der reguläre Ausdruck in der Umgebungsvariable name auf sie passt oder mit der Wahrscheinlichkeit in name + 'RATE'.
+
+    :param name: 'FAKECQP_FAIL' oder 'FAKECQP_HANG'
+    :param command: Anfrage
+    """
+    pattern = os.environ.get(name)
+    if pattern and re.search(pattern, command):
+        return True
+    return random.random() < float(os.environ.get(name + "RATE", "0"))
+
+def execute(command:str, corpus:Corpus, named:Dict[str, List[Tuple[int, int]]], out:Any) -> bool:
+    """
+    Führt einen Befehl aus. Gibt False zurück, wenn das Programm beendet werden soll.
+
+    :param command: einzelner Befehl ohne Semikolon
+    :param corpus: Korpus
+    :param named: Dictionary der benannten Anfrageergebnisse
+    :param out: Ausgabestrom
+    """
+    if not command or command.startswith("set ") or re.fullmatch(r"[A-Z][A-Z0-9_-]*", command):
+        return True
+    if command == "exit":
+        return False
+    if command == ".EOL.":
+        out.write(EOL + "\n")
+        out.flush()
+        return True
+    m = re.fullmatch(r'(\w+)\s*=\s*(.*)', command, re.S)
+    if m:
+        time.sleep(float(os.environ.get("FAKECQP_LATENCY", "0")))
+        if triggered("FAKECQP_HANG", command):
+            while True:
+                time.sleep(3600)
+        if triggered("FAKECQP_FAIL", command):
+            sys.stderr.write("FakeCQP: simulierter Fehler bei " + command + "\n")
+            sys.exit(1)
+        named[m.group(1)] = corpus.query(m.group(2))
+        return True
+    m = re.fullmatch(r'cat\s+(\w+)(?:\s*(>>|>)\s*"([^"]*)")?', command)
+    if m:
+        lines = ["%8d: <%s>\n" % (s, " ".join(corpus.tokens[s:e])) for s, e in named.get(m.group(1), [])]
+        if m.group(2):
+            with open(m.group(3), "a" if m.group(2) == ">>" else "w") as f:
+                f.writelines(lines)
+        else:
+            out.writelines(lines)
+            out.flush()
+        return True
+    sys.stderr.write("FakeCQP: unbekannter Befehl: " + command + "\n")
+    return True
+
+def main(argv:List[str]) -> int:
+    """
+    Run fake cqp with arguments as given to cqp.
+    """
+    time.sleep(float(os.environ.get("FAKECQP_STARTUP", "0")))
+    corpus = Corpus(read_corpus(os.environ["FAKECQP_CORPUS"]))
+    named = {}
+    if "-f" in argv:
+        with open(argv[argv.index("-f") + 1]) as f:
+            for command in split_commands(f.read()):
+                if not execute(command, corpus, named, sys.stdout):
+                    break
+        return 0
+    buffer = ""
+    for line in sys.stdin:
+        buffer += line
+        commands = split_commands(buffer)
+        if buffer.rstrip().endswith(";"):
+            buffer = ""
+        else:
+            buffer = commands.pop() if commands else buffer
+        for command in commands:
+            if not execute(command, corpus, named, sys.stdout):
+                return 0
+    return 0
+
+if __name__ == "__main__":
+
+    sys.exit(main(sys.argv[1:]))
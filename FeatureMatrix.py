@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2022 franka.beyer@fau.de
+
+import math
+from collections import Counter
+from typing import List, Dict, Any, Iterator, Tuple
+import numpy
+
+def normalize_rows(a:Any) -> Tuple[Any, Any]:
+    """
+    Normalisiert alle Zeilen eines 2-D-Arrays auf einmal auf Länge 1. Gibt das normalisierte Array und eine Maske der Nullzeilen zurück; Nullzeilen bleiben unverändert.
+
+    :param a: 2-D-Array
+    """
+    norms = numpy.array([math.sqrt(numpy.dot(row, row)) for row in a], dtype=numpy.float64)  #je Zeile numpy.dot wie bisher, damit die Werte bis aufs letzte Bit gleich bleiben
+    zero = norms == 0
+    norms[zero] = 1
+    return a / norms[:, None], zero
+
+def balance_indices(labels:List[str]) -> Tuple[Any, int, int]:
+    """
+    Wählt mit Indexmasken je Label die ersten h Zeilen aus, wobei h die Anzahl der Zeilen des seltensten Labels ist. Gibt die ausgewählten Zeilenindizes, gruppiert nach Label in der Reihenfolge ihres ersten Auftretens, sowie h und die Anzahl der Label zurück.
+
+    :param labels: Liste der Label je Zeile
+    """
+    if not labels:
+        return numpy.zeros(0, dtype=numpy.int64), 0, 0
+    names, first, codes = numpy.unique(numpy.asarray(labels, dtype=object), return_index=True, return_inverse=True)
+    order = numpy.argsort(first, kind='stable')              #Label in der Reihenfolge ihres ersten Auftretens
+    rank = numpy.empty(len(order), dtype=numpy.int64)
+    rank[order] = numpy.arange(len(order))
+    codes = rank[codes.reshape(-1)]
+    counts = numpy.bincount(codes)
+    h = int(counts.min())
+    rows = numpy.argsort(codes, kind='stable')               #gruppiert nach Label, innerhalb eines Labels in Originalreihenfolge
+    within = numpy.arange(len(rows)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    return rows[within < h], h, len(counts)
+
+class FeatureMatrix:
+    """
+    Dünn besetzte Wortpaar-Feature-Matrix im CSR-Format. Zeile i gehört zum Wortpaar pairs[i], ihre Einträge stehen in indices[indptr[i]:indptr[i+1]] (Spalten) und data[indptr[i]:indptr[i+1]] (Werte). Gespeichert werden nur Einträge ungleich 0.
+
+    :param pairs: Liste der Wortpaare als Strings, eines je Zeile
+    :param indptr: Zeilenzeiger, Länge len(pairs)+1
+    :param indices: Spaltenindizes der gespeicherten Einträge
+    :param data: Werte der gespeicherten Einträge
+    :param ncols: Anzahl der Spalten bzw. Features
+    :param normalized: ob die Zeilen normalisiert wurden; bestimmt, wie Nullen in dichten Zeilen ausgegeben werden
+    """
+    def __init__(self, pairs:List[str], indptr:Any, indices:Any, data:Any, ncols:int, normalized:bool=False):
+        self.pairs = pairs
+        self.indptr = numpy.asarray(indptr, dtype=numpy.int64)
+        self.indices = numpy.asarray(indices, dtype=numpy.int64)
+        self.data = numpy.asarray(data, dtype=numpy.float64)
+        self.ncols = ncols
+        self.normalized = normalized
+
+    @classmethod
+    def from_counters(cls, patternizeddict:Dict[str, Counter], chosenpatterns:List[str]) -> 'FeatureMatrix':
+        """
+        Erstellt aus Wortpaar-Counter(Patterns)-Dictionary und Liste der als Features gewählten Patterns eine Matrix der absoluten Häufigkeiten.
+
+        :param patternizeddict: Wortpaar-Counter(Patterns)-Dictionary
+        :param chosenpatterns: Liste der als Features gewählten Patterns
+        """
+        column = {p: i for i, p in enumerate(chosenpatterns)}
+        indptr = [0]
+        indices = []
+        data = []
+        for pair, counter in patternizeddict.items():
+            row = []
+            if len(counter) < len(column):                 #über die kleinere der beiden Seiten iterieren
+                for pattern, count in counter.items():
+                    idx = column.get(pattern)
+                    if idx is not None:
+                        row.append((idx, count))
+                row.sort()
+            else:
+                for idx, pattern in enumerate(chosenpatterns):
+                    count = counter.get(pattern)
+                    if count:
+                        row.append((idx, count))
+            for idx, count in row:
+                indices.append(idx)
+                data.append(count)
+            indptr.append(len(indices))
+        return cls(list(patternizeddict.keys()), indptr, indices, data, len(chosenpatterns))
+
+    def __len__(self) -> int:
+        return len(self.pairs)
+
+    def nnz(self) -> int:
+        """
+        Gibt die Anzahl der gespeicherten Einträge zurück.
+        """
+        return len(self.data)
+
+    def log_scale(self) -> 'FeatureMatrix':
+        """
+        Gibt Matrix zurück, in der jede absolute Häufigkeit c durch log(c + 1) ersetzt wurde. Der Logarithmus wird nur einmal je vorkommender Häufigkeit berechnet.
+        """
+        values, inverse = numpy.unique(self.data, return_inverse=True)
+        logs = numpy.array([math.log(v + 1) for v in values.tolist()], dtype=numpy.float64)
+        return FeatureMatrix(self.pairs, self.indptr, self.indices, logs[inverse], self.ncols, self.normalized)
+
+    def normalize(self) -> 'FeatureMatrix':
+        """
+        Gibt Matrix zurück, deren Zeilen einzeln auf Länge 1 normalisiert wurden. Nullzeilen bleiben Nullzeilen.
+        """
+        norms = numpy.ones(len(self.pairs), dtype=numpy.float64)
+        dense = numpy.zeros(self.ncols, dtype=numpy.float64)
+        for i in range(len(self.pairs)):
+            a, b = self.indptr[i], self.indptr[i+1]
+            if a == b:
+                continue
+            idx = self.indices[a:b]
+            dense[idx] = self.data[a:b]
+            norms[i] = math.sqrt(numpy.dot(dense, dense))  #über die ganze dichte Zeile wie normalize_rows(); Summenreihenfolge von numpy.dot hängt von den Positionen ab
+            dense[idx] = 0
+        rowids = numpy.repeat(numpy.arange(len(self.pairs)), numpy.diff(self.indptr))
+        return FeatureMatrix(self.pairs, self.indptr, self.indices, self.data / norms[rowids], self.ncols, True)
+
+    def truncate(self, ncols:int) -> 'FeatureMatrix':
+        """
+        Gibt Matrix zurück, die nur noch die ersten ncols Spalten enthält.
+
+        :param ncols: Anzahl der zu behaltenden Spalten
+        """
+        if ncols >= self.ncols:
+            return self
+        keep = self.indices < ncols
+        indptr = numpy.concatenate(([0], numpy.cumsum(keep)))[self.indptr]
+        return FeatureMatrix(self.pairs, indptr, self.indices[keep], self.data[keep], ncols, self.normalized)
+
+    def select_rows(self, rows:Any) -> 'FeatureMatrix':
+        """
+        Gibt Matrix zurück, die nur die angegebenen Zeilen in der angegebenen Reihenfolge enthält.
+
+        :param rows: Liste oder Array von Zeilenindizes
+        """
+        rows = numpy.asarray(rows, dtype=numpy.int64)
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        indptr = numpy.concatenate(([0], numpy.cumsum(lengths)))
+        gather = numpy.repeat(starts - indptr[:-1], lengths) + numpy.arange(indptr[-1])
+        return FeatureMatrix([self.pairs[i] for i in rows.tolist()], indptr, self.indices[gather], self.data[gather], self.ncols, self.normalized)
+
+    def balance(self, labelsdict:Dict[str, str]) -> 'FeatureMatrix':
+        """
+        Behält je Label so viele Zeilen, wie das seltenste Label hat, gruppiert nach Label in der Reihenfolge ihres ersten Auftretens. Kürzt die Vektoren auf 20 * (Anzahl behaltener Zeilen) Features und normalisiert sie anschließend.
+
+        :param labelsdict: Wortpaar-Label/Relation-Dictionary
+        """
+        if not self.pairs:
+            return self
+        rows, h, nlabels = balance_indices([labelsdict[pair] for pair in self.pairs])
+        return self.select_rows(rows).truncate(20 * h * nlabels).normalize()
+
+    def row(self, i:int) -> List[float]:
+        """
+        Gibt Zeile i als dichte Liste zurück. Nullen sind wie bei normalize_vectors() Floats in normalisierten Zeilen ungleich 0 und sonst Integer.
+
+        :param i: Zeilenindex
+        """
+        a, b = self.indptr[i], self.indptr[i+1]
+        v = [0.0 if self.normalized and a < b else 0] * self.ncols
+        for idx, val in zip(self.indices[a:b].tolist(), self.data[a:b].tolist()):
+            v[idx] = val
+        return v
+
+    def rows(self) -> Iterator[Tuple[str, List[float]]]:
+        """
+        Generiert die Zeilen nacheinander als Tupel von Wortpaar und dichter Liste.
+        """
+        for i, pair in enumerate(self.pairs):
+            yield pair, self.row(i)
+
+    def to_dict(self) -> Dict[str, List[float]]:
+        """
+        Gibt die Matrix als dichtes Wortpaar-Featurevektor-Dictionary zurück.
+        """
+        return dict(self.rows())
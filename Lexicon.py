@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2022 franka.beyer@fau.de
+
+"""
+Kompaktes Lexikon aus Lemma-Wortformen- und Wortform-Lemma-Dictionary als Verzeichnis von NumPy-Arrays, die beim Öffnen nur in den Speicher gemappt werden. Die Arrays werden so von allen Prozessen gemeinsam genutzt, und Nachschlagen braucht kein vorheriges Einlesen:
+
+forms.npy           Bytes aller Wortformen (UTF-8) hintereinander, in der Reihenfolge ihres ersten Vorkommens im Lemma-Wortformen-Dictionary
+formoffsets.npy     Anfang jeder Wortform in forms.npy, Länge Anzahl der Wortformen+1
+formtable.npy       offene Hashtabelle (CRC-32, lineares Sondieren) mit der Nummer jeder Wortform oder -1 (int32)
+lemmas.npy          Bytes aller Lemmata (UTF-8) hintereinander, in der Reihenfolge des Lemma-Wortformen-Dictionary
+lemmaoffsets.npy    Anfang jedes Lemmas in lemmas.npy, Länge Anzahl der Lemmata+1
+lemmatable.npy      offene Hashtabelle mit der Nummer jedes Lemmas oder -1 (int32)
+formlemma.npy       Nummer des Lemmas jeder Wortform oder -1 (int32)
+lemmaforms.npy      Nummern der Wortformen aller Lemmata hintereinander, je Lemma in der ursprünglichen Reihenfolge (int32)
+lemmaformoffsets.npy Anfang der Wortformen jedes Lemmas in lemmaforms.npy, Länge Anzahl der Lemmata+1
+"""
+
+import os
+import zlib
+import click
+import json
+from functools import lru_cache
+from collections.abc import Mapping
+from typing import List, Dict, Iterable, Iterator, Tuple, Any
+import numpy
+from Profiling import PROFILER, profile_options
+
+def encode_strings(strings:Iterable[str]) -> Tuple[Any, Any]:
+    """
+    Gibt die Bytes der Strings (UTF-8) hintereinander und den Anfang jedes Strings darin als Arrays zurück.
+
+    :param strings: Strings
+    """
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+    numpy.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return numpy.frombuffer(b"".join(encoded), dtype=numpy.uint8), offsets
+
+def hash_table(strings:Iterable[str]) -> Any:
+    """
+    Gibt eine offene Hashtabelle mit der Nummer jedes Strings zurück: Ein String steht ab Position CRC-32 seiner Bytes modulo Tabellengröße an der ersten freien Stelle. Die Tabellengröße ist eine Zweierpotenz und mindestens doppelt so groß wie die Anzahl der Strings.
+
+    :param strings: Strings ohne Duplikate
+    """
+    strings = list(strings)
+    size = 1
+    while size < 2 * len(strings):
+        size *= 2
+    table = numpy.full(size, -1, dtype=numpy.int32)
+    mask = size - 1
+    for i, s in enumerate(strings):
+        h = zlib.crc32(s.encode("utf-8")) & mask
+        while table[h] >= 0:
+            h = (h + 1) & mask
+        table[h] = i
+    return table
+
+def build_lexicon(lemmaform:Dict[str, List[str]], formlemma:Dict[str, str], lexicondir:str) -> None:
+    """
+    Speichert Lemma-Wortformen- und Wortform-Lemma-Dictionary als Lexikon im Verzeichnis lexicondir. Wortformen, die nur im Lemma-Wortformen-Dictionary vorkommen, werden ohne Lemma aufgenommen.
+
+    :param lemmaform: Lemma-Wortformen-Dictionary
+    :param formlemma: Wortform-Lemma-Dictionary
+    :param lexicondir: Verzeichnis, in das das Lexikon geschrieben wird
+    """
+    formids = {}
+    for forms in lemmaform.values():                      #Reihenfolge wie in create_formlem_dict(), unabhängig von der von formlemma
+        for f in forms:
+            if f not in formids:
+                formids[f] = len(formids)
+    for f in formlemma:
+        if f not in formids:
+            formids[f] = len(formids)
+    lemmaids = {l: i for i, l in enumerate(lemmaform)}
+    for l in formlemma.values():
+        if l not in lemmaids:
+            lemmaids[l] = len(lemmaids)
+    fl = numpy.full(len(formids), -1, dtype=numpy.int32)
+    for f, l in formlemma.items():
+        fl[formids[f]] = lemmaids[l]
+    lf = numpy.array([formids[f] for forms in lemmaform.values() for f in forms], dtype=numpy.int32)
+    lfoffsets = numpy.zeros(len(lemmaids) + 1, dtype=numpy.int64)
+    numpy.cumsum([len(forms) for forms in lemmaform.values()] + [0] * (len(lemmaids) - len(lemmaform)), out=lfoffsets[1:])
+    forms, formoffsets = encode_strings(formids)
+    lemmas, lemmaoffsets = encode_strings(lemmaids)
+    os.makedirs(lexicondir, exist_ok=True)
+    save = lambda name, a: numpy.save(os.path.join(lexicondir, name + ".npy"), a)
+    save("forms", forms)
+    save("formoffsets", formoffsets)
+    save("formtable", hash_table(formids))
+    save("lemmas", lemmas)
+    save("lemmaoffsets", lemmaoffsets)
+    save("lemmatable", hash_table(lemmaids))
+    save("formlemma", fl)
+    save("lemmaforms", lf)
+    save("lemmaformoffsets", lfoffsets)
+    with open(os.path.join(lexicondir, "counts.json"), "w") as f:  #Anzahl der Einträge beider Dictionaries
+        json.dump({"formlemma": len(formlemma), "lemmaform": len(lemmaform)}, f)
+
+class StringTable:
+    """
+    Gemappte Strings mit offener Hashtabelle aus build_lexicon(). Schlägt die Nummer eines Strings in O(1) nach.
+
+    :param blob: Bytes aller Strings hintereinander
+    :param offsets: Anfang jedes Strings in blob
+    :param table: Hashtabelle aus hash_table()
+    """
+    def __init__(self, blob:Any, offsets:Any, table:Any):
+        self.blob = memoryview(blob)
+        self.offsets = memoryview(offsets)
+        self.table = memoryview(table)
+        self.mask = len(table) - 1
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def find(self, s:str) -> int:
+        """
+        Gibt die Nummer des Strings oder -1 zurück.
+
+        :param s: gesuchter String
+        """
+        if self.mask < 0:
+            return -1
+        b = s.encode("utf-8")
+        h = zlib.crc32(b) & self.mask
+        table = self.table
+        offsets = self.offsets
+        while True:
+            i = table[h]
+            if i < 0 or self.blob[offsets[i]:offsets[i+1]] == b:
+                return i
+            h = (h + 1) & self.mask
+
+    def string(self, i:int) -> str:
+        """
+        Gibt den String mit der Nummer i zurück.
+
+        :param i: Nummer des Strings
+        """
+        return self.blob[self.offsets[i]:self.offsets[i+1]].tobytes().decode("utf-8")
+
+class FormLemmaView(Mapping):
+    """
+    Wortform-Lemma-Dictionary eines Lexicon, nur lesend und ohne die Einträge in den Speicher zu laden. Die zuletzt nachgeschlagenen Wortformen werden je Prozess in einem beschränkten Cache gehalten, da Tokens im Korpus sehr ungleich häufig sind.
+
+    :param lexicon: Lexicon
+    :param cachesize: Anzahl der zwischengespeicherten Wortformen
+    """
+    def __init__(self, lexicon:'Lexicon', cachesize:int=1 << 16):
+        self.lexicon = lexicon
+        self.forms = lexicon.forms
+        self.lemmas = lexicon.lemmas
+        self.formlemma = memoryview(lexicon.arrays["formlemma"])
+        self.lookup = lru_cache(maxsize=cachesize)(self._lookup)
+
+    def _lookup(self, form:str) -> Any:
+        i = self.forms.find(form)
+        if i < 0 or self.formlemma[i] < 0:
+            return None
+        return self.lemmas.string(self.formlemma[i])
+
+    def get(self, form:str, default:Any=None) -> Any:
+        lemma = self.lookup(form)
+        return default if lemma is None else lemma
+
+    def __getitem__(self, form:str) -> str:
+        lemma = self.get(form)
+        if lemma is None:
+            raise KeyError(form)
+        return lemma
+
+    def __contains__(self, form:Any) -> bool:
+        return isinstance(form, str) and self.get(form) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return (self.forms.string(i) for i, l in enumerate(self.formlemma) if l >= 0)
+
+    def __len__(self) -> int:
+        return self.lexicon.counts["formlemma"]
+
+    def __reduce__(self) -> Tuple[Any, Tuple[Any, str]]:
+        return getattr, (self.lexicon, "formlemma")
+
+class LemmaFormView(Mapping):
+    """
+    Lemma-Wortformen-Dictionary eines Lexicon, nur lesend und ohne die Einträge in den Speicher zu laden.
+
+    :param lexicon: Lexicon
+    """
+    def __init__(self, lexicon:'Lexicon'):
+        self.lexicon = lexicon
+        self.forms = lexicon.forms
+        self.lemmas = lexicon.lemmas
+        self.lemmaforms = memoryview(lexicon.arrays["lemmaforms"])
+        self.offsets = memoryview(lexicon.arrays["lemmaformoffsets"])
+
+    def get(self, lemma:str, default:Any=None) -> Any:
+        i = self.lemmas.find(lemma)
+        if i < 0 or i >= len(self):
+            return default
+        return [self.forms.string(j) for j in self.lemmaforms[self.offsets[i]:self.offsets[i+1]]]
+
+    def __getitem__(self, lemma:str) -> List[str]:
+        forms = self.get(lemma)
+        if forms is None:
+            raise KeyError(lemma)
+        return forms
+
+    def __contains__(self, lemma:Any) -> bool:
+        if not isinstance(lemma, str):
+            return False
+        i = self.lemmas.find(lemma)
+        return 0 <= i < len(self)
+
+    def __iter__(self) -> Iterator[str]:
+        return (self.lemmas.string(i) for i in range(len(self)))
+
+    def __len__(self) -> int:
+        return self.lexicon.counts["lemmaform"]
+
+    def __reduce__(self) -> Tuple[Any, Tuple[Any, str]]:
+        return getattr, (self.lexicon, "lemmaform")
+
+class Lexicon:
+    """
+    Geöffnetes Lexikon aus build_lexicon(). formlemma und lemmaform können überall statt des Wortform-Lemma- bzw. Lemma-Wortformen-Dictionary verwendet werden, z.B. in celex_lemmatize() und celex_generate(). Beim Pickeln, z.B. für einen Prozesspool, wird nur der Pfad übergeben und das Lexikon im anderen Prozess erneut gemappt.
+
+    :param lexicondir: Verzeichnis des Lexikons
+    """
+    NAMES = ("forms", "formoffsets", "formtable", "lemmas", "lemmaoffsets", "lemmatable", "formlemma", "lemmaforms", "lemmaformoffsets")
+
+    def __init__(self, lexicondir:str):
+        self.lexicondir = lexicondir
+        self.arrays = {name: numpy.load(os.path.join(lexicondir, name + ".npy"), mmap_mode="r") for name in self.NAMES}
+        with open(os.path.join(lexicondir, "counts.json")) as f:
+            self.counts = json.load(f)
+        self.forms = StringTable(self.arrays["forms"], self.arrays["formoffsets"], self.arrays["formtable"])
+        self.lemmas = StringTable(self.arrays["lemmas"], self.arrays["lemmaoffsets"], self.arrays["lemmatable"])
+        self.formlemma = FormLemmaView(self)
+        self.lemmaform = LemmaFormView(self)
+
+    def __reduce__(self) -> Tuple[Any, Tuple[str]]:
+        return Lexicon, (self.lexicondir,)
+
+
+def is_lexicon(path:str) -> bool:
+    """
+    Prüft, ob unter path ein Lexikon aus build_lexicon() statt einer JSON-Datei liegt.
+
+    :param path: Pfad zu bzw. Name eines Lexikons oder einer JSON-Datei
+    """
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, "counts.json"))
+
+@click.command()
+@click.option('--lemmaformfile', default='LemmaForm.json', help='Full path to or name of json file containing lemmata to wordforms dictionary. Defaults to "LemmaForm.json".')
+@click.option('--formlemmafile', default='FormLemma.json', help='Full path to or name of json file containing wordforms to lemmata dictionary. Defaults to "FormLemma.json".')
+@click.option('--lexicondir', default='Lexicon.lex', help='Name of directory to write the lexicon to. Defaults to "Lexicon.lex".')
+@profile_options
+def main(lemmaformfile, formlemmafile, lexicondir):
+    """
+    Build compact memory-mapped lexicon from existing LemmaForm and FormLemma dictionaries.
+    """
+    with PROFILER.stage("read_dicts"):
+        with open(lemmaformfile) as f:
+            lemmaform = json.load(f)
+        with open(formlemmafile) as f:
+            formlemma = json.load(f)
+    with PROFILER.stage("build_lexicon"):
+        build_lexicon(lemmaform, formlemma, lexicondir)
+    lexicon = Lexicon(lexicondir)
+    print(str(len(lexicon.formlemma)) + " Wortformen, " + str(len(lexicon.lemmaform)) + " Lemmata in " + lexicondir)
+
+if __name__ == "__main__":
+
+    main()
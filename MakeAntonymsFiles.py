@@ -5,8 +5,15 @@
 
 import os
 import csv
-from typing import List, Dict
+import json
+import contextlib
+import xml.etree.ElementTree as ET
+from typing import List, Dict, Tuple, Iterable, Iterator, Any
 import click
+import numpy
+from Lexicon import StringTable, encode_strings, hash_table
+from MakeSynonymFile import PairSet
+from Profiling import PROFILER, profile_options
 
 
 def find_relation(n:str, liste:List[str]) -> List[List[str]]:
@@ -112,17 +119,253 @@ def shorten_list(ants:List[List[str]]) -> List[List[str]]:#leider nicht ganz kor
     return s
 
 
+def germanet_files(path:str) -> List[str]:
+    """
+    Gibt die Pfade aller GermaNet-Wortlisten im angegebenen Verzeichnis wie open_all_normal_files(), aber nach Namen sortiert zurück.
+
+    :param path: Pfad zum Verzeichnis, in dem die GermaNet-Wortlisten nach Wortarten liegen
+    """
+    files = []
+    for file in sorted(os.listdir(path)):
+        if os.path.isfile(os.path.join(path, file)):
+            if file.startswith("adj") or file.startswith("nomen") or file.startswith("verben"):
+                files.append(os.path.join(path, file))
+    return files
+
+def iter_lexunits(files:Iterable[str]) -> Iterator[Tuple[str, str, str]]:
+    """
+    Liest die GermaNet-Wortlisten mit iterparse und generiert je lexUnit ein Tupel aus Synset-ID, lexUnit-ID und erster orthForm. Bereits gelesene Synsets werden sofort verworfen, sodass nie eine ganze Datei im Speicher liegt.
+
+    :param files: Pfade der GermaNet-Wortlisten
+    """
+    for file in files:
+        context = ET.iterparse(file, events=("start", "end"))
+        _, root = next(context)
+        synset = unit = word = None
+        for event, elem in context:
+            if event == "start":
+                if elem.tag == "synset":
+                    synset = elem.get("id")
+                elif elem.tag == "lexUnit":
+                    unit, word = elem.get("id"), None
+            elif elem.tag == "orthForm" and word is None:
+                word = elem.text or ""
+            elif elem.tag == "lexUnit":
+                if unit is not None and word is not None:
+                    yield synset, unit, word
+                unit = None
+            elif elem.tag == "synset":
+                root.clear()                                 #gelesene Synsets freigeben
+
+def source_signature(files:Iterable[str]) -> List[List[Any]]:
+    """
+    Gibt Name, Größe und Änderungszeit jeder Datei zurück, um einen veralteten Index zu erkennen.
+
+    :param files: Pfade der GermaNet-Wortlisten
+    """
+    return [[os.path.basename(f), os.path.getsize(f), os.path.getmtime(f)] for f in files]
+
+def build_lexunit_index(files:List[str], indexdir:str) -> None:
+    """
+    Speichert die Zuordnung von lexUnit-IDs zu Wörtern und von Synset-IDs zu ihren lexUnits als Verzeichnis von NumPy-Arrays wie ein Lexicon:
+
+    words.npy, wordoffsets.npy          erste orthForm jeder lexUnit (UTF-8) in der Reihenfolge der Wortlisten
+    units.npy, unitoffsets.npy          ID jeder lexUnit
+    unittable.npy                       offene Hashtabelle mit der Nummer jeder lexUnit-ID (int32)
+    synsets.npy, synsetoffsets.npy      ID jedes Synsets
+    synsettable.npy                     offene Hashtabelle mit der Nummer jeder Synset-ID (int32)
+    synsetunits.npy                     Nummer der ersten lexUnit jedes Synsets, Länge Anzahl der Synsets+1 (int64)
+    sources.json                        source_signature() der Wortlisten
+
+    Kommt eine lexUnit-ID mehrfach vor, gilt wie in find_word_ids() das erste Vorkommen.
+
+    :param files: Pfade der GermaNet-Wortlisten
+    :param indexdir: Verzeichnis, in das der Index geschrieben wird
+    """
+    units = {}
+    words = []
+    synsets = []
+    starts = []
+    for synset, unit, word in iter_lexunits(files):
+        if unit in units:
+            continue
+        if not synsets or synsets[-1] != synset:       #lexUnits eines Synsets stehen hintereinander
+            synsets.append(synset)
+            starts.append(len(words))
+        units[unit] = len(words)
+        words.append(word)
+    starts.append(len(words))
+    os.makedirs(indexdir, exist_ok=True)
+    save = lambda name, a: numpy.save(os.path.join(indexdir, name + ".npy"), a)
+    for name, strings in (("word", words), ("unit", units), ("synset", synsets)):
+        blob, offsets = encode_strings(strings)
+        save(name + "s", blob)
+        save(name + "offsets", offsets)
+    save("unittable", hash_table(units))
+    save("synsettable", hash_table(synsets))
+    save("synsetunits", numpy.array(starts, dtype=numpy.int64))
+    with open(os.path.join(indexdir, "sources.json"), "w") as f:
+        json.dump(source_signature(files), f)
+
+class LexUnitIndex:
+    """
+    Geöffneter Index aus build_lexunit_index(). Die Arrays werden nur in den Speicher gemappt.
+
+    :param indexdir: Verzeichnis des Index
+    """
+    NAMES = ("words", "wordoffsets", "units", "unitoffsets", "unittable", "synsets", "synsetoffsets", "synsettable", "synsetunits")
+
+    def __init__(self, indexdir:str):
+        arrays = {name: numpy.load(os.path.join(indexdir, name + ".npy"), mmap_mode="r") for name in self.NAMES}
+        self.words = StringTable(arrays["words"], arrays["wordoffsets"], numpy.zeros(0, dtype=numpy.int32))
+        self.units = StringTable(arrays["units"], arrays["unitoffsets"], arrays["unittable"])
+        self.synsets = StringTable(arrays["synsets"], arrays["synsetoffsets"], arrays["synsettable"])
+        self.synsetunits = memoryview(arrays["synsetunits"])
+
+    def word(self, unit:str) -> Any:
+        """
+        Gibt das Wort der lexUnit oder None zurück.
+
+        :param unit: lexUnit-ID
+        """
+        i = self.units.find(unit)
+        return None if i < 0 else self.words.string(i)
+
+    def synset_words(self, synset:str) -> List[str]:
+        """
+        Gibt die Wörter aller lexUnits eines Synsets zurück.
+
+        :param synset: Synset-ID
+        """
+        i = self.synsets.find(synset)
+        if i < 0:
+            return []
+        return [self.words.string(j) for j in range(self.synsetunits[i], self.synsetunits[i+1])]
+
+    def all_synsets(self) -> Iterator[List[str]]:
+        """
+        Generiert die Wörter aller Synsets.
+        """
+        for i in range(len(self.synsets)):
+            yield [self.words.string(j) for j in range(self.synsetunits[i], self.synsetunits[i+1])]
+
+def open_lexunit_index(path:str, indexdir:str) -> LexUnitIndex:
+    """
+    Öffnet den Index der GermaNet-Wortlisten und baut ihn vorher neu, wenn er fehlt oder sich die Wortlisten seitdem geändert haben.
+
+    :param path: Pfad zum Verzeichnis, in dem die GermaNet-Wortlisten nach Wortarten liegen
+    :param indexdir: Verzeichnis des Index
+    """
+    files = germanet_files(path)
+    try:
+        with open(os.path.join(indexdir, "sources.json")) as f:
+            fresh = json.load(f) == source_signature(files)
+    except (OSError, ValueError):
+        fresh = False
+    if not fresh:
+        build_lexunit_index(files, indexdir)
+    return LexUnitIndex(indexdir)
+
+def iter_relations(fullpath:str) -> Iterator[Tuple[str, str, str, str]]:
+    """
+    Liest die Relationsdatei mit iterparse und generiert je Relation ein Tupel aus Elementname (lex_rel oder con_rel), Name der Relation, from und to. Gelesene Elemente werden sofort verworfen.
+
+    :param fullpath: Pfad zur Relationsdatei
+    """
+    context = ET.iterparse(fullpath, events=("start", "end"))
+    _, root = next(context)
+    for event, elem in context:
+        if event == "end" and elem.tag in ("lex_rel", "con_rel"):
+            yield elem.tag, elem.get("name", ""), elem.get("from"), elem.get("to")
+            root.clear()
+
+class PairWriter:
+    """
+    Schreibt die Wortpaare einer Relation ohne Doppelungen als csv-Dateien: die lange Liste enthält jedes Wortpaar in beiden Richtungen, die kurze jedes ungeordnete Wortpaar einmal in der Richtung seines ersten Vorkommens. Wortpaare aus zwei gleichen Wörtern werden ausgelassen. Die schon geschriebenen Wortpaare merkt sich ein kompaktes PairSet aus MakeSynonymFile.
+
+    :param long: zum Schreiben geöffnete Datei der langen Liste
+    :param short: zum Schreiben geöffnete Datei der kurzen Liste
+    """
+    def __init__(self, long:Any, short:Any):
+        self.long = csv.writer(long)
+        self.short = csv.writer(short)
+        self.seen = PairSet()
+
+    def add(self, a:str, b:str) -> None:
+        """
+        Schreibt ein Wortpaar, falls es noch nicht geschrieben wurde.
+
+        :param a: erstes Wort
+        :param b: zweites Wort
+        """
+        if a == b or not self.seen.add(a, b):
+            return
+        self.long.writerow([a, b])
+        self.long.writerow([b, a])
+        self.short.writerow([a, b])
+
+def extract_relations(fullpath:str, index:LexUnitIndex, writers:Dict[str, PairWriter]) -> None:
+    """
+    Schreibt in einem Durchgang durch die Relationsdatei die Wortpaare aller gewünschten Relationen. Eine Relation passt wie in find_relation(), wenn ihr Name im Namen der GermaNet-Relation enthalten ist; Relationen zwischen Synsets (con_rel) ergeben die Wortpaare aller Wörter beider Synsets. 'synonym' steht für die Wörter je eines Synsets, die in der Relationsdatei nicht vorkommen.
+
+    :param fullpath: Pfad zur Relationsdatei
+    :param index: LexUnitIndex der GermaNet-Wortlisten
+    :param writers: PairWriter je Name einer Relation
+    """
+    if "synonym" in writers:
+        for words in index.all_synsets():
+            for i, a in enumerate(words):
+                for b in words[i+1:]:
+                    writers["synonym"].add(a, b)
+    wanted = [r for r in writers if r != "synonym"]
+    if not wanted:
+        return
+    for tag, name, source, target in iter_relations(fullpath):
+        matches = [r for r in wanted if r in name]
+        if not matches:
+            continue
+        if tag == "lex_rel":
+            a, b = index.word(source), index.word(target)
+            pairs = [(a, b)] if a is not None and b is not None else []
+        else:
+            pairs = [(a, b) for a in index.synset_words(source) for b in index.synset_words(target)]
+        for r in matches:
+            for a, b in pairs:
+                writers[r].add(a, b)
+
+
 @click.command()
 @click.option('--fullpath', default='GN_V140/GN_V140_XML/gn_relations.xml', help='Full path to relations file of GermaNet. Defaults to "GN_V140/GN_V140_XML/gn_relations.xml".')
 @click.option('--path', default='GN_V140/GN_V140_XML/', help='Full path to directory containing GermaNet xml files. Defaults to "GN_V140/GN_V140_XML/".')
-@click.option('--relation', default='antonym', help='Relation to be extracted as named by GermaNet. Defaults to "antonym".')
-@click.option('--filenamelong', default='antonyms_long.csv', help='Full path to or filename of csv file containing long resulting list. Defaults to "antonyms_long.csv".')
-@click.option('--filenameshort', default='antonyms_short.csv', help='Full path to or filename of csv file containing short resulting list. Defaults to "antonyms_short.csv".')
-def main(fullpath, path, relation, filenamelong, filenameshort):
+@click.option('--relation', '-r', 'relations', default=['antonym'], multiple=True, help='Relation to be extracted as named by GermaNet, e.g. "antonym", "hypernym" or "pertains_to", or "synonym" for words sharing a synset; can be given several times to extract all of them in one pass. Defaults to "antonym".')
+@click.option('--filenamelong', default='{relation}s_long.csv', help='Full path to or filename of csv file containing long resulting list, "{relation}" is replaced by the relation and has to be included when several relations are given. Defaults to "{relation}s_long.csv", i.e. "antonyms_long.csv".')
+@click.option('--filenameshort', default='{relation}s_short.csv', help='Full path to or filename of csv file containing short resulting list, "{relation}" is replaced by the relation and has to be included when several relations are given. Defaults to "{relation}s_short.csv", i.e. "antonyms_short.csv".')
+@click.option('--indexdir', default='GermaNetIndex.lex', help='Name of directory caching the lexUnit index of the GermaNet xml files; it is rebuilt when the files change. Defaults to "GermaNetIndex.lex".')
+@click.option('--extractor', default='stream', type=click.Choice(['stream', 'legacy']), help='How to extract: "stream" parses the xml files incrementally and writes deduplicated lists, "legacy" reads all files line by line and handles only the first relation. Defaults to "stream".')
+@profile_options
+def main(fullpath, path, relations, filenamelong, filenameshort, indexdir, extractor):
     """
-    Run script to generate long (containing relation in both directions) and short (containing relation in one direction) lists of antonyms from GermaNet files. Save results as csv files.
+    Run script to generate long (containing relation in both directions) and short (containing relation in one direction) lists of antonyms or other relations from GermaNet files. Save results as csv files.
     """
-    
+    if extractor == 'stream':
+        relations = list(dict.fromkeys(relations))
+        names = [name.format(relation=relation) for relation in relations for name in (filenamelong, filenameshort)]
+        if len(set(names)) < len(names):                        #Mehrere Relationen in dieselbe Datei würden sich gegenseitig überschreiben.
+            raise click.UsageError("--filenamelong und --filenameshort müssen bei mehreren Relationen '{relation}' enthalten und sich unterscheiden.")
+        with PROFILER.stage("index"):
+            index = open_lexunit_index(path, indexdir)          #Öffnet den Index der lexUnit-IDs und baut ihn nur bei Bedarf neu.
+        with PROFILER.stage("extract"), contextlib.ExitStack() as stack:  #Schreibt alle Relationen in einem Durchgang durch die Relationsdatei.
+            writers = {}
+            for relation in relations:
+                long = stack.enter_context(open(filenamelong.format(relation=relation), "w", newline=""))
+                short = stack.enter_context(open(filenameshort.format(relation=relation), "w", newline=""))
+                writers[relation] = PairWriter(long, short)
+            extract_relations(fullpath, index, writers)
+        for relation, writer in writers.items():
+            PROFILER.count("pairs_" + relation, len(writer.seen))
+        return
+
+    relation = relations[0]
     with open(fullpath) as f:                                   #Liest die Relationsdatei der zur Verfügung stehenden GermaNet Version zeilenweise ein.
         l = f.readlines()
 
@@ -138,11 +381,11 @@ def main(fullpath, path, relation, filenamelong, filenameshort):
 
     short = shorten_list(ant)                                   #Erzeugt verkürzte Antonymenliste. (Nur je a zu b.)
 
-    with open(filenamelong, "w", newline="") as f:              #Speichert Antonymenliste für spätere Verwendung als csv-Datei.
+    with open(filenamelong.format(relation=relation), "w", newline="") as f:   #Speichert Antonymenliste für spätere Verwendung als csv-Datei.
         writer = csv.writer(f)
         writer.writerows(ant)
 
-    with open(filenameshort, "w", newline="") as f:             #Speichert verkürzte Antonymenliste als csv-Datei.
+    with open(filenameshort.format(relation=relation), "w", newline="") as f:  #Speichert verkürzte Antonymenliste als csv-Datei.
         writer = csv.writer(f)
         writer.writerows(short)
 
@@ -4,15 +4,44 @@
 # Copyright (C) 2022 franka.beyer@fau.de
 
 import regex as re
+import io
+import os
 import json
-from typing import Dict, List
+import locale
+import multiprocessing
+from typing import Dict, List, Tuple, Iterable, Iterator, Callable, TextIO
 import click
+from Lexicon import build_lexicon
+from Profiling import PROFILER, profile_options
+
+REPLACEMENTS = {'"a' : "ä", '"A' : "Ä", '"u' : "ü", '"U' : "Ü", '"o' : "ö", '"O' : "Ö", '$' : "ß", '#e' : "é"}   #Dictionary mit den nötigen Ersetztungen von Buchstaben.
+INVALID = re.compile(r"[^a-zA-ZäÄöÖüÜßé\\\n]")
+
+def compile_replacements(d:Dict[str, str]) -> Callable[[str], str]:
+    """
+    Erzeugt aus einem Dictionary von Ersetzungen einmalig einen regulären Ausdruck und gibt eine Funktion zurück, die alle Ersetzungen in einem String vornimmt.
+
+    :param d: Dictionary, das die nötigen Buchstabenerseztungen enthält
+    """
+    regex = re.compile("(%s)" % "|".join(map(re.escape, d.keys())))
+    return lambda text: regex.sub(lambda mo: d[mo.group()], text)
 
 def multiple_replace(d:Dict[str, str], text:str) -> str: #von https://stackoverflow.com/questions/15175142/how-can-i-do-multiple-substitutions-using-regex
-  # Create a regular expression  from the dictionary keys
-  regex = re.compile("(%s)" % "|".join(map(re.escape, d.keys())))
-  # For each match, look-up corresponding value in dictionary
-  return regex.sub(lambda mo: d[mo.string[mo.start():mo.end()]], text)
+  # Create a regular expression  from the dictionary keys and look up the replacement of each match in the dictionary
+  return compile_replacements(d)(text)
+
+def clean_lines(lines:Iterable[str], d:Dict[str, str]=REPLACEMENTS) -> Iterator[str]:
+    """
+    Generiert aus Strings, z.B. den Zeilen einer Datei, die Strings ohne newline-character mit den Buchstabenersetzungen aus d, die nur erlaubte Buchstaben enthalten und nicht leer sind.
+
+    :param lines: Strings, die als Ausgangspunkt dienen
+    :param d: Dictionary, das die nötigen Buchstabenerseztungen enthält
+    """
+    replace = compile_replacements(d)
+    for x in lines:
+        x = replace(x[:-1] if x.endswith("\n") else x)
+        if x and INVALID.search(x) is None:
+            yield x
 
 def clean_celex(l:List[str], d:Dict[str, str]) -> List[str]:
     """
@@ -21,10 +50,58 @@ def clean_celex(l:List[str], d:Dict[str, str]) -> List[str]:
     :param liste: Liste von Strings, die als Ausgangspunkt dient
     :param d: Dictionary, das die nötigen Buchstabenerseztungen enthält
     """
-    ni = [x[:-1] for x in l]                                                  #remove \n
-    lf = [multiple_replace(d, x) for x in ni]                                 #make replacements
-    res = [x for x in lf if not bool(re.search(r"[^a-zA-ZäÄöÖüÜßé\\\n]", x))]
-    return list(filter(None, res))                                            #return list without empty strings
+    return list(clean_lines(l, d))
+
+def chunk_ranges(path:str, nchunks:int) -> List[Tuple[int, int]]:
+    """
+    Teilt eine Datei in höchstens nchunks Byte-Bereiche, die jeweils am Anfang einer Zeile beginnen. Gibt Liste von Tupeln aus Anfang und Ende zurück.
+
+    :param path: Pfad zu bzw. Name der Datei
+    :param nchunks: gewünschte Anzahl der Bereiche
+    """
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, "rb") as f:
+        for i in range(1, nchunks):
+            f.seek(max(size * i // nchunks, bounds[-1]))
+            f.readline()                                      #bis zum nächsten Zeilenanfang
+            if f.tell() >= size:
+                break
+            if f.tell() > bounds[-1]:
+                bounds.append(f.tell())
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def _clean_chunk(args:Tuple[str, int, int, str, Dict[str, str]]) -> List[str]:
+    """
+    Bereinigt die Zeilen eines Byte-Bereichs einer Datei in einem Prozess des Pools.
+    """
+    path, start, end, encoding, d = args
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return list(clean_lines(io.StringIO(data.decode(encoding), newline=None), d))
+
+def read_celex(path:str, workers:int=1, d:Dict[str, str]=REPLACEMENTS) -> Iterator[str]:
+    """
+    Liest die CELEX-Datei zeilenweise und generiert die bereinigten Strings der Form <Wortform>\\<Lemma> wie clean_celex(), ohne die Datei ganz in den Speicher zu laden.
+    Mit workers > 1 wird die Datei in Byte-Bereiche an Zeilengrenzen geteilt, die ein Prozesspool bereinigt; die Ergebnisse werden in der ursprünglichen Reihenfolge generiert.
+
+    :param path: Pfad zu bzw. Name der CELEX-Datei
+    :param workers: Anzahl der Prozesse
+    :param d: Dictionary, das die nötigen Buchstabenerseztungen enthält
+    """
+    if workers <= 1:
+        with open(path) as f:
+            yield from clean_lines(f, d)
+        return
+    encoding = locale.getpreferredencoding(False)             #wie open() im Textmodus
+    chunks = [(path, start, end, encoding, d) for start, end in chunk_ranges(path, workers * 8)]
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    with context.Pool(workers) as pool:
+        for res in pool.imap(_clean_chunk, chunks):
+            yield from res
 
 def create_lemform_dict(liste:List[str]) -> Dict[str, str]:
     """
@@ -32,18 +109,7 @@ def create_lemform_dict(liste:List[str]) -> Dict[str, str]:
 
     :param liste: Liste von Strings der Form <Wortform>//<Lemma>
     """
-    di = {}
-    for e in liste:
-        try:
-            f,l = e.split("\\")
-        except ValueError:
-            continue
-        if l not in di.keys():
-            di[l] = []
-            di[l].append(f)
-        else:
-            di[l].append(f)
-    return di
+    return create_dicts(liste)[0]
 
 def create_formlem_dict(di:Dict[str, str]) -> Dict[str, str]:
     """
@@ -54,45 +120,108 @@ def create_formlem_dict(di:Dict[str, str]) -> Dict[str, str]:
     f = {}
     for e in di.keys():
         for x in di[e]:
-            if x not in f.keys():
-                f[x]=e
-            else:
-                f[x]=e
+            f[x]=e
     return f
 
+def create_dicts(liste:Iterable[str]) -> Tuple[Dict[str, List[str]], Dict[str, str]]:
+    """
+    Erzeugt in einem Durchgang das Lemma-Wortformen-Dictionary wie create_lemform_dict() und das Wortform-Lemma-Dictionary wie create_formlem_dict(). Eine Wortform mehrerer Lemmata wird wie dort dem Lemma zugeordnet, das als letztes zum ersten Mal vorkommt.
+
+    :param liste: Strings der Form <Wortform>\\<Lemma>, z.B. von read_celex()
+    """
+    lfd = {}
+    fld = {}
+    rank = {}                                                 #Position des ersten Vorkommens je Lemma
+    for e in liste:
+        try:
+            f,l = e.split("\\")
+        except ValueError:
+            continue
+        forms = lfd.get(l)
+        if forms is None:
+            rank[l] = len(lfd)
+            forms = lfd[l] = []
+        forms.append(f)
+        old = fld.get(f)
+        if old is None or rank[l] > rank[old]:
+            fld[f] = l
+    return lfd, fld
+
+def tee_json_list(liste:Iterable[str], f:TextIO) -> Iterator[str]:
+    """
+    Schreibt die Strings beim Durchlaufen als JSON-Liste wie json.dump() in eine Datei und generiert sie unverändert weiter.
+
+    :param liste: Strings, z.B. von read_celex()
+    :param f: zum Schreiben geöffnete Datei
+    """
+    f.write("[")
+    sep = ""
+    for x in liste:
+        f.write(sep + json.dumps(x))
+        sep = ", "
+        yield x
+    f.write("]")
+
+def dump_formlemma(lfd:Dict[str, List[str]], fld:Dict[str, str], f:TextIO) -> None:
+    """
+    Schreibt das Wortform-Lemma-Dictionary Eintrag für Eintrag als JSON in eine Datei, und zwar in der Reihenfolge, in der create_formlem_dict() die Wortformen einträgt, sodass die Datei dieselbe ist.
+
+    :param lfd: Lemma-Wortformen-Dictionary
+    :param fld: Wortform-Lemma-Dictionary aus create_dicts()
+    :param f: zum Schreiben geöffnete Datei
+    """
+    f.write("{")
+    sep = ""
+    seen = set()
+    for forms in lfd.values():
+        for x in forms:
+            if x not in seen:
+                seen.add(x)
+                f.write(sep + json.dumps(x) + ": " + json.dumps(fld[x]))
+                sep = ", "
+    f.write("}")
+
 @click.command()
 @click.option('--fullpath', default='CWLbk/CELEX.Wordformen+Lemmata.bk.txt', help='Full path to or filename of txt file containing CELEX-wordforms and lemmata. Defaults to "CWLbk/CELEX.Wordformen+Lemmata.bk.txt".')
 @click.option('--celexcleanfile', default='CELEXclean.json', help='Full path to or filename of txt file to contain cleaned CELEX-wordforms and lemmata. Defaults to "CELEXclean.json".')
+@click.option('--saveclean/--no-saveclean', default=True, help='Whether or not to save the cleaned CELEX-data to --celexcleanfile while reading. Defaults to doing so.')
 @click.option('--usecleanedcelex/--no-cleaned-celex', default=False, help='Whether or not to load cleaned CELEX-data from file. Defaults to not doing so.')
 @click.option('--cleanedcelexfile', default='CELEXclean.json', help='Full path to or name of json file containing cleaned CELEX-data. Defaults to "CELEXclean.json".')
 @click.option('--lemmaformfile', default='LemmaForm.json', help='Full path to or name of json file to contain lemmata to wordforms dictionary. Defaults to "LemmaForm.json".')
 @click.option('--formlemmafile', default='FormLemma.json', help='Full path to or name of json file to contain wordforms to lemmata dictionary. Defaults to "FormLemma.json".')
-def main(fullpath, celexcleanfile, usecleanedcelex, cleanedcelexfile, lemmaformfile, formlemmafile):
+@click.option('--workers', default=1, help='Number of processes cleaning parts of the CELEX file. Defaults to 1.')
+@click.option('--lexicondir', default='Lexicon.lex', help='Name of directory to contain the compact memory-mapped lexicon, which PreprocessingCQP.py and MakeVectors.py accept instead of the json files. Defaults to "Lexicon.lex".')
+@profile_options
+def main(fullpath, celexcleanfile, saveclean, usecleanedcelex, cleanedcelexfile, lemmaformfile, formlemmafile, workers, lexicondir):
     """
     Run script to generate LemmaForm and FormLemma dictionarys for later use from CELEX files.
     """
-    if usecleanedcelex:
-        with open(cleanedcelexfile) as f:     #Liest bereinigte CELEX-Wortformen-Lemmata-Datei ein. Nur sinnvoll, wenn eine solche Datei schon vorliegt.
-            lf = json.load(f)
-    else:
-        with open(fullpath) as f:             #Liest die CELEX-Datei zeilenweise ein.
-            l = f.readlines()
-        d = {'"a' : "ä", '"A' : "Ä", '"u' : "ü", '"U' : "Ü", '"o' : "ö", '"O' : "Ö", '$' : "ß", '#e' : "é"}   #Dictionary mit den nötigen Ersetztungen von Buchstaben.
-        lf = clean_celex(l, d)                #Bereinigt die CELEX-Datei.
-        with open(celexcleanfile, "w") as f:  #Speichert bereinigte CELEX-Wortformen-Lemmata-Datei für spätere Verwendung.
-            json.dump(lf, f)
-
-    lfd = create_lemform_dict(lf)             #Erzeugt Lemma-Wortformen-Dictionary.
+    with PROFILER.stage("clean_and_dicts"):
+        if usecleanedcelex:
+            with open(cleanedcelexfile) as f: #Liest bereinigte CELEX-Wortformen-Lemmata-Datei ein. Nur sinnvoll, wenn eine solche Datei schon vorliegt.
+                lf = json.load(f)
+            lfd, fld = create_dicts(lf)       #Erzeugt Lemma-Wortformen- und Wortform-Lemma-Dictionary.
+        else:
+            lf = read_celex(fullpath, workers)  #Liest und bereinigt die CELEX-Datei zeilenweise.
+            if saveclean:
+                with open(celexcleanfile, "w") as f:  #Speichert bereinigte CELEX-Wortformen-Lemmata-Datei nebenbei für spätere Verwendung.
+                    lfd, fld = create_dicts(tee_json_list(lf, f))
+            else:
+                lfd, fld = create_dicts(lf)
+    PROFILER.count("lemmata", len(lfd))
+    PROFILER.count("wordforms", len(fld))
 
-    fld = create_formlem_dict(lfd)            #Erzeugt Wortform-Lemma-Dictionary.
+    with PROFILER.stage("write_dicts"):
+        with open(lemmaformfile, "w") as f:   #save dict in file
+            json.dump(lfd, f)
 
-    with open(lemmaformfile, "w") as f:       #save dict in file
-        json.dump(lfd, f)
+        with open(formlemmafile, "w") as f:   #save dict in file
+            dump_formlemma(lfd, fld, f)
 
-    with open(formlemmafile, "w") as f:       #save dict in file
-        json.dump(fld, f)
+    with PROFILER.stage("build_lexicon"):
+        build_lexicon(lfd, fld, lexicondir)    #Speichert beide Dictionaries als kompaktes Lexikon.
 
 
 if __name__ == "__main__":
-    
+
     main()
@@ -4,9 +4,13 @@
 # Copyright (C) 2022 franka.beyer@fau.de
 
 import csv
+import json
 import random
-from typing import List
+from typing import List, Dict, Any
 import click
+import numpy
+from Lexicon import Lexicon, is_lexicon
+from Profiling import PROFILER, profile_options
 
 def read_csv_file(file:str) -> List[List[str]]:
     """
@@ -43,19 +47,112 @@ def find_new_combinations(filename1:str, filename2:str, seed:int, n:int) -> List
     random.seed(seed)
     return random.sample(nonyms, n)
 
+def sample_nonyms(pairs:List[List[str]], n:int, seed:int, distribution:str='frequency', distinct:bool=True, formlemma:Dict[str, str]=None, batchfactor:float=1.5, maxrounds:int=50) -> List[List[str]]:
+    """
+    Zieht genau n verschiedene Wortpaare, die in pairs in keiner Richtung vorkommen. Die Wörter eines Wortpaares werden aus den ersten bzw. zweiten Wörtern von pairs gezogen, je Runde als Stapel mit numpy; ein Wortpaar gilt unabhängig von der Richtung als bekannt bzw. schon gezogen. Bei gleichem seed ist das Ergebnis gleich.
+    Wirft ValueError, wenn es weniger als n mögliche Wortpaare gibt oder in maxrounds Runden nacheinander kein neues Wortpaar gefunden wird.
+
+    :param pairs: Liste von Wortpaaren, je als Liste
+    :param n: Anzahl der zu ziehenden Wortpaare
+    :param seed: seed für numpy.random.default_rng(), um Reproduzierbarkeit zu gewährleisten
+    :param distribution: 'frequency', um jedes Wort mit seiner Häufigkeit in pairs zu ziehen, sodass die Wortpaare deren Verteilung der Wörter folgen, oder 'uniform', um alle Wörter gleich häufig zu ziehen
+    :param distinct: ob Wortpaare aus zwei gleichen Wörtern bzw., mit formlemma, aus zwei Wortformen desselben Lemmas ausgeschlossen werden
+    :param formlemma: Wortform-Lemma-Dictionary oder Lexicon.formlemma für distinct
+    :param batchfactor: Anzahl der je Runde gezogenen Kandidaten im Verhältnis zur Anzahl der noch fehlenden Wortpaare
+    :param maxrounds: Anzahl der Runden ohne neues Wortpaar, nach der abgebrochen wird
+    """
+    pairs = [p[:2] for p in pairs if len(p) >= 2]
+    words = list(dict.fromkeys(w for p in pairs for w in p))
+    ids = {w: i for i, w in enumerate(words)}
+    size = len(words)
+    first = numpy.array([ids[p[0]] for p in pairs], dtype=numpy.int64)
+    second = numpy.array([ids[p[1]] for p in pairs], dtype=numpy.int64)
+    known = numpy.unique(numpy.minimum(first, second) * size + numpy.maximum(first, second))  #beide Richtungen
+    pools = []
+    for column in (first, second):
+        counts = numpy.bincount(column, minlength=size)
+        pool = numpy.flatnonzero(counts)
+        weights = counts[pool] if distribution == 'frequency' else numpy.ones(len(pool))
+        pools.append((pool, weights / weights.sum()))
+    lemmas = None
+    if distinct and formlemma is not None:
+        lemmaids = {}
+        lemmas = numpy.array([lemmaids.setdefault(formlemma.get(w, w), len(lemmaids)) for w in words], dtype=numpy.int64)
+    overlap = len(numpy.intersect1d(pools[0][0], pools[1][0]))
+    possible = len(pools[0][0]) * len(pools[1][0]) - overlap * (overlap - 1) // 2 - (overlap if distinct else 0) - len(known)  #obere Schranke der ungeordneten Wortpaare
+    if possible < n:
+        raise ValueError("Höchstens " + str(max(possible, 0)) + " neue Wortpaare möglich, " + str(n) + " verlangt.")
+    rng = numpy.random.default_rng(seed)
+    chosen = numpy.zeros(0, dtype=numpy.int64)
+    result = []
+    idle = 0
+    while len(result) < n:
+        m = max(64, int((n - len(result)) * batchfactor))
+        a = rng.choice(pools[0][0], size=m, p=pools[0][1])
+        b = rng.choice(pools[1][0], size=m, p=pools[1][1])
+        keys = numpy.minimum(a, b) * size + numpy.maximum(a, b)
+        ok = numpy.ones(m, dtype=bool)
+        if distinct:
+            ok &= a != b
+            if lemmas is not None:
+                ok &= lemmas[a] != lemmas[b]
+        if len(known):
+            ok &= known[numpy.minimum(numpy.searchsorted(known, keys), len(known) - 1)] != keys
+        ok &= ~numpy.isin(keys, chosen)
+        idx = numpy.flatnonzero(ok)
+        _, first_seen = numpy.unique(keys[idx], return_index=True)  #je Wortpaar nur das erste Vorkommen des Stapels
+        idx = idx[numpy.sort(first_seen)][:n - len(result)]
+        if not len(idx):
+            idle += 1
+            if idle >= maxrounds:
+                raise ValueError("Nach " + str(len(result)) + " Wortpaaren in " + str(maxrounds) + " Runden kein neues Wortpaar gefunden, " + str(n) + " verlangt.")
+            continue
+        idle = 0
+        chosen = numpy.union1d(chosen, keys[idx])
+        result.extend([words[i], words[j]] for i, j in zip(a[idx].tolist(), b[idx].tolist()))
+    return result
+
+def read_formlemma(name:str) -> Any:
+    """
+    Öffnet ein Wortform-Lemma-Dictionary als JSON-Datei oder als Lexicon.
+
+    :param name: Pfad zu bzw. Name der JSON-Datei oder des Lexikons
+    """
+    if is_lexicon(name):
+        return Lexicon(name).formlemma
+    with open(name) as f:
+        return json.load(f)
+
 @click.command()
 @click.option('--file1', default='antonyms_long.csv', help='Full path to or filename of csv file containing list of wordpairs. Defaults to "antonyms_long.csv".')
 @click.option('--file2', default='synonyms.csv', help='Full path to or filename of csv file containing list of wordpairs. Defaults to "synonyms.csv".')
 @click.option('--seed', default=3, help='Seed to be used by random module. Defaults to 3.')
 @click.option('--n', default=40000, help='Lenght of resulting list of wordpairs. Defaults to 40000.')
 @click.option('--resultname', default='nonyms.csv', help='Full path to or filename of csv file to contain resulting list. Defaults to "nonyms.csv".')
-def main(file1, file2, seed, n, resultname):
+@click.option('--sampler', default='sets', type=click.Choice(['sets', 'legacy']), help='How to sample: "sets" draws batches of candidates with numpy and rejects known pairs in either direction, returning exactly n unique pairs, "legacy" uses the original list-based sampling. Defaults to "sets".')
+@click.option('--distribution', default='frequency', type=click.Choice(['frequency', 'uniform']), help='How to draw words with --sampler=sets: "frequency" follows the word frequencies of the input pairs, "uniform" draws every word equally often. Defaults to "frequency".')
+@click.option('--distinct/--allow-same', default=True, help='Whether to exclude pairs of the same word, or with --formlemmaname of forms of the same lemma, with --sampler=sets. Defaults to exclude them.')
+@click.option('--formlemmaname', default=None, help='Name of file containing wordform-lemma-dictionary or of lexicon directory written by MakeCELEXDictFiles.py, used to exclude pairs sharing a lemma. Defaults to comparing the words themselves.')
+@profile_options
+def main(file1, file2, seed, n, resultname, sampler, distribution, distinct, formlemmaname):
     """
     Run script to generate list of wordpairs from two csv files containing lists of wordpairs that occur in neither. Save result as csv file.
     """
-    nonyms = find_new_combinations(file1, file2, seed, n)  #Produziert aus zwei Dateien n Wortpaare, die in keiner vorkommen.
+    if sampler == 'legacy':
+        with PROFILER.stage("sample"):
+            nonyms = find_new_combinations(file1, file2, seed, n)  #Produziert aus zwei Dateien n Wortpaare, die in keiner vorkommen.
+    else:
+        with PROFILER.stage("read"):
+            formlemma = read_formlemma(formlemmaname) if formlemmaname else None
+            pairs = read_csv_file(file1) + read_csv_file(file2)
+        try:                                               #Zieht genau n neue Wortpaare oder bricht mit Meldung ab.
+            with PROFILER.stage("sample"):
+                nonyms = sample_nonyms(pairs, n, seed, distribution, distinct, formlemma)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    PROFILER.count("pairs", len(nonyms))
 
-    with open(resultname, "w", newline="") as f:           #Speichert die neue Liste für spätere Verwendung als csv-Datei.
+    with PROFILER.stage("write"), open(resultname, "w", newline="") as f:  #Speichert die neue Liste für spätere Verwendung als csv-Datei.
         writer = csv.writer(f)
         writer.writerows(nonyms)
 
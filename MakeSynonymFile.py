@@ -5,8 +5,30 @@
 
 import regex as re
 import csv
-from typing import List
+import random
+import hashlib
+import itertools
+from typing import List, Iterable, Iterator
 import click
+import numpy
+from Profiling import PROFILER, profile_options
+
+BRACKETS = re.compile(r'\([^\)]*\)')
+HALFSTRING = re.compile(r"\.{3}")
+
+def iter_synsets(file:str, skip:int=18) -> Iterator[List[str]]:
+    """
+    Liest den OpenThesaurus zeilenweise und generiert je Zeile die bereinigte Liste der Synonyme eines Synsets wie read_in_thesaurus(), ohne die Datei ganz in den Speicher zu laden.
+
+    :param file: Name der (bzw. Pfad zur) einzulesenden Thesaurusdatei
+    :param skip: Anzahl der Zeilen mit Lizenz und Vorspann am Anfang der Datei
+    """
+    with open(file) as f:
+        for x in itertools.islice(f, skip, None):
+            x = BRACKETS.sub('', x[:-1] if x.endswith("\n") else x)  #remove \n and everything in round brackets
+            if HALFSTRING.search(x):                   #remove halfstring
+                continue
+            yield [w.strip() for w in " ".join(x.split()).split(';')]
 
 def read_in_thesaurus(file:str, n=2) -> List[List[str]]:
     """
@@ -15,37 +37,106 @@ def read_in_thesaurus(file:str, n=2) -> List[List[str]]:
     :param file: Name der (bzw. Pfad zur) einzulesenden Thesaurusdatei
     :param n: Voreinstellung 2; gibt an, wie viele Synonyme je Zeile verwendet werden sollen
     """
-    with open(file) as f:
-        l = f.readlines()
-    nl = l[18:]                      #remove license and preamble
-    ni = [x[:-1] for x in nl]        #remove \n
-    ni2 = [re.sub(r'\([^\)]*\)', '', x) for x in ni] #remove everything in round brackets
-    ni3 = [" ".join(x.split()) for x in ni2 if not bool(re.search("\.{3}", x))] #remove whitespaces and halfstring
-    ls = [x.split(';') for x in ni3] #create list of lists
-    hl = []
-    for e in ls:
-        hl2 = []
-        for x in e:
-            hl2.append("".join(x.rstrip().lstrip())) #remove unnecessary whitespaces
-        hl.append(hl2)
-    fl = []
-    for e in hl:
-        fl.append(e[:n])             #take only first n synonyms, default 2
-    return fl
+    return [e[:n] for e in iter_synsets(file)]    #take only first n synonyms, default 2
+
+class PairSet:
+    """
+    Kompakte Menge ungeordneter Wortpaare: offene Hashtabelle (lineares Sondieren) aus 64-Bit-Hashes in einem NumPy-Array, also 8 Bytes je Platz statt eines Tupels aus zwei Strings. Zwei verschiedene Wortpaare mit gleichem Hash gelten als gleich; bei einer Million Wortpaaren ist das etwa einmal in zehn Millionen Läufen der Fall.
+
+    :param capacity: anfängliche Größe der Tabelle, eine Zweierpotenz
+    """
+    def __init__(self, capacity:int=1 << 16):
+        self.table = numpy.zeros(capacity, dtype=numpy.uint64)  #0 für freie Plätze
+        self.slots = memoryview(self.table)
+        self.mask = capacity - 1
+        self.n = 0
+
+    def __len__(self) -> int:
+        return self.n
+
+    def add(self, a:str, b:str) -> bool:
+        """
+        Fügt das Wortpaar unabhängig von der Reihenfolge ein. Gibt zurück, ob es neu war.
+
+        :param a: erstes Wort
+        :param b: zweites Wort
+        """
+        if a > b:
+            a, b = b, a
+        h = int.from_bytes(hashlib.blake2b((a + "\0" + b).encode("utf-8"), digest_size=8).digest(), "little") or 1
+        slots = self.slots
+        i = h & self.mask
+        while slots[i]:
+            if slots[i] == h:
+                return False
+            i = (i + 1) & self.mask
+        slots[i] = h
+        self.n += 1
+        if 2 * self.n > len(slots):
+            self._grow()
+        return True
+
+    def _grow(self, chunk:int=1 << 18) -> None:
+        old = self.table
+        self.table = numpy.zeros(2 * len(old), dtype=numpy.uint64)
+        self.slots = memoryview(self.table)
+        self.mask = len(self.table) - 1
+        for start in range(0, len(old), chunk):         #abschnittsweise, damit neben beiden Tabellen nur kleine Arrays entstehen
+            hashes = old[start:start + chunk]
+            hashes = hashes[hashes != 0]
+            pos = (hashes & numpy.uint64(self.mask)).astype(numpy.int64)
+            while len(hashes):                           #je Runde erhält jeder freie Platz einen der Hashes, die ihn gerade sondieren
+                cand = numpy.flatnonzero(self.table[pos] == 0)
+                win = cand[numpy.unique(pos[cand], return_index=True)[1]]
+                self.table[pos[win]] = hashes[win]
+                rest = numpy.ones(len(hashes), dtype=bool)
+                rest[win] = False
+                hashes = hashes[rest]
+                pos = (pos[rest] + 1) & self.mask
+
+def iter_pairs(synsets:Iterable[List[str]], maxpairs:int=0, seed:int=3, seen:PairSet=None) -> Iterator[List[str]]:
+    """
+    Generiert alle ungeordneten Wortpaare innerhalb jedes Synsets, je in der Reihenfolge der Synonyme im Thesaurus. Ein Wortpaar, das schon in einem früheren Synset vorkam, wird ausgelassen, ebenso leere Einträge und Wortpaare aus zwei gleichen Wörtern.
+
+    :param synsets: Listen von Synonymen, z.B. von iter_synsets()
+    :param maxpairs: höchstens so viele Wortpaare je Synset, zufällig ausgewählt; 0 für alle
+    :param seed: seed, der für random gesetzt wird, um Reproduzierbarkeit der Auswahl zu gewährleisten
+    :param seen: PairSet der schon geschriebenen Wortpaare
+    """
+    rng = random.Random(seed)
+    seen = PairSet() if seen is None else seen
+    for words in synsets:
+        words = list(dict.fromkeys(w for w in words if w))
+        pairs = itertools.combinations(words, 2)
+        if maxpairs and len(words) * (len(words) - 1) // 2 > maxpairs:
+            pairs = sorted(rng.sample(list(pairs), maxpairs), key=lambda p: (words.index(p[0]), words.index(p[1])))
+        for a, b in pairs:
+            if seen.add(a, b):
+                yield [a, b]
 
 @click.command()
 @click.option('--fullpath', default='OpenThesaurus-Textversion/openthesaurus.txt', help='Full path to thesaurus file as txt of OpenThesaurus. Defaults to "OpenThesaurus-Textversion/openthesaurus.txt".')
 @click.option('--filename', default='synonyms.csv', help='Full path to or filename of csv file to contain resulting list. Defaults to "synonyms.csv".')
-@click.option('--n', default=2, help='How many synonyms each to include in list, defaults to two.')
-def main(fullpath, filename, n):
+@click.option('--n', default=2, help='How many synonyms each to include in list with --pairs=first, defaults to two.')
+@click.option('--pairs', default='first', type=click.Choice(['first', 'all', 'sample']), help='Which synonyms to write: "first" the first --n synonyms of each synset, "all" every unordered pair within each synset, "sample" at most --maxpairs randomly chosen pairs per synset; "all" and "sample" skip pairs already written. Defaults to "first".')
+@click.option('--maxpairs', default=10, help='Maximal number of pairs per synset with --pairs=sample. Defaults to 10.')
+@click.option('--seed', default=3, help='Seed to be used by random module with --pairs=sample. Defaults to 3.')
+@profile_options
+def main(fullpath, filename, n, pairs, maxpairs, seed):
     """
-    Run script to generate list of n, default=2, synonyms each from OpenThesaurus. Save result as csv file.
+    Run script to generate list of n, default=2, synonyms each, or of synonym pairs, from OpenThesaurus. Save result as csv file.
     """
-    lines = read_in_thesaurus(fullpath, n)             #Liest den OpenThesaurus ein und generiert Synonymenliste.
+    synsets = iter_synsets(fullpath)                   #Liest den OpenThesaurus zeilenweise ein.
+    seen = PairSet()
+    if pairs == 'first':
+        lines = (e[:n] for e in synsets)               #Nur die ersten n Synonyme je Synset.
+    else:
+        lines = iter_pairs(synsets, maxpairs if pairs == 'sample' else 0, seed, seen)  #Alle bzw. eine Auswahl der Wortpaare je Synset ohne Doppelungen.
 
-    with open(filename, "w", newline="") as f:         #write 43463 synonym pairs to file, Speichert Synonymenliste für spätere Verwendung.
+    with PROFILER.stage("extract"), open(filename, "w", newline="") as f:  #write 43463 synonym pairs to file, Speichert Synonymenliste für spätere Verwendung.
         writer = csv.writer(f)
         writer.writerows(lines)
+    PROFILER.count("pairs", len(seen))
 
 if __name__ == "__main__":
 
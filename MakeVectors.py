@@ -3,15 +3,28 @@
 #
 # Copyright (C) 2022 franka.beyer@fau.de
 
+import io
+import os
 import json
+import gzip
 import pickle
 import regex as re
 from collections import Counter
 import csv
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Iterator
 import click
 import numpy
-import math
+import multiprocessing
+from FeatureMatrix import FeatureMatrix, normalize_rows
+from PatternCounting import make_counter
+from PatternEncoding import PatternEncoder
+from PatternMining import PatternMiner
+from PatternCache import PatternCache, file_hash
+from ResultStore import ResultStore
+from Lexicon import Lexicon, is_lexicon
+from TokenEncoding import TokenTable, EncodedLines
+from Profiling import PROFILER, profile_options
+from Sharding import ShardCounter, input_fingerprint, select_shard, shard_path, claim_shard, write_shard, check_shards, read_totals, iter_shard_pairs
 
 def read_resultnames(names:List[str], la:List[str]) -> Tuple[List[str], Dict[str, str]]:
     """
@@ -45,41 +58,90 @@ def read_in_cqp_result(file:str) -> Any:
     except FileNotFoundError:
         print("Keine Ergebnisse für " + file[:-9])
     if l:
-        nonum = [x.split(":")[1] for x in l]              #remove numbers and :
-        nosym = [re.sub(r"[<>\n]", "", x) for x in nonum] #remove brackets and newlines
-        return True,[" ".join(x.split()) for x in nosym]  #remove unnecessary whitespaces in front
+        return True,clean_cqp_lines(l)
     else:
         return None,"Keine Ergebnisse in CQP gefunden."
 
+def clean_cqp_lines(l:List[str]) -> List[str]:
+    """
+    Bereinigt Ergebniszeilen einer CQP-Anfrage: entfernt Positionen, spitze Klammern, Zeilenumbrüche und überflüssige Leerzeichen.
+
+    :param l: Ergebniszeilen im Format von 'cat' bei CQP
+    """
+    nonum = [x.split(":")[1] for x in l]              #remove numbers and :
+    nosym = [re.sub(r"[<>\n]", "", x) for x in nonum] #remove brackets and newlines
+    return [" ".join(x.split()) for x in nosym]       #remove unnecessary whitespaces in front
+
 
-def make_patterndict(resultnames:List[str]) -> Dict[str, List[str]]:
+def make_patterndict(resultnames:List[str], store:ResultStore=None) -> Dict[str, List[str]]:
     """
     Nimmt Liste von Strings bzw. Dateien, die CQP-Ergebnisse enthalten, entgegen. Lässt diese einlesen und produziert ein Wortpaar-CQP-Ergebnisse-Dictionary.
 
     :param resultnames: Liste von Strings bzw. Dateien, die CQP-Ergebnisse enthalten
+    :param store: ResultStore, aus dem die Ergebnisse statt aus den Dateien gelesen werden
     """
     patterndict = {}
+    if store is not None:
+        for result, content in store.iter_results(resultnames):
+            patterndict[result[:-10]] = clean_cqp_lines(io.StringIO(content, newline=None).readlines())
+        return patterndict
     for result in resultnames:
         info, res = read_in_cqp_result(result)
         if info:
             patterndict[result[:-10]] = res
     return patterndict
 
+def read_result_contents(resultnames:List[str], store:ResultStore=None) -> Iterator[Tuple[str, bytes]]:
+    """
+    Generiert Tupel aus Namen und Inhalt der CQP-Ergebnisse aller Wortpaare mit Ergebnissen, aus den Ergebnisdateien oder einem ResultStore.
+
+    :param resultnames: Liste von Strings bzw. Dateien, die CQP-Ergebnisse enthalten
+    :param store: ResultStore, aus dem die Ergebnisse statt aus den Dateien gelesen werden
+    """
+    if store is not None:
+        for result, content in store.iter_results(resultnames):
+            yield result, content.encode("utf-8")
+        return
+    for result in resultnames:
+        try:
+            with open(result, "rb") as f:
+                content = f.read()
+        except FileNotFoundError:
+            print("Keine Ergebnisse für " + result[:-9])
+            continue
+        if content:
+            yield result, content
+
+def make_patterndict_cached(resultnames:List[str], cache:PatternCache, store:ResultStore=None) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """
+    Wie make_patterndict(), übernimmt aber für Wortpaare, deren CQP-Ergebnisdatei sich seit dem letzten Lauf nicht geändert hat, den Counter(Patterns) aus dem Cache. Gibt das Wortpaar-CQP-Ergebnisse-Dictionary, dessen Werte entweder Counter oder noch zu verarbeitende Ergebniszeilen sind, und ein Wortpaar-Cacheschlüssel-Dictionary der noch zu verarbeitenden Wortpaare zurück.
+
+    :param resultnames: Liste von Strings bzw. Dateien, die CQP-Ergebnisse enthalten
+    :param cache: PatternCache
+    :param store: ResultStore, aus dem die Ergebnisse statt aus den Dateien gelesen werden
+    """
+    patterndict = {}
+    keys = {}
+    for result, content in read_result_contents(resultnames, store):
+        pair = result[:-10]
+        key = cache.key(pair, content)
+        c = cache.get(key)
+        if c is None:
+            c = clean_cqp_lines(io.StringIO(content.decode("utf-8"), newline=None).readlines())
+            keys[pair] = key
+        patterndict[pair] = c
+    return patterndict, keys
+
 def celex_lemmatize(liste:List[str], dictionary:Dict[str, str]) -> List[str]:
     """
     Nimmt Liste von einzelnen CQP-Ergebnissen (je eine Zeile pro Listenelement) an. Lemmatisiert diese zeilenwiese mit Hilfe eines auf CELEX basierenden Wortform-Lemma-Dictionary und gibt die resultierende Liste zurück.
 
     :param liste: zeilenweise Liste von CQP-Ergebnissen (bzw. je einem Ergebnis)
-    :param dictionary: Wortform-Lemma-Dictionary, hier basierend auf CELEX
+    :param dictionary: Wortform-Lemma-Dictionary, hier basierend auf CELEX, oder Lexicon.formlemma
     """
     hl = []
     for e in liste:
-        hl2 = []
-        for x in e.split():
-            if x in dictionary.keys():
-                x = dictionary[x]
-            hl2.append(x)
-        hl.append(" ".join(hl2))
+        hl.append(" ".join([dictionary.get(x, x) for x in e.split()]))
     return hl
 
 def x_y_out(musterliste:List[str], wordliste:List[str]) -> List[str]:
@@ -158,32 +220,155 @@ def patternize_and_master_list(patterndict:Dict[str, List[str]], formlemma:Dict[
         masterpatternlist.extend(p)
     return patterndict, [x for x in masterpatternlist if x!='']
 
-def choose_patterns(k:int, N:int, patternlist:List[str]) -> List[str]:
+def patternize_pair(pair:str, musterliste:Any, formlemma:Dict[str, str], encoder:PatternEncoder=None, table:TokenTable=None) -> Counter:
+    """
+    Lemmatisiert die CQP-Ergebniszeilen eines Wortpaares, ersetzt das Wortpaar durch X und Y und zählt sämtliche möglichen Patterns. Gibt Counter(Patterns) zurück.
+
+    :param pair: Wortpaar der Form <Wort1>:<Wort2>
+    :param musterliste: zugehörige CQP-Ergebniszeilen oder EncodedLines aus table
+    :param formlemma: Wortform-Lemma-Dictionary
+    :param encoder: PatternEncoder für ganzzahlige Pattern-Schlüssel oder None für Strings
+    :param table: TokenTable, mit der EncodedLines als Token-IDs verarbeitet werden
+    """
+    if isinstance(musterliste, EncodedLines):
+        return table.patternize(pair, musterliste, formlemma, encoder)
+    lines = x_y_out(celex_lemmatize(musterliste, formlemma), pair.split(":"))
+    if encoder:
+        return encoder.patternize(lines)
+    return Counter(patternize(lines))
+
+_worker = {}                                      #Zustand der Prozesse in patternize_and_count(), wird je Prozess einmal gesetzt
+
+def _init_worker(formlemma:Dict[str, str], encoder:PatternEncoder, table:TokenTable) -> None:
+    _worker["formlemma"] = formlemma
+    _worker["encoder"] = encoder
+    _worker["table"] = table
+
+def _patternize_chunk(chunk:List[Tuple[str, List[str]]]) -> Tuple[List[Tuple[str, Counter]], Counter]:
+    formlemma = _worker["formlemma"]
+    encoder = _worker["encoder"]
+    table = _worker["table"]
+    empty = encoder.empty_key if encoder else ''
+    res = []
+    total = Counter()
+    for pair, musterliste in chunk:
+        c = patternize_pair(pair, musterliste, formlemma, encoder, table)
+        res.append((pair, c))
+        total.update(c)
+    total.pop(empty, None)
+    return res, total
+
+def patternize_and_count(patterndict:Dict[str, List[str]], formlemma:Dict[str, str], counter:Any, encoder:PatternEncoder=None, workers:int=1, table:TokenTable=None) -> Dict[str, Any]:
+    """
+    Wie patternize_and_master_list(), zählt die Patterns aber direkt beim Erzeugen in einem Pattern-Zähler aus PatternCounting, statt eine Liste aller Patterns anzulegen. Gibt Wortpaar-Counter(Patterns)-Dictionary zurück.
+    Wird ein PatternEncoder übergeben, werden die Patterns statt über vary() als Bitmasken erzeugt und als ganzzahlige Schlüssel gezählt, die erst mit encoder.decode() wieder zu Strings werden.
+    Bereits als Counter vorliegende Werte, z.B. aus einem PatternCache, werden übernommen und nur mitgezählt. Als EncodedLines vorliegende Werte werden mit table und encoder auf Token-IDs verarbeitet.
+    Mit workers > 1 werden die Wortpaare in Abschnitten auf einen Prozesspool verteilt. Das Wortform-Lemma-Dictionary und der PatternEncoder werden jedem Prozess nur einmal übergeben; die Ergebnisse werden in der ursprünglichen Reihenfolge zusammengeführt, sodass das Ergebnis dem eines einzelnen Prozesses gleicht.
+
+    :param patterndict: Wortpaar-CQP-Ergebnisse-Dictionary
+    :param formlemma: Wortform-Lemma-Dictionary
+    :param counter: Pattern-Zähler mit update() und most_common(), z.B. aus PatternCounting.make_counter(); None, wenn nur die Counter je Wortpaar gebraucht werden
+    :param encoder: PatternEncoder für ganzzahlige Pattern-Schlüssel oder None für Strings
+    :param workers: Anzahl der Prozesse
+    :param table: TokenTable, mit der die Werte mit TokenTable.encode_patterndict() übersetzt wurden
+    """
+    empty = encoder.empty_key if encoder else ''
+    todo = [(pair, v) for pair, v in patterndict.items() if not isinstance(v, Counter)]
+    if workers <= 1 or len(todo) < 2:
+        for pair in patterndict.keys():
+            c = patterndict[pair]
+            if not isinstance(c, Counter):
+                c = patternize_pair(pair, c, formlemma, encoder, table)
+                patterndict[pair] = c
+            if counter is not None:
+                counter.update((p, n) for p, n in c.items() if p != empty)
+        return patterndict
+    if table:                                     #vollständiges Vokabular vorab, damit alle Prozesse dieselben IDs vergeben
+        table.lemmatize(formlemma, encoder)
+    elif encoder:
+        encoder.register(formlemma.get(x, x) for pair, lines in todo for line in lines for x in line.split(" "))
+    merge_totals = counter is not None and counter.exact and len(todo) == len(patterndict)  #approximative Zähler und Cache-Treffer verlangen Einzelschritte in Originalreihenfolge
+    size = max(1, len(todo) // (workers * 8))
+    chunks = [todo[i:i+size] for i in range(0, len(todo), size)]
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    with context.Pool(workers, initializer=_init_worker, initargs=(formlemma, encoder, table)) as pool:
+        for res, total in pool.imap(_patternize_chunk, chunks):
+            for pair, c in res:
+                patterndict[pair] = c
+            if merge_totals:
+                counter.update(total.items())
+    if not merge_totals and counter is not None:
+        for c in patterndict.values():
+            counter.update((p, n) for p, n in c.items() if p != empty)
+    return patterndict
+
+def mine_patterns(patterndict:Dict[str, Any], formlemma:Dict[str, str], miner:PatternMiner, encoder:PatternEncoder, table:TokenTable=None) -> PatternMiner:
+    """
+    Lemmatisiert die CQP-Ergebniszeilen aller Wortpaare, ersetzt das Wortpaar durch X und Y und übergibt die Zeilen als Token-IDs einem PatternMiner, statt ihre Patterns zu erzeugen. Gibt den PatternMiner zurück, der wie ein Pattern-Zähler an choose_patterns() übergeben werden kann.
+
+    :param patterndict: Wortpaar-CQP-Ergebnisse-Dictionary
+    :param formlemma: Wortform-Lemma-Dictionary
+    :param miner: PatternMiner
+    :param encoder: PatternEncoder des PatternMiner
+    :param table: TokenTable, mit der die Werte mit TokenTable.encode_patterndict() übersetzt wurden
+    """
+    for pair, musterliste in patterndict.items():
+        if isinstance(musterliste, EncodedLines):
+            miner.add(pair, table.line_ids(pair, musterliste, formlemma, encoder))
+        else:
+            lines = x_y_out(celex_lemmatize(musterliste, formlemma), pair.split(":"))
+            miner.add(pair, (encoder.encode_tokens(line.split(" ")) for line in lines))
+    return miner
+
+def choose_patterns(k:int, N:int, patternlist:Any) -> List[str]:
     """
     Gibt Liste der k mal N häufigsten Strings in einer Liste von Strings zurück.
 
     :param k: Faktor zur Bestimmung der Anzahl der Features, die in den Featurevektoren enthalten werden seien; Vorlage-Paper legt k = 20 nahe
     :param N: zweiter Faktor zur Limitierung der Features, Anzahl der Input-Wortpaare und damit Anzahl der Featurevektoren
-    :param patternlist: Liste aller produzierten Patterns als Strings
+    :param patternlist: Liste aller produzierten Patterns als Strings oder bereits befüllter Pattern-Zähler mit most_common()
+    """
+    if not hasattr(patternlist, "most_common"):
+        patternlist = Counter(patternlist)
+    return [word for word, word_count in patternlist.most_common(k*N)]
+
+def reduce_shards(paths:List[str], k:int, N:int) -> Tuple[ShardCounter, Dict[str, Counter], Dict[str, str]]:
     """
-    return [word for word, word_count in Counter(patternlist).most_common(k*N)]
+    Führt die Shards von MakeVectors.py --step=map zusammen. Zuerst werden nur die Gesamtzählungen aller Shards addiert und daraus die Features gewählt; danach werden die Counter der Wortpaare gelesen und auf diese Features beschränkt. Gibt den Pattern-Zähler, das Wortpaar-Counter(Patterns)-Dictionary in der Reihenfolge eines einzelnen Laufs und das Wortpaar-Label/Relation-Dictionary zurück.
+
+    :param paths: Pfade der Shards ohne Endung, z.B. von Sharding.check_shards()
+    :param k: Faktor zur Bestimmung der Anzahl der Features
+    :param N: Anzahl der Input-Wortpaare aller Shards
+    """
+    counter = ShardCounter()
+    for path in paths:
+        counter.merge(read_totals(path))
+    chosen = set(choose_patterns(k, N, counter))
+    rows = []
+    for path in paths:
+        for index, pair, label, c in iter_shard_pairs(path):
+            rows.append((index, pair, label, Counter({p: n for p, n in c.items() if p in chosen})))
+    rows.sort(key=lambda r: r[0])
+    return counter, {pair: c for index, pair, label, c in rows}, {pair: label for index, pair, label, c in rows}
 
 def generate_vectordict(patternizeddict:Dict[str, Any], chosenpatterns:List[str]) -> Dict[str, List[int]]:
     """
-    Nimmt Wortpaar-Patterns-Dictionary und Liste der als Features gewählten Patterns entgegen. Produziert Wortpaar-Featurevektor-Dictionary.
+    Nimmt Wortpaar-Patterns-Dictionary und Liste der als Features gewählten Patterns entgegen. Produziert Wortpaar-Featurevektor-Dictionary. Dichte Variante von generate_feature_matrix().
+
+    :param patternizeddict: Wortpaar-Patterns-Dictionary
+    :param chosenpatterns: Liste der als Features gewählten Patterns
+    """
+    return generate_feature_matrix(patternizeddict, chosenpatterns).to_dict()
+
+def generate_feature_matrix(patternizeddict:Dict[str, Any], chosenpatterns:List[str]) -> FeatureMatrix:
+    """
+    Nimmt Wortpaar-Patterns-Dictionary und Liste der als Features gewählten Patterns entgegen. Produziert dünn besetzte Wortpaar-Feature-Matrix mit log(Häufigkeit + 1) als Werten.
 
     :param patternizeddict: Wortpaar-Patterns-Dictionary
     :param chosenpatterns: Liste der als Features gewählten Patterns
     """
-    vektordict = {}
-    for element in patternizeddict.keys():
-        vektor = [0] * len(chosenpatterns)
-        for idx, val in enumerate(chosenpatterns):
-            if val in patternizeddict[element].keys():
-                #vektor[idx] = patternizeddict[element][val]
-                vektor[idx] = math.log(patternizeddict[element][val] + 1)
-        vektordict[element] = vektor
-    return vektordict
+    return FeatureMatrix.from_counters(patternizeddict, chosenpatterns).log_scale()
 
 def normalize_vectors(vd:Dict[str, List[int]]) -> Dict[str, List[float]]: #nach https://stackoverflow.com/questions/23846113/how-to-normalize-a-vector-in-python
     """
@@ -191,88 +376,203 @@ def normalize_vectors(vd:Dict[str, List[int]]) -> Dict[str, List[float]]: #nach
 
     :param vd: Key-Vektor-Dictionary
     """
-    numpy.seterr(all='raise')
+    if not vd:
+        return {}
+    a, zero = normalize_rows(numpy.array(list(vd.values()), dtype=numpy.float64))
     res = {}
-    for key in vd.keys():
-        v = vd[key]
-        v_dot = numpy.dot(v, v)
-        v_scalar = math.sqrt(v_dot)
-        try:
-            n = numpy.asarray(v) / v_scalar
-            no =  n.tolist()
-            res[key] = no
-        except FloatingPointError:
-            res[key] = [0] * len(v)
+    for key, row, z in zip(vd.keys(), a.tolist(), zero.tolist()):
+        res[key] = [0] * len(row) if z else row
     return res
 
-def balance_lines(lines:List[List[str]], k:int, vd:Dict[str, List[int]]) -> List[List[str]]:
+def write_weka_matrix(chosenPatterns:List[str], matrix:FeatureMatrix, labelsdict:Dict[str, str], filename:str, balance:bool, fmt:str='tsv') -> None:
     """
-    Hilfsfunktion für write_weka_data(). Produziert aus Liste von Listen von Strings der Form 'Wortpaar, Label, Featurevektor' eine Liste, in der die Anzahl der Listen von Strings, die das gleiche Label enthalten, der der mit dem seltensten Label entspricht. Garantiert so, dass alle Label gleich oft vorkommen.
+    Produziert Datei mit den beschrifteten Featurevektoren als Zeilen, die mit weka weiterverarbeitet werden kann. Enthält je Zeile das Wortpaar, das Label bzw. die Relation der beiden Wörter zueinander sowie den Featurevektor. Ein Header ist ebenfalls mit inbegriffen. Die Tabelle wird nie vollständig im Arbeitsspeicher aufgebaut, sondern zeilenweise im gewünschten Format geschrieben.
 
-    :param lines: Liste von Listen der Form 'Wortpaar, Label, Featurevektor', wie sie in write_weka_data() vorkommen
-    :param k: einer der beiden Faktoren für die Länge der Featurevektoren
-    :param vd: Wortpaar-Featurevektor-Dictionary mit absoluten Werten, nicht normalisiert
+    :param chosenPatterns: Liste der als Features gewählten Patterns
+    :param matrix: Wortpaar-Feature-Matrix
+    :param labelsdict: Wortpaar-Label/Relation-Dictionary
+    :param filename: Pfad zu bzw. Name der Datei, die die entstandene Tabelle enthalten soll
+    :param balance: ob die Anzahl der Wortpaare je Label gleich sein soll, oder nicht
+    :param fmt: Ausgabeformat; 'tsv' bzw. 'tsv.gz' für eine (gzip-komprimierte) Tabelle mit Tabulatoren, 'arff' für sparse ARFF, 'npz' für eine komprimierte CSR-Matrix, 'npy' für ein dichtes, speicherabgebildetes Array
     """
-    count = {}
-    lin = {}
-    for el in lines[1:]:
-        if el[1] not in count.keys():
-            count[el[1]] = 1
-            lin[el[1]] = []
-            lin[el[1]].append(el)
-        else:
-            count[el[1]] += 1
-            lin[el[1]].append(el)
-        h = count[el[1]]
-    for n in count.keys():
-        if count[n] <= h:
-            h = count[n]
-    v = 20 * h * len(count) + 2
-    res = []
-    res.append(lines[0][:v])
-    for k in lin.keys():
-        co = 0
-        for line in lin[k]:
-            if co < h:
-                hd = {line[0] : vd[line[0]][:v-2]}
-                hl = [line[0], line[1]]
-                for e in normalize_vectors(hd)[line[0]]:
-                    hl.append(e)
-                res.append(hl)
-            co += 1
-    return res
+    if balance:
+        matrix = matrix.balance(labelsdict)
+    features = chosenPatterns[:matrix.ncols]
+    if fmt in ('tsv', 'tsv.gz'):
+        write_tsv(features, matrix, labelsdict, filename, fmt == 'tsv.gz')
+    elif fmt == 'arff':
+        write_sparse_arff(features, matrix, labelsdict, filename)
+    elif fmt in ('npz', 'npy'):
+        write_numpy(features, matrix, labelsdict, filename, fmt == 'npz')
+    else:
+        raise ValueError("Unbekanntes Ausgabeformat: " + fmt)
 
-def write_weka_data(chosenPatterns:List[str], vectordict:Dict[str, List[float]], labelsdict:Dict[str, str], filename:str, balance:bool, k:int, vd:Dict[str, List[int]]) -> None:
+def write_tsv(features:List[str], matrix:FeatureMatrix, labelsdict:Dict[str, str], filename:str, compress:bool=False) -> None:
     """
-    Produziert csv-Datei mit den beschrifteten Featurevektoren als Zeilen, die mit weka weiterverarbeitet werden kann. Enthält je Zeile das Wortpaar, das Label bzw. die Relation der beiden Wörter zueinander sowie den Featurevektor. Ein Header ist ebenfalls mit inbegriffen.
+    Schreibt die Tabelle für Weka zeilenweise als csv-Datei mit Tabulatoren, auf Wunsch gzip-komprimiert.
 
-    :param chosenPatterns: Liste der als Features gewählten Patterns
-    :param vectordict: Wortpaar-Featurevektor-Dictionary
+    :param features: Liste der Patterns, die die Spalten der Matrix bilden
+    :param matrix: Wortpaar-Feature-Matrix
     :param labelsdict: Wortpaar-Label/Relation-Dictionary
-    :param filename: Pfad zu bzw. Name der csv-Datei, die die entstandene Tabelle enthalten soll
-    :param balance: ob die Anzahl der Wortpaare je Label gleich sein soll, oder nicht
-    :param k: einer der beiden Faktoren für die Länge der Featurevektoren
-    :param vd: Wortpaar-Featurevektor-Dictionary mit absoluten Werten, nicht normalisiert
+    :param filename: Pfad zu bzw. Name der Datei
+    :param compress: ob die Datei gzip-komprimiert werden soll
     """
     head = ["Wortpaar", "Label"]
-    head.extend(chosenPatterns)
-    lines = []
-    lines.append(head)
-    for pair in vectordict:
-        line = []
-        line.append(pair)
-        line.append(labelsdict[pair])
-        line.extend(vectordict[pair])
-        lines.append(line)
-    if balance:
-        lines = balance_lines(lines, k, vd)
-    with open(filename, "w", newline="") as f:
+    head.extend(features)
+    with (gzip.open(filename, "wt", newline="") if compress else open(filename, "w", newline="")) as f:
         writer = csv.writer(f, delimiter='\t')
-        writer.writerows(lines)
+        writer.writerow(head)
+        for pair, vektor in matrix.rows():
+            writer.writerow([pair, labelsdict[pair]] + vektor)
+
+def arff_quote(s:str) -> str:
+    """
+    Setzt einen String für ARFF in einfache Anführungszeichen und maskiert darin enthaltene Sonderzeichen.
+
+    :param s: String
+    """
+    return "'" + s.replace("\\", "\\\\").replace("'", "\\'") + "'"
 
+def write_sparse_arff(features:List[str], matrix:FeatureMatrix, labelsdict:Dict[str, str], filename:str) -> None:
+    """
+    Schreibt die Tabelle für Weka zeilenweise als sparse ARFF-Datei. Je Zeile werden nur das Wortpaar, das Label und die Features ungleich 0 gespeichert.
+
+    :param features: Liste der Patterns, die die Spalten der Matrix bilden
+    :param matrix: Wortpaar-Feature-Matrix
+    :param labelsdict: Wortpaar-Label/Relation-Dictionary
+    :param filename: Pfad zu bzw. Name der Datei
+    """
+    labels = list(dict.fromkeys(labelsdict[pair] for pair in matrix.pairs))
+    with open(filename, "w") as f:
+        f.write("@RELATION wortpaare\n\n")
+        f.write("@ATTRIBUTE Wortpaar STRING\n")
+        f.write("@ATTRIBUTE Label {" + ",".join(arff_quote(x) for x in labels) + "}\n")
+        for pattern in features:
+            f.write("@ATTRIBUTE " + arff_quote(pattern) + " NUMERIC\n")
+        f.write("\n@DATA\n")
+        for i, pair in enumerate(matrix.pairs):
+            a, b = matrix.indptr[i], matrix.indptr[i+1]
+            entries = ["0 " + arff_quote(pair), "1 " + arff_quote(labelsdict[pair])]
+            entries.extend(str(idx + 2) + " " + repr(val) for idx, val in zip(matrix.indices[a:b].tolist(), matrix.data[a:b].tolist()))
+            f.write("{" + ", ".join(entries) + "}\n")
+
+def write_numpy(features:List[str], matrix:FeatureMatrix, labelsdict:Dict[str, str], filename:str, sparse:bool=True) -> None:
+    """
+    Speichert die Featurevektoren als NumPy-Datei: entweder die CSR-Arrays der Matrix komprimiert als .npz oder ein dichtes float64-Array als .npy, das über eine Speicherabbildung zeilenweise befüllt und mit numpy.load(..., mmap_mode='r') wieder geöffnet werden kann. Zusätzlich werden eine Indexdatei <filename>.index.tsv mit Wortpaar und Label je Zeile und eine Datei <filename>.features.txt mit einem Pattern je Spalte geschrieben.
+
+    :param features: Liste der Patterns, die die Spalten der Matrix bilden
+    :param matrix: Wortpaar-Feature-Matrix
+    :param labelsdict: Wortpaar-Label/Relation-Dictionary
+    :param filename: Pfad zu bzw. Name der Datei
+    :param sparse: ob die CSR-Arrays als .npz oder ein dichtes Array als .npy gespeichert werden soll
+    """
+    if sparse:
+        with open(filename, "wb") as f:
+            numpy.savez_compressed(f, indptr=matrix.indptr, indices=matrix.indices, data=matrix.data, shape=numpy.array([len(matrix), matrix.ncols]))
+    else:
+        a = numpy.lib.format.open_memmap(filename, mode="w+", dtype=numpy.float64, shape=(len(matrix), matrix.ncols))
+        for i in range(len(matrix)):
+            start, end = matrix.indptr[i], matrix.indptr[i+1]
+            a[i, matrix.indices[start:end]] = matrix.data[start:end]
+        a.flush()
+        del a
+    with open(filename + ".index.tsv", "w", newline="") as f:
+        writer = csv.writer(f, delimiter='\t')
+        writer.writerow(["Wortpaar", "Label"])
+        writer.writerows([pair, labelsdict[pair]] for pair in matrix.pairs)
+    with open(filename + ".features.txt", "w") as f:
+        for pattern in features:
+            f.write(pattern + "\n")
+
+def write_vectordict(matrix:FeatureMatrix, filename:str) -> None:
+    """
+    Speichert eine Wortpaar-Feature-Matrix zeilenweise als json-Datei im Format eines Wortpaar-Featurevektor-Dictionary.
+
+    :param matrix: Wortpaar-Feature-Matrix
+    :param filename: Pfad zu bzw. Name der json-Datei
+    """
+    with open(filename, "w") as f:
+        f.write("{")
+        for i, (pair, vektor) in enumerate(matrix.rows()):
+            if i:
+                f.write(", ")
+            f.write(json.dumps(pair) + ": " + json.dumps(vektor))
+        f.write("}")
+
+
+def count_lines(patterndict:Dict[str, Any]) -> Dict[str, int]:
+    """
+    Gibt die Anzahl der CQP-Ergebniszeilen je Wortpaar zurück; Wortpaare, die schon als Counter aus einem PatternCache vorliegen, fehlen.
+
+    :param patterndict: Wortpaar-CQP-Ergebnisse-Dictionary
+    """
+    return {pair: len(v.offsets) - 1 if isinstance(v, EncodedLines) else len(v) for pair, v in patterndict.items() if not isinstance(v, Counter)}
+
+def count_patterns(patternizeddict:Dict[str, Any], lines:Dict[str, int], empty:Any) -> None:
+    """
+    Zählt für PROFILER die Zeilen, alle und verschiedene Patterns und trägt je Wortpaar die mittlere Anzahl der Patterns je Zeile ins Histogramm 'patterns_per_line' ein.
+
+    :param patternizeddict: Wortpaar-Patterns-Dictionary
+    :param lines: Anzahl der Zeilen je Wortpaar aus count_lines()
+    :param empty: Schlüssel des leeren Patterns
+    """
+    distinct = set()
+    for pair, c in patternizeddict.items():
+        total = sum(n for p, n in c.items() if p != empty)
+        PROFILER.count("patterns", total)
+        distinct.update(c)
+        if lines.get(pair):
+            PROFILER.count("lines", lines[pair])
+            PROFILER.observe("patterns_per_line", total / lines[pair])
+    distinct.discard(empty)
+    PROFILER.count("pairs", len(patternizeddict))
+    PROFILER.count("distinct_patterns", len(distinct))
+
+def write_results(ml:Any, ptd:Dict[str, Counter], encoder:PatternEncoder, labelsdict:Dict[str, str], k:int, n:int, patternfile:str, normalize:bool, vectorfile:str, balance:bool, datafile:str, fmt:str) -> None:
+    """
+    Wählt die Features aus dem Pattern-Zähler, erstellt daraus die Wortpaar-Feature-Matrix und schreibt gewählte Patterns, Vektoren und Tabelle für Weka.
+
+    :param ml: Pattern-Zähler mit most_common() oder Liste aller Patterns
+    :param ptd: Wortpaar-Counter(Patterns)-Dictionary
+    :param encoder: PatternEncoder der ganzzahligen Pattern-Schlüssel oder None für Strings
+    :param labelsdict: Wortpaar-Label/Relation-Dictionary
+    :param k: Faktor zur Bestimmung der Anzahl der Features
+    :param n: Anzahl der Input-Wortpaare
+    :param patternfile: Pfad zu bzw. Name der Datei für die gewählten Patterns
+    :param normalize: ob die Vektoren normalisiert werden
+    :param vectorfile: Pfad zu bzw. Name der Datei für das Wortpaar-Featurevektor-Dictionary
+    :param balance: ob die Anzahl der Wortpaare je Label gleich sein soll, oder nicht
+    :param datafile: Pfad zu bzw. Name der Datei für Weka; None für den Standardnamen des Formats
+    :param fmt: Ausgabeformat, siehe write_weka_matrix()
+    """
+    with PROFILER.stage("choose_patterns"):
+        cho = choose_patterns(k, n, ml)                           #Wählt Features aus Patternliste aus.
+
+        features = cho
+        if encoder:                                               #Übersetzt ganzzahlige Pattern-Schlüssel zurück in Strings.
+            cho = encoder.decode_all(cho)
+
+        with open(patternfile, "wb") as f:                        #Speichert Feature-Patterns in Datei.
+            pickle.dump(cho, f)
+
+    with PROFILER.stage("feature_matrix"):
+        vm = generate_feature_matrix(ptd, features)               #Erstellt dünn besetzte Wortpaar-Feature-Matrix.
+
+        if normalize:                                             #Normalisiert Wortpaar-Feature-Matrix, wenn erwünscht.
+            vm = vm.normalize()
+
+    with PROFILER.stage("write_vectordict"):
+        write_vectordict(vm, vectorfile)                          #Speichert Wortpaar-Featurevektor-Dictionary in Datei.
+
+    if datafile is None:
+        datafile = {'tsv': 'Data.csv', 'tsv.gz': 'Data.csv.gz'}.get(fmt, 'Data.' + fmt)
+
+    with PROFILER.stage("write_data"):
+        write_weka_matrix(cho, vm, labelsdict, datafile, balance, fmt)#Schreibt Vektordatei für Weiterverarbeitung mit Weka.
 
 @click.command()
-@click.option('--formlemmaname', default='FormLemma.json', help='Name of file containing wordform-lemma-dictionary. Defaults to "FormLemma.json".')
+@profile_options
+@click.option('--formlemmaname', default='FormLemma.json', help='Name of file containing wordform-lemma-dictionary or of lexicon directory written by MakeCELEXDictFiles.py. Defaults to "FormLemma.json".')
 @click.option('--resultfiles', '-f', multiple=True, default=["actual_results_antonyms_long.pckl", "actual_results_synonyms.pckl", "actual_results_nonyms.pckl", "actual_results_200-400_antonyms_long.pckl", "actual_results_200-400_nonyms.pckl", "actual_results_200-400_synonyms.pckl", "actual_results_400-1000_synonyms.pckl", "actual_results_1010-1020_antonyms_long.pckl", "actual_results_1010-1020_synonyms.pckl", "actual_results_1020-1030_antonyms_long.pckl", "actual_results_1020-1030_synonyms.pckl", "actual_results_1030-1040_synonyms.pckl"], help='Name files from which to take data to be preprocessed. Has to be parallel to labels.')
 @click.option('--labels', '-l', multiple=True, default=["antonyms", "synonyms", "nonyms", "antonyms", "nonyms", "synonyms", "synonyms", "antonyms", "synonyms", "antonyms", "synonyms", "synonyms"], help='Lables or relations for sourcefiles used. Has to be parallel to files named as resultfiles.')
 @click.option('--k', default=20, help='One of the factors determining the number of features of the vectors; should be 20 according to paper. Defaults to 20.')
@@ -280,44 +580,134 @@ def write_weka_data(chosenPatterns:List[str], vectordict:Dict[str, List[float]],
 @click.option('--normalize/--not-normalized', default=True, help='Whether to normalize the feature vectors or not. Defaults to yes. Balanced data is always normalized.')
 @click.option('--vectorfile', default='VektorDict.json', help='Full path to or name of file to contain the wordpair-vector-dictionary. Defaults to "VektorDict.json".')
 @click.option('--balance/--unbalanced', default=True, help='Whether to ensure balance of labels in data or not. Defaults to yes. Will always normalize vectors if yes.')
-@click.option('--datafile', default='Data.csv', help='Full path to or name of file to contain data prepared for weka. Defaults to "Data.csv".')
-def main(formlemmaname, resultfiles, labels, k, patternfile, normalize, vectorfile, balance, datafile):
+@click.option('--datafile', default=None, help='Full path to or name of file to contain data prepared for weka. Defaults to "Data.csv", or "Data.csv.gz", "Data.arff", "Data.npz" or "Data.npy" according to --format.')
+@click.option('--format', 'fmt', default='tsv', type=click.Choice(['tsv', 'tsv.gz', 'arff', 'npz', 'npy']), help='Format of datafile: tab separated csv, gzip-compressed tab separated csv, sparse ARFF, compressed sparse NumPy arrays or a dense memory-mappable NumPy array. The NumPy formats come with sidecar files listing pairs, labels and features. Defaults to "tsv".')
+@click.option('--counting', default='stream', type=click.Choice(['list', 'stream', 'spill', 'approx', 'mine']), help='How to count patterns: "list" collects all patterns first, "stream" counts them exactly while they are generated, "spill" does so with bounded memory by spilling partial counts to disk, "approx" keeps a fixed-size Space-Saving summary, "mine" searches the most frequent patterns exactly without generating the others, skipping every pattern that cannot reach the current top k*N. Defaults to "stream".')
+@click.option('--spillsize', default=1000000, help='Maximum number of distinct patterns kept in memory before spilling to disk with --counting=spill. Defaults to 1000000.')
+@click.option('--tmpdir', default=None, help='Directory for spill files with --counting=spill. Defaults to the system temporary directory.')
+@click.option('--capacity', default=0, help='Number of patterns tracked with --counting=approx. Defaults to 10 times the number of features.')
+@click.option('--engine', default='bitmask', type=click.Choice(['bitmask', 'strings']), help='How to enumerate patterns: "bitmask" counts integer-encoded wildcard masks, "strings" uses the recursive vary(). Ignored with --counting=list or --counting=mine. Defaults to "bitmask".')
+@click.option('--workers', default=1, help='Number of processes used to patternize word pairs. Ignored with --counting=list or --counting=mine. Defaults to 1.')
+@click.option('--cache', default=None, help='Full path to or name of a pattern cache database. If given, only word pairs whose result files or lexicon changed since the last run are patternized again. Ignored with --counting=list or --counting=mine. Defaults to no cache.')
+@click.option('--store', default=None, help='Full path to or name of the result store database written by PreprocessingCQP.py --store. If given, hits are read from it instead of one file per word pair. Defaults to no store.')
+@click.option('--tokens', default='ids', type=click.Choice(['ids', 'strings']), help='How to lemmatize lines and replace the word pair by X and Y with --engine=bitmask or --counting=mine: "ids" translates all lines into arrays of token IDs over a global vocabulary and looks up each lemma once, "strings" splits and rejoins every line. Ignored with --counting=list. Defaults to "ids".')
+@click.option('--step', default='all', type=click.Choice(['all', 'map', 'reduce']), help='Which part of the work to do: "all" everything in one run, "map" patternizes one shard of the word pairs and writes its pattern counts to --sharddir, "reduce" merges all shards in --sharddir, chooses the patterns and writes the vectors and datafile; the result equals that of "all". --counting is ignored with "map" and "reduce". Defaults to "all".')
+@click.option('--shards', default=1, help='Number of shards the word pairs are split into with --step=map. Defaults to 1.')
+@click.option('--shard', default=None, type=int, help='Number of the shard, from 0 to --shards minus 1, to patternize with --step=map. Defaults to the first shard neither finished nor claimed by another process in --sharddir.')
+@click.option('--shardby', default='hash', type=click.Choice(['hash', 'range']), help='How to split the word pairs into shards: "hash" by a CRC32 of their result file name, "range" into contiguous ranges of the result lists. Defaults to "hash".')
+@click.option('--sharddir', default='shards', help='Directory shared by all map and reduce steps for shards and claim files. Defaults to "shards".')
+def main(formlemmaname, resultfiles, labels, k, patternfile, normalize, vectorfile, balance, datafile, fmt, counting, spillsize, tmpdir, capacity, engine, workers, cache, store, tokens, step, shards, shard, shardby, sharddir):
     """
     Run script to finish preprocessing, patternize data and generate vectors. Save results in csv file for later usage in weka.
     """
-    rnames, labelsdict = read_resultnames(resultfiles, labels)    #Liest CQP-Ergebnisse ein und erstellt Wortpaar-Label-Dictionary.
-
-    pd = make_patterndict(rnames)                                 #Erstellt Wortpaar-CQP-Ergebnisse-Dictionary.
+    if step == 'reduce':
+        with PROFILER.stage("merge_shards"):
+            try:
+                paths, header = check_shards(sharddir)            #Prüft, dass alle Shards fertig sind und zusammenpassen.
+            except ValueError as e:
+                raise click.ClickException(str(e))
+            n = header["npairs"]
+            ml, ptd, labelsdict = reduce_shards(paths, k, n)      #Addiert die Gesamtzählungen und liest die Counter der Wortpaare.
+        write_results(ml, ptd, None, labelsdict, k, n, patternfile, normalize, vectorfile, balance, datafile, fmt)
+        return
+    if step == 'map':
+        if shards < 1 or shard is not None and not 0 <= shard < shards:
+            raise click.UsageError("--shard muss zwischen 0 und --shards - 1 liegen.")
+        counting = 'stream'                                       #Gezählt wird erst beim Zusammenführen der Shards.
+
+    with PROFILER.stage("read_results"):
+        rnames, labelsdict = read_resultnames(resultfiles, labels)    #Liest CQP-Ergebnisse ein und erstellt Wortpaar-Label-Dictionary.
+
+        if step == 'map':                                         #Beschränkt die Ergebnisse auf einen Shard.
+            names = list(dict.fromkeys(rnames))
+            if shard is None:
+                shard = claim_shard(sharddir, shards)
+                if shard is None:
+                    print("Alle " + str(shards) + " Shards in " + sharddir + " sind fertig oder vergeben.")
+                    return
+            os.makedirs(sharddir, exist_ok=True)
+            header = {"shard": shard, "shards": shards, "shardby": shardby, "npairs": len(rnames),
+                      "inputs": input_fingerprint(names, labelsdict, file_hash(formlemmaname))}
+            selected = select_shard(names, shard, shards, shardby)
+            index = {names[i][:-10]: i for i in selected}     #globale Nummer je Wortpaar, ordnet die Wortpaare beim Zusammenführen
+            rnames = [names[i] for i in selected]
+
+        rs = ResultStore(store) if store else None                #Öffnet Ergebnisablage, falls Ergebnisse nicht in einzelnen Dateien liegen.
+
+        if cache and counting not in ('list', 'mine'):                          #Öffnet Pattern-Cache für Wortform-Lemma-Dictionary und Pattern-Engine.
+            pc = PatternCache(cache, file_hash(formlemmaname) + ":" + engine)
+            pd, keys = make_patterndict_cached(rnames, pc, rs)    #Erstellt Wortpaar-CQP-Ergebnisse-Dictionary, übernimmt unveränderte Wortpaare aus dem Cache.
+        else:
+            pc = None
+            pd = make_patterndict(rnames, rs)                     #Erstellt Wortpaar-CQP-Ergebnisse-Dictionary.
 
-    with open(formlemmaname) as f:                                #Liest Wortform-Lemma-Dictionary ein.
-        formlemma = json.load(f)
+        if rs:
+            rs.close()
 
-    if formlemmaname=='FormLemma.txt':
-        newformlemma = {}
-        for key in formlemma.keys():
-            newformlemma[key] = formlemma[key][:-1]
-    else:
-        newformlemma=formlemma   
+    with PROFILER.stage("load_formlemma"):
+        if is_lexicon(formlemmaname):                             #Mappt kompaktes Lexikon, statt das Dictionary einzulesen; Prozesse des Pools teilen es sich.
+            newformlemma = Lexicon(formlemmaname).formlemma
+        else:
+            with open(formlemmaname) as f:                        #Liest Wortform-Lemma-Dictionary ein.
+                formlemma = json.load(f)
 
-    ptd, ml = patternize_and_master_list(pd, newformlemma)        #Erstellt Wortform-Patterns-Dictionary und Liste aller Patterns.
+            if formlemmaname=='FormLemma.txt':
+                newformlemma = {}
+                for key in formlemma.keys():
+                    newformlemma[key] = formlemma[key][:-1]
+            else:
+                newformlemma=formlemma   
 
     n = len(rnames)                                               #Bestimmt Variable n (bzw. N im Paper) aus Anzahl der Wortpaare.
+    lines = count_lines(pd) if PROFILER.enabled else {}           #Zeilen je Wortpaar vor dem Patternisieren, nur für --profile
+
+    encoder = None
+    if counting == 'list':
+        with PROFILER.stage("patternize"):
+            ptd, ml = patternize_and_master_list(pd, newformlemma)    #Erstellt Wortform-Patterns-Dictionary und Liste aller Patterns.
+    elif counting == 'mine':
+        encoder = PatternEncoder()
+        table = None
+        if tokens == 'ids':                                       #Übersetzt Ergebniszeilen in Token-IDs.
+            with PROFILER.stage("encode_tokens"):
+                table = TokenTable()
+                table.encode_patterndict(pd)
+        with PROFILER.stage("patternize"):
+            ml = mine_patterns(pd, newformlemma, PatternMiner(encoder), encoder, table)  #Sucht die k*n häufigsten Patterns, ohne alle zu erzeugen.
+            ptd = ml.pair_counters([key for key, count in ml.most_common(k * n)])  #Zählt nur diese je Wortpaar.
+        PROFILER.count("mined_prefixes", ml.visited)
+    else:
+        ml = make_counter(counting, capacity or 10 * k * n, spillsize, tmpdir) if step == 'all' else None
+        if engine == 'bitmask':
+            encoder = pc.load_encoder() if pc else PatternEncoder()
+        table = None
+        if encoder and tokens == 'ids':                           #Übersetzt Ergebniszeilen in Token-IDs.
+            with PROFILER.stage("encode_tokens"):
+                table = TokenTable()
+                table.encode_patterndict(pd)
+        with PROFILER.stage("patternize"):
+            ptd = patternize_and_count(pd, newformlemma, ml, encoder, workers, table) #Erstellt Wortform-Patterns-Dictionary und zählt dabei alle Patterns.
+
+    if pc:                                                        #Speichert neu verarbeitete Wortpaare im Pattern-Cache.
+        with PROFILER.stage("save_cache"):
+            for pair, key in keys.items():
+                pc.put(key, ptd[pair])
+            if encoder:
+                pc.save_encoder(encoder)
+            pc.close()
+        print("Pattern-Cache: " + str(pc.hits) + " Wortpaare übernommen, " + str(len(keys)) + " neu verarbeitet.")
+
+    if PROFILER.enabled and counting != 'mine':                   #Zählt Patterns je Zeile sowie alle und verschiedene Patterns.
+        count_patterns(ptd, lines, encoder.empty_key if encoder else '')
+
+    if step == 'map':                                             #Schreibt die Counter der Wortpaare und die Gesamtzählung des Shards.
+        with PROFILER.stage("write_shard"):
+            rows = ((index[pair], pair, labelsdict[pair], c) for pair, c in ptd.items())
+            header = write_shard(shard_path(sharddir, shard, shards), header, rows, encoder.decode if encoder else None, encoder.empty_key if encoder else '')
+        print("Shard " + str(shard) + " von " + str(shards) + ": " + str(header["pairs"]) + " Wortpaare, " + str(header["patterns"]) + " verschiedene Patterns.")
+        return
 
-    cho = choose_patterns(k, n, ml)                               #Wählt Features aus Patternliste aus.
-
-    with open(patternfile, "wb") as f:                            #Speichert Feature-Patterns in Datei.
-        pickle.dump(cho, f)
-
-    vd = generate_vectordict(ptd, cho)                            #Erstellt Wortpaar-Featurevektor-Dictionary.
-
-    if normalize:                                                 #Normalisiert Wortpaar-Featurevektor-Dictionary, wenn erwünscht.
-        vd = normalize_vectors(vd)
-
-    with open(vectorfile, "w") as f:                              #Speichert Wortpaar-Featurevektor-Dictionary in Datei.
-        json.dump(vd, f)
-
-    write_weka_data(cho, vd, labelsdict, datafile, balance, k, vd)#Schreibt Vektordatei für Weiterverarbeitung mit Weka.
-
+    write_results(ml, ptd, encoder, labelsdict, k, n, patternfile, normalize, vectorfile, balance, datafile, fmt)
 
 if __name__ == "__main__":
 
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2022 franka.beyer@fau.de
+
+import time
+import sqlite3
+from collections import Counter
+from typing import List, Dict, Iterable
+
+STATUSES = ('queued', 'hits', 'nohits', 'failed')   #eingereiht, mit Treffern gesucht, ohne Treffer gesucht, fehlgeschlagen
+SEARCHED = ('hits', 'nohits')
+
+class Manifest:
+    """
+    Verzeichnis des Suchstands jedes Wortpaares in einer SQLite-Datenbank, getrennt nach Korpus und Version der Anfragen. Jede Statusänderung wird in einer eigenen Transaktion geschrieben, sodass ein abgebrochener Lauf höchstens die Wortpaare des laufenden Stapels als 'queued' hinterlässt und sie beim Fortsetzen erneut gesucht werden.
+
+    :param path: Pfad zu bzw. Name der Datenbankdatei
+    :param corpus: Name des Korpus bzw. des Index
+    :param version: Version der Anfragen, z.B. aus Anfragemodus und Hash des Lemma-Wortformen-Dictionary
+    """
+    def __init__(self, path:str, corpus:str, version:str):
+        self.corpus = corpus
+        self.version = version
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS pairs (pair TEXT, corpus TEXT, version TEXT, status TEXT, updated REAL, PRIMARY KEY (pair, corpus, version))")
+
+    def status(self, pairs:Iterable[str]) -> Dict[str, str]:
+        """
+        Gibt den Status der Wortpaare als Dictionary zurück; Wortpaare ohne Eintrag fehlen darin.
+
+        :param pairs: Wortpaare der Form <Wort1>:<Wort2>
+        """
+        pairs = list(dict.fromkeys(pairs))
+        res = {}
+        for i in range(0, len(pairs), 500):              #in Blöcken, um die Höchstzahl der Parameter von SQLite nicht zu überschreiten
+            block = pairs[i:i+500]
+            rows = self.db.execute("SELECT pair, status FROM pairs WHERE corpus = ? AND version = ? AND pair IN (" + ",".join("?" * len(block)) + ")", [self.corpus, self.version] + block)
+            res.update(rows.fetchall())
+        return res
+
+    def pending(self, pairs:Iterable[str]) -> List[str]:
+        """
+        Gibt die Wortpaare ohne Duplikate und in ihrer Reihenfolge zurück, die noch nicht erfolgreich gesucht wurden, also keinen Status, 'queued' oder 'failed' haben.
+
+        :param pairs: Wortpaare der Form <Wort1>:<Wort2>
+        """
+        pairs = list(dict.fromkeys(pairs))
+        status = self.status(pairs)
+        return [pair for pair in pairs if status.get(pair) not in SEARCHED]
+
+    def update(self, statuses:Dict[str, str]) -> None:
+        """
+        Setzt den Status mehrerer Wortpaare in einer Transaktion.
+
+        :param statuses: Dictionary von Wortpaar und Status aus STATUSES
+        """
+        now = time.time()
+        for status in statuses.values():
+            if status not in STATUSES:
+                raise ValueError("Unbekannter Status: " + status)
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO pairs VALUES (?, ?, ?, ?, ?)", ((pair, self.corpus, self.version, status, now) for pair, status in statuses.items()))
+
+    def mark(self, pairs:Iterable[str], status:str) -> None:
+        """
+        Setzt den Status aller Wortpaare in einer Transaktion auf denselben Wert.
+
+        :param pairs: Wortpaare der Form <Wort1>:<Wort2>
+        :param status: Status aus STATUSES
+        """
+        self.update({pair: status for pair in pairs})
+
+    def counts(self) -> Counter:
+        """
+        Gibt die Anzahl der Wortpaare je Status für Korpus und Version zurück.
+        """
+        rows = self.db.execute("SELECT status, COUNT(*) FROM pairs WHERE corpus = ? AND version = ? GROUP BY status", (self.corpus, self.version))
+        return Counter(dict(rows.fetchall()))
+
+    def close(self) -> None:
+        """
+        Schließt die Datenbank.
+        """
+        self.db.close()
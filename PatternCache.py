@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2022 franka.beyer@fau.de
+
+import os
+import zlib
+import pickle
+import sqlite3
+import hashlib
+from collections import Counter
+from typing import Optional
+from PatternEncoding import PatternEncoder
+
+def file_hash(file:str) -> str:
+    """
+    Gibt den SHA-1-Hash des Inhalts einer Datei oder, z.B. für ein Lexicon, aller Dateien eines Verzeichnisses in der Reihenfolge ihrer Namen als Hex-String zurück.
+
+    :param file: Pfad zu bzw. Name der Datei oder des Verzeichnisses
+    """
+    h = hashlib.sha1()
+    files = [os.path.join(file, name) for name in sorted(os.listdir(file))] if os.path.isdir(file) else [file]
+    for path in files:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    return h.hexdigest()
+
+class PatternCache:
+    """
+    Dauerhafter Cache der Wortpaar-Counter(Patterns) in einer SQLite-Datenbank. Ein Eintrag ist über den Inhalt der CQP-Ergebnisdatei eines Wortpaares, das Wortpaar selbst und die Version des Caches gekennzeichnet; die Version enthält den Hash des Wortform-Lemma-Dictionary und die verwendete Pattern-Engine. Ändert sich eines davon, wird der Eintrag nicht mehr gefunden und das Wortpaar neu verarbeitet.
+    Für die Bitmasken-Engine wird außerdem das Vokabular des PatternEncoder gespeichert, damit die ganzzahligen Pattern-Schlüssel über mehrere Läufe gleich bleiben.
+
+    :param path: Pfad zu bzw. Name der Datenbankdatei
+    :param version: Version des Caches, z.B. aus Hash des Wortform-Lemma-Dictionary und Name der Pattern-Engine
+    """
+    def __init__(self, path:str, version:str):
+        self.version = version
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS counts (key TEXT PRIMARY KEY, data BLOB)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS vocab (version TEXT, id INTEGER, token TEXT, PRIMARY KEY (version, id))")
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, pair:str, content:bytes) -> str:
+        """
+        Gibt den Schlüssel eines Eintrags zurück.
+
+        :param pair: Wortpaar der Form <Wort1>:<Wort2>
+        :param content: Inhalt der zugehörigen CQP-Ergebnisdatei
+        """
+        h = hashlib.sha1()
+        for part in (self.version.encode(), pair.encode(), content):
+            h.update(part)
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def get(self, key:str) -> Optional[Counter]:
+        """
+        Gibt den gespeicherten Counter(Patterns) zu einem Schlüssel zurück, oder None, wenn es keinen gibt.
+
+        :param key: Schlüssel aus key()
+        """
+        row = self.db.execute("SELECT data FROM counts WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return Counter(pickle.loads(zlib.decompress(row[0])))
+
+    def put(self, key:str, counter:Counter) -> None:
+        """
+        Speichert einen Counter(Patterns) unter einem Schlüssel.
+
+        :param key: Schlüssel aus key()
+        :param counter: Counter(Patterns) eines Wortpaares
+        """
+        data = zlib.compress(pickle.dumps(dict(counter), pickle.HIGHEST_PROTOCOL))
+        self.db.execute("INSERT OR REPLACE INTO counts VALUES (?, ?)", (key, data))
+
+    def load_encoder(self) -> PatternEncoder:
+        """
+        Gibt einen PatternEncoder mit dem gespeicherten Vokabular zurück.
+        """
+        encoder = PatternEncoder()
+        rows = self.db.execute("SELECT id, token FROM vocab WHERE version = ? ORDER BY id", (self.version,))
+        for i, token in rows:
+            if i != len(encoder.tokens):
+                raise ValueError("Vokabular im Pattern-Cache ist beschädigt.")
+            encoder.register([token])
+        return encoder
+
+    def save_encoder(self, encoder:PatternEncoder) -> None:
+        """
+        Ergänzt das gespeicherte Vokabular um die neuen Tokens eines PatternEncoder.
+
+        :param encoder: PatternEncoder, der mit load_encoder() erzeugt wurde
+        """
+        start = PatternEncoder().tokens
+        known = self.db.execute("SELECT COUNT(*) FROM vocab WHERE version = ?", (self.version,)).fetchone()[0] + len(start)
+        self.db.executemany("INSERT INTO vocab VALUES (?, ?, ?)", ((self.version, i, encoder.tokens[i]) for i in range(known, len(encoder.tokens))))
+
+    def commit(self) -> None:
+        """
+        Schreibt alle Änderungen in die Datenbank.
+        """
+        self.db.commit()
+
+    def close(self) -> None:
+        """
+        Schreibt alle Änderungen in die Datenbank und schließt sie.
+        """
+        self.db.commit()
+        self.db.close()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2022 franka.beyer@fau.de
+
+import os
+import heapq
+import pickle
+import tempfile
+from typing import List, Any, Tuple, Iterator, Iterable
+
+class StreamCounter:
+    """
+    Exakter Pattern-Zähler im Arbeitsspeicher. Zählt Patterns, während sie erzeugt werden, statt sie erst in einer Liste zu sammeln. Bei gleicher Häufigkeit gilt wie bei Counter.most_common() die Reihenfolge des ersten Auftretens.
+    """
+    exact = True
+
+    def __init__(self):
+        self.counts = {}
+
+    def update(self, patterns:Iterable[Tuple[Any, int]]) -> None:
+        """
+        Zählt Patterns mit ihren Häufigkeiten hinzu.
+
+        :param patterns: Paare aus Pattern und Häufigkeit, z.B. Counter.items()
+        """
+        counts = self.counts
+        for pattern, count in patterns:
+            counts[pattern] = counts.get(pattern, 0) + count
+
+    def most_common(self, n:int) -> List[Tuple[Any, int]]:
+        """
+        Gibt die n häufigsten Patterns mit ihren Häufigkeiten zurück.
+
+        :param n: Anzahl der zurückzugebenden Patterns
+        """
+        return heapq.nlargest(n, self.counts.items(), key=lambda x: x[1])
+
+class SpillCounter:
+    """
+    Exakter Pattern-Zähler mit begrenztem Arbeitsspeicher. Sobald mehr als max_entries verschiedene Patterns im Speicher liegen, werden die Teilzählungen nach Pattern sortiert in eine temporäre Datei geschrieben. most_common() führt die Dateien anschließend sortiert zusammen. Für jedes Pattern wird die Position seines ersten Auftretens mitgeführt, damit das Ergebnis auch bei Gleichstand dem von Counter.most_common() entspricht.
+
+    :param max_entries: Höchstzahl verschiedener Patterns im Arbeitsspeicher
+    :param tmpdir: Verzeichnis für die temporären Dateien; None für das Standardverzeichnis
+    """
+    exact = True
+
+    def __init__(self, max_entries:int=1000000, tmpdir:str=None):
+        self.max_entries = max_entries
+        self.tmpdir = tmpdir
+        self.counts = {}
+        self.seq = 0
+        self.spills = []
+
+    def update(self, patterns:Iterable[Tuple[Any, int]]) -> None:
+        """
+        Zählt Patterns mit ihren Häufigkeiten hinzu und lagert bei Bedarf aus.
+
+        :param patterns: Paare aus Pattern und Häufigkeit, z.B. Counter.items()
+        """
+        counts = self.counts
+        for pattern, count in patterns:
+            entry = counts.get(pattern)
+            if entry is None:
+                counts[pattern] = [count, self.seq]
+                self.seq += 1
+            else:
+                entry[0] += count
+        if len(counts) > self.max_entries:
+            self.spill()
+
+    def spill(self) -> None:
+        """
+        Schreibt die Teilzählungen im Arbeitsspeicher sortiert in eine temporäre Datei.
+        """
+        if not self.counts:
+            return
+        fd, name = tempfile.mkstemp(suffix=".spill", dir=self.tmpdir)
+        with os.fdopen(fd, "wb") as f:
+            batch = []
+            for pattern in sorted(self.counts):
+                count, first = self.counts[pattern]
+                batch.append((pattern, count, first))
+                if len(batch) == 10000:
+                    pickle.dump(batch, f)
+                    batch = []
+            if batch:
+                pickle.dump(batch, f)
+        self.spills.append(name)
+        self.counts = {}
+
+    def _read_spill(self, name:str) -> Iterator[Tuple[Any, int, int]]:
+        with open(name, "rb") as f:
+            while True:
+                try:
+                    batch = pickle.load(f)
+                except EOFError:
+                    return
+                yield from batch
+
+    def _merged(self) -> Iterator[Tuple[Any, int, int]]:
+        runs = [self._read_spill(name) for name in self.spills]
+        runs.append((p, c, s) for p, (c, s) in sorted(self.counts.items()))
+        current = None
+        for pattern, count, first in heapq.merge(*runs, key=lambda x: x[0]):
+            if current is not None and current[0] == pattern:
+                current[1] += count
+                current[2] = min(current[2], first)
+            else:
+                if current is not None:
+                    yield tuple(current)
+                current = [pattern, count, first]
+        if current is not None:
+            yield tuple(current)
+
+    def most_common(self, n:int) -> List[Tuple[Any, int]]:
+        """
+        Gibt die n häufigsten Patterns mit ihren Häufigkeiten zurück und löscht die temporären Dateien.
+
+        :param n: Anzahl der zurückzugebenden Patterns
+        """
+        try:
+            top = heapq.nsmallest(n, self._merged(), key=lambda x: (-x[1], x[2]))
+        finally:
+            self.close()
+        return [(pattern, count) for pattern, count, first in top]
+
+    def close(self) -> None:
+        """
+        Löscht alle temporären Dateien.
+        """
+        for name in self.spills:
+            try:
+                os.remove(name)
+            except FileNotFoundError:
+                pass
+        self.spills = []
+
+class SpaceSavingCounter:
+    """
+    Approximativer Heavy-Hitter-Zähler nach dem Space-Saving-Algorithmus (Metwally et al. 2005) mit fester Speichergröße. Es werden höchstens capacity Patterns gezählt; ein neues Pattern verdrängt bei vollem Speicher das seltenste und übernimmt dessen Zählerstand als Fehlerschranke. Jedes Pattern mit wahrer Häufigkeit größer als Gesamtzahl/capacity ist garantiert enthalten, Häufigkeiten werden höchstens überschätzt.
+
+    :param capacity: Höchstzahl gleichzeitig gezählter Patterns
+    """
+    exact = False
+
+    def __init__(self, capacity:int):
+        self.capacity = capacity
+        self.counts = {}
+        self.heap = []
+        self.seq = 0
+
+    def update(self, patterns:Iterable[Tuple[Any, int]]) -> None:
+        """
+        Zählt Patterns mit ihren Häufigkeiten hinzu.
+
+        :param patterns: Paare aus Pattern und Häufigkeit, z.B. Counter.items()
+        """
+        counts = self.counts
+        for pattern, count in patterns:
+            entry = counts.get(pattern)
+            if entry is not None:
+                entry[0] += count
+                heapq.heappush(self.heap, (entry[0], entry[2], pattern))
+                continue
+            if len(counts) < self.capacity:
+                entry = [count, 0, self.seq]
+            else:
+                minimum, old = self._pop_min()
+                del counts[old]
+                entry = [minimum + count, minimum, self.seq]
+            self.seq += 1
+            counts[pattern] = entry
+            heapq.heappush(self.heap, (entry[0], entry[2], pattern))
+        if len(self.heap) > 4 * self.capacity:
+            self.heap = [(c, s, p) for p, (c, e, s) in counts.items()]
+            heapq.heapify(self.heap)
+
+    def _pop_min(self) -> Tuple[int, Any]:
+        while True:
+            count, seq, pattern = heapq.heappop(self.heap)
+            entry = self.counts.get(pattern)
+            if entry is not None and entry[0] == count and entry[2] == seq:   #veraltete Heap-Einträge überspringen
+                return count, pattern
+
+    def most_common(self, n:int) -> List[Tuple[Any, int]]:
+        """
+        Gibt die n Patterns mit den höchsten geschätzten Häufigkeiten zurück.
+
+        :param n: Anzahl der zurückzugebenden Patterns
+        """
+        top = heapq.nsmallest(n, self.counts.items(), key=lambda x: (-x[1][0], x[1][2]))
+        return [(pattern, entry[0]) for pattern, entry in top]
+
+def make_counter(mode:str, capacity:int=0, spillsize:int=1000000, tmpdir:str=None) -> Any:
+    """
+    Erzeugt einen Pattern-Zähler für den gewünschten Zählmodus.
+
+    :param mode: 'stream' (exakt im Arbeitsspeicher), 'spill' (exakt mit Auslagerung auf die Festplatte) oder 'approx' (Space-Saving mit fester Größe)
+    :param capacity: Größe des Space-Saving-Zählers
+    :param spillsize: Höchstzahl verschiedener Patterns im Arbeitsspeicher im Modus 'spill'
+    :param tmpdir: Verzeichnis für temporäre Dateien im Modus 'spill'
+    """
+    if mode == 'stream':
+        return StreamCounter()
+    if mode == 'spill':
+        return SpillCounter(spillsize, tmpdir)
+    if mode == 'approx':
+        return SpaceSavingCounter(capacity)
+    raise ValueError("Unbekannter Zählmodus: " + mode)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2022 franka.beyer@fau.de
+
+from collections import Counter
+from itertools import accumulate, chain
+from typing import List, Iterable
+
+BITS = 32                              #Bits je Token in einem Pattern-Schlüssel
+MASK = (1 << BITS) - 1
+WILDCARD = 1                           #Token-ID von '*'
+
+_steps_cache = {}
+
+def _bit_sequence(n:int) -> List[int]:
+    """
+    Gibt für 2^n - 1 Schritte des Zählens von 0 bis 2^n - 1 jeweils den Index des Bits zurück, das dabei gesetzt wird (Anzahl der nachfolgenden Einsen).
+
+    :param n: Anzahl der Bits
+    """
+    seq = _steps_cache.get(n)
+    if seq is None:
+        seq = [(m & -m).bit_length() - 1 for m in range(1, 1 << n)]
+        _steps_cache[n] = seq
+    return seq
+
+class PatternEncoder:
+    """
+    Bildet Tokens auf ganzzahlige IDs ab und Patterns auf ganzzahlige Schlüssel. Ein Schlüssel enthält die Token-IDs eines Patterns in Blöcken zu je BITS Bits, das erste Token in den niedrigsten Bits. Da alle IDs größer als 0 sind, ist die Länge eines Patterns im Schlüssel eindeutig enthalten.
+    Ein wörtliches '*' im Text erhält die ID des Platzhalters, da es als String von diesem nicht zu unterscheiden ist.
+    """
+    def __init__(self):
+        self.tokens = [None, "*", "X", "Y", ""]
+        self.ids = {t: i for i, t in enumerate(self.tokens) if t is not None}
+        self.fixed = (self.ids["X"], self.ids["Y"])
+        self.empty_key = self.ids[""]                     #Schlüssel des leeren Patterns, das aus leeren Zeilen entsteht
+
+    def encode_tokens(self, tokens:List[str]) -> List[int]:
+        """
+        Gibt die IDs einer Liste von Tokens zurück und vergibt dabei neue IDs für unbekannte Tokens.
+
+        :param tokens: Liste von Tokens als Strings
+        """
+        ids = self.ids
+        res = []
+        for t in tokens:
+            i = ids.get(t)
+            if i is None:
+                i = len(self.tokens)
+                ids[t] = i
+                self.tokens.append(t)
+            res.append(i)
+        return res
+
+    def register(self, tokens:Iterable[str]) -> None:
+        """
+        Vergibt IDs für alle noch unbekannten Tokens, z.B. um vor dem Verteilen auf mehrere Prozesse ein vollständiges Vokabular anzulegen.
+
+        :param tokens: Tokens als Strings
+        """
+        ids = self.ids
+        for t in tokens:
+            if t not in ids:
+                ids[t] = len(self.tokens)
+                self.tokens.append(t)
+
+    def line_patterns(self, ids:List[int]) -> List[int]:
+        """
+        Erzeugt die Schlüssel sämtlicher Patterns einer Zeile in derselben Reihenfolge wie vary(). Jedes Pattern entspricht einer Bitmaske über die Positionen, die nicht X oder Y sind; die Masken werden der Reihe nach hochgezählt, wobei jeder Schritt den Schlüssel um eine vorberechnete Differenz verändert.
+
+        :param ids: Token-IDs einer Zeile
+        """
+        base = 0
+        free = []
+        for p, i in enumerate(ids):
+            if i in self.fixed:
+                base |= i << (BITS * p)
+            else:
+                base |= WILDCARD << (BITS * p)
+                free.append(p)
+        n = len(free)
+        deltas = [(ids[p] - WILDCARD) << (BITS * p) for p in reversed(free)]   #Bit b steht für die Position free[n-1-b]
+        steps = []
+        prefix = 0
+        for d in deltas:
+            steps.append(d - prefix)
+            prefix += d
+        return list(accumulate(chain([base], map(steps.__getitem__, _bit_sequence(n)))))     #ohne initial=, das erst Python 3.8 kennt
+
+    def patternize(self, musterliste:List[str]) -> Counter:
+        """
+        Entspricht Counter(patternize(musterliste)), zählt aber ganzzahlige Schlüssel statt Strings.
+
+        :param musterliste: Liste lemmatisierter CQP-Ergebniszeilen, in denen das Wortpaar durch X und Y ersetzt wurde
+        """
+        c = Counter()
+        for line in musterliste:
+            c.update(self.line_patterns(self.encode_tokens(line.split(" "))))
+        return c
+
+    def decode(self, key:int) -> str:
+        """
+        Gibt das Pattern zu einem Schlüssel als String zurück.
+
+        :param key: Pattern-Schlüssel
+        """
+        res = []
+        while key:
+            res.append(self.tokens[key & MASK])
+            key >>= BITS
+        return " ".join(res)
+
+    def decode_all(self, keys:List[int]) -> List[str]:
+        """
+        Gibt die Patterns zu einer Liste von Schlüsseln als Strings zurück.
+
+        :param keys: Liste von Pattern-Schlüsseln
+        """
+        return [self.decode(key) for key in keys]
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2022 franka.beyer@fau.de
+
+import heapq
+from collections import Counter
+from typing import List, Dict, Tuple, Iterable, Any
+import numpy
+from PatternEncoding import PatternEncoder, BITS, MASK, WILDCARD
+
+SMALL = 64                             #ab so vielen Zeilen werden die Verlängerungen mit NumPy bestimmt
+
+class LengthGroup:
+    """
+    Alle Zeilen einer Länge als Matrix von Token-IDs in der Reihenfolge, in der sie dem PatternMiner übergeben wurden.
+
+    :param index: Nummern der Zeilen über alle Wortpaare
+    :param owner: Nummer des Wortpaares je Zeile
+    :param matrix: Token-IDs, eine Zeile je Ergebniszeile
+    :param fixed: IDs von X und Y
+    """
+    def __init__(self, index:List[int], owner:List[int], matrix:List[List[int]], fixed:Tuple[int, int]):
+        self.index = numpy.array(index, dtype=numpy.int64)
+        self.owner = numpy.array(owner, dtype=numpy.int64)
+        self.matrix = numpy.array(matrix, dtype=numpy.int64).reshape(len(index), -1)
+        self.length = self.matrix.shape[1]
+        self.free = ~numpy.isin(self.matrix, fixed)                     #Positionen, an denen vary() '*' einsetzt
+        self.weight = numpy.left_shift(1, (self.matrix == WILDCARD).sum(axis=1)).astype(numpy.int64)  #ein wörtliches '*' ergibt jedes Pattern zweimal
+        self.after = numpy.zeros((len(index), self.length + 1), dtype=numpy.int64)  #Anzahl freier Positionen ab p
+        self.after[:, :-1] = numpy.cumsum(self.free[:, ::-1], axis=1)[:, ::-1]
+        self.total = int(self.weight.sum())
+        self.rows = self.matrix.tolist()                 #für kleine Mengen von Zeilen ohne NumPy
+        self.weights = self.weight.tolist()
+        self.indices = self.index.tolist()
+        self.afters = self.after.tolist()
+
+class PatternMiner:
+    """
+    Exakter Miner der häufigsten Patterns, ohne alle 2^n Patterns jeder Zeile zu erzeugen. Patterns werden von links nach rechts Position für Position verlängert; zu jedem Anfang werden die Zeilen mitgeführt, auf die er passt, und seine Häufigkeit ist die Summe ihrer Gewichte. Da ein konkretes Token statt '*' die Häufigkeit nie erhöht, wird ein Anfang verworfen, sobald er das schwächste der bisher besten n Patterns nicht mehr übertreffen kann.
+    Bei gleicher Häufigkeit gilt wie bei StreamCounter die Reihenfolge des ersten Auftretens, also die erste passende Zeile und darin die Reihenfolge von vary(). most_common() gleicht daher dem von StreamCounter nach patternize_and_count() mit demselben PatternEncoder.
+
+    :param encoder: PatternEncoder, dessen IDs die Zeilen verwenden
+    """
+    exact = True
+
+    def __init__(self, encoder:PatternEncoder):
+        self.encoder = encoder
+        self.pairs = []
+        self.lines = {}                                  #Länge -> (Zeilennummern, Wortpaare, Token-IDs)
+        self.nlines = 0
+        self.visited = 0
+        self.top = None
+        self.mined = 0
+        self.groups = None
+
+    def add(self, pair:str, lines:Iterable[List[int]]) -> None:
+        """
+        Übernimmt die Zeilen eines Wortpaares als Token-IDs des PatternEncoder, z.B. von TokenTable.line_ids().
+
+        :param pair: Wortpaar der Form <Wort1>:<Wort2>
+        :param lines: Zeilen nach celex_lemmatize() und x_y_out() als Listen von Token-IDs
+        """
+        owner = len(self.pairs)
+        self.pairs.append(pair)
+        for ids in lines:
+            index, owners, matrix = self.lines.setdefault(len(ids), ([], [], []))
+            index.append(self.nlines)
+            owners.append(owner)
+            matrix.append(ids)
+            self.nlines += 1
+
+    def _groups(self) -> List[LengthGroup]:
+        if self.groups is None:
+            self.groups = [LengthGroup(*self.lines[n], self.encoder.fixed) for n in sorted(self.lines)]
+            self.groups.sort(key=lambda g: -g.total)     #häufige Längen zuerst, damit die Schwelle früh steigt
+            self.lines = {}
+        return self.groups
+
+    def _children(self, group:LengthGroup, p:int, rows:Any, prefix:int) -> List[Tuple[int, Any, int, int]]:
+        """
+        Gibt die Verlängerungen eines Pattern-Anfangs um Position p zurück, je als Häufigkeit, passende Zeilen, Token-ID und Rang in der Reihenfolge von vary(), nach Häufigkeit absteigend. Wenige Zeilen werden als Liste ohne NumPy verarbeitet.
+        """
+        if len(rows) < SMALL:
+            return self._small_children(group, p, rows, prefix)
+        col = group.matrix[rows, p]
+        weight = group.weight[rows]
+        values, inverse = numpy.unique(col, return_inverse=True)
+        supports = numpy.bincount(inverse, weights=weight).astype(numpy.int64).tolist()
+        free = group.free[rows, p]
+        res = []
+        if free.any():
+            star = rows[free]
+            res.append((int(weight[free].sum()), star, WILDCARD, prefix * 2))
+        for v, s in zip(values.tolist(), supports):
+            if v == WILDCARD:                            #wörtliches '*' ist schon im Platzhalter enthalten
+                continue
+            sel = rows[col == v]
+            res.append((s, sel, v, prefix if v in self.encoder.fixed else prefix * 2 + 1))
+        res.sort(key=lambda c: -c[0])
+        return [(s, sel.tolist() if len(sel) < SMALL else sel, v, rank) for s, sel, v, rank in res]
+
+    def _small_children(self, group:LengthGroup, p:int, rows:List[int], prefix:int) -> List[Tuple[int, List[int], int, int]]:
+        fixed = self.encoder.fixed
+        lines = group.rows
+        weights = group.weights
+        star = []
+        starsupport = 0
+        values = {}
+        for r in rows:
+            v = lines[r][p]
+            if v not in fixed:
+                star.append(r)
+                starsupport += weights[r]
+                if v == WILDCARD:
+                    continue
+            entry = values.get(v)
+            if entry is None:
+                values[v] = [weights[r], [r]]
+            else:
+                entry[0] += weights[r]
+                entry[1].append(r)
+        res = [(s, sel, v, prefix if v in fixed else prefix * 2 + 1) for v, (s, sel) in values.items()]
+        if star:
+            res.append((starsupport, star, WILDCARD, prefix * 2))
+        res.sort(key=lambda c: -c[0])
+        return res
+
+    def _search(self, group:LengthGroup, p:int, rows:Any, support:int, key:int, prefix:int, heap:List[Tuple[int, int, int, int]], n:int) -> None:
+        self.visited += 1
+        if p == group.length:
+            if key == self.encoder.empty_key:
+                return
+            item = (support, -group.indices[rows[0]], -prefix, key)
+            if len(heap) < n:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+            return
+        for s, sel, token, rank in self._children(group, p, rows, prefix):
+            if len(heap) >= n:                           #beste mögliche Fortsetzung: gleiche Häufigkeit, erste Zeile, Rest '*'
+                first = sel[0]
+                if (s, -group.indices[first], -(rank << group.afters[first][p + 1])) < heap[0][:3]:
+                    continue
+            self._search(group, p + 1, sel, s, key | (token << (BITS * p)), rank, heap, n)
+
+    def most_common(self, n:int) -> List[Tuple[int, int]]:
+        """
+        Gibt die n häufigsten Patterns als Schlüssel des PatternEncoder mit ihren Häufigkeiten zurück.
+
+        :param n: Anzahl der zurückzugebenden Patterns
+        """
+        if self.top is None or n > self.mined:
+            heap = []
+            if n > 0:
+                for group in self._groups():
+                    rows = numpy.arange(len(group.index))
+                    self._search(group, 0, rows, group.total, 0, 0, heap, n)
+            self.top = [(key, support) for support, first, rank, key in sorted(heap, reverse=True)]
+            self.mined = n
+        return self.top[:n]
+
+    def pair_counters(self, keys:List[int]) -> Dict[str, Counter]:
+        """
+        Zählt die gegebenen Patterns je Wortpaar, indem nur die Anfänge dieser Patterns verlängert werden. Gibt Wortpaar-Counter(Patterns)-Dictionary mit allen Wortpaaren zurück, wie es generate_feature_matrix() erwartet.
+
+        :param keys: Schlüssel der Patterns, z.B. aus most_common()
+        """
+        counters = {pair: Counter() for pair in self.pairs}
+        tries = {}
+        for key in keys:
+            tokens = []
+            while key:
+                tokens.append(key & MASK)
+                key >>= BITS
+            node = tries.setdefault(len(tokens), {})
+            for t in tokens:
+                node = node.setdefault(t, {})
+        for group in self._groups():
+            trie = tries.get(group.length)
+            if trie:
+                self._count(group, 0, numpy.arange(len(group.index)), 0, trie, counters)
+        return counters
+
+    def _count(self, group:LengthGroup, p:int, rows:Any, key:int, node:Dict[int, Any], counters:Dict[str, Counter]) -> None:
+        if p == group.length:
+            owners, inverse = numpy.unique(group.owner[rows], return_inverse=True)
+            counts = numpy.bincount(inverse, weights=group.weight[rows]).astype(numpy.int64)
+            for o, c in zip(owners.tolist(), counts.tolist()):
+                counters[self.pairs[o]][key] = c
+            return
+        col = group.matrix[rows, p]
+        for token, child in node.items():
+            sel = rows[group.free[rows, p]] if token == WILDCARD else rows[col == token]
+            if len(sel):
+                self._count(group, p + 1, sel, key | (token << (BITS * p)), child, counters)
@@ -12,25 +12,34 @@ import regex as re
 from collections import Counter
 import os
 import threading
+import time
 import click
-from typing import List, Dict, Tuple, Any
+from typing import List, Dict, Tuple, Any, Callable
+from CQPRunner import CQPPool
+from CorpusIndex import CorpusIndex, build_index
+from CQPScheduler import CQPScheduler
+from ResultStore import ResultStore
+from Manifest import Manifest
+from QueryCache import QueryCache
+from CorpusLexicon import CorpusLexicon, read_lexdecode, read_index_lexicon, lexdecode_signature, index_signature
+from PatternCache import file_hash
+from Lexicon import Lexicon, is_lexicon
+from Profiling import PROFILER, profile_options
 
 def celex_generate(wordlist:List[List[str]], lemform:Dict[str, str]) -> Dict[str, List[List[str]]]:
     """
     Nimmt Liste von Listen von Wortpaaren als Strings entgegen. Prodziert Dictionary mit Wortpaar als Key und Liste von Listen von Wortpaaren, die sämtliche Kombinationen der morphologischen Formen der Wortpaare abdecken.
 
     :param wordlist: Liste von Listen von Wortpaaren als Strings
-    :param lemform: Dictionary, das Lemmata zu den zugehörigen Wortformen mappt
+    :param lemform: Dictionary, das Lemmata zu den zugehörigen Wortformen mappt, oder Lexicon.lemmaform
     """
     d = {}
     for e in wordlist:
-        if e[0] in lemform:
-            l1 = lemform[e[0]]
-        else:
+        l1 = lemform.get(e[0])
+        if l1 is None:
             l1 = [e[0]]
-        if e[1] in lemform:
-            l2 = lemform[e[1]]
-        else:
+        l2 = lemform.get(e[1])
+        if l2 is None:
             l2 = [e[1]]
         h = []
         for x in l1:
@@ -42,51 +51,408 @@ def celex_generate(wordlist:List[List[str]], lemform:Dict[str, str]) -> Dict[str
         d[":".join(e)] = h
     return d
 
-def write_cqp_scripts(forms:Dict[str, List[List[str]]], corpusname:str) -> Tuple[List[str], List[str]]: 
+def make_query(x:str, y:str) -> str:
+    """
+    Gibt die CQP-Anfrage nach zwei Wortformen im Abstand von höchstens drei Wörtern zurück, deren Ergebnis unter dem Namen rs gespeichert wird.
+
+    :param x: erste Wortform
+    :param y: zweite Wortform
+    """
+    return 'rs  = []? "' + x + '" []{0,3} "' + y + '" [];' #hier abweichend vom Vorlagepaper mit erzwungenem Wort am Schluss (vgl. Bericht)
+
+def cqp_escape(form:str) -> str:
+    """
+    Maskiert Zeichen, die in regulären Ausdrücken und Strings von CQP eine besondere Bedeutung haben, sodass die Wortform wörtlich gesucht wird.
+
+    :param form: Wortform
+    """
+    return re.sub(r'([\\.?*+|()\[\]{}^$"])', r'\\\1', form)
+
+def alternation(forms:List[str]) -> str:
+    """
+    Gibt einen regulären Ausdruck für CQP zurück, der auf jede der Wortformen passt.
+
+    :param forms: Liste von Wortformen
+    """
+    return "(" + "|".join(cqp_escape(x) for x in dict.fromkeys(forms)) + ")"
+
+def pair_queries(combinations:List[List[str]], querymode:str='combinations') -> List[str]:
+    """
+    Gibt die CQP-Anfragen für ein Wortpaar zurück: im Modus 'combinations' eine Anfrage je Kombination der morphologischen Formen, im Modus 'alternation' eine einzige Anfrage, die alle Formen beider Wörter als Alternativen enthält.
+    Die Treffer der einzelnen Anfrage entsprechen der Vereinigung der Treffer aller Kombinationen; nur wo mehrere Formen desselben Wortpaares in einem Fenster vorkommen, liefert sie für dieses Fenster nur den kürzesten Treffer statt einen je Kombination.
+
+    :param combinations: Liste von Listen der möglichen Kombinationen der morphologischen Formen eines Wortpaares
+    :param querymode: 'combinations' oder 'alternation'
+    """
+    if querymode == 'combinations':
+        return [make_query(p[0], p[1]) for p in combinations]
+    if not combinations:
+        return []
+    return [make_query(alternation([p[0] for p in combinations]), alternation([p[1] for p in combinations]))]
+
+def make_packs(forms:Dict[str, List[List[str]]], packsize:int) -> List[Tuple[List[str], str]]:
+    """
+    Fasst je packsize Wortpaare zu einer einzigen CQP-Anfrage zusammen, die alle ersten Formen und alle zweiten Formen der Wortpaare als Alternativen enthält. Gibt Liste von Tupeln aus den Wortpaaren und der Anfrage zurück.
+
+    :param forms: Dictionary mit Wortpaaren als Keys und Listen von Listen der möglichen Kombinationen der morphologischen Formen als Values
+    :param packsize: Anzahl der Wortpaare je Anfrage
+    """
+    keys = [e for e in forms.keys() if forms[e]]
+    packs = []
+    for i in range(0, len(keys), packsize):
+        group = keys[i:i+packsize]
+        xs = [p[0] for e in group for p in forms[e]]
+        ys = [p[1] for e in group for p in forms[e]]
+        packs.append((group, make_query(alternation(xs), alternation(ys))))
+    return packs
+
+def split_packed_hits(lines:List[str], group:List[str], forms:Dict[str, List[List[str]]]) -> Dict[str, List[str]]:
+    """
+    Verteilt die Ergebniszeilen einer zusammengefassten Anfrage aus make_packs() anhand der gefundenen Wortformen auf die Wortpaare. Eine Zeile gehört zu einem Wortpaar, wenn das vorletzte Token eine seiner zweiten Formen ist und höchstens drei Tokens davor eine seiner ersten Formen steht. Beginnt der Treffer wegen der ersten Form eines anderen Wortpaares früher, wird er so gekürzt, dass er wie bei der Anfrage für das Wortpaar allein mit dem Token vor der ersten Form beginnt. Gibt Wortpaar-Ergebniszeilen-Dictionary zurück.
+    Kommen Formen verschiedener Wortpaare derselben Anfrage in einem Fenster vor, kann dennoch ein Treffer verloren gehen, weil CQP je Fenster nur den kürzesten liefert.
+
+    :param lines: Ergebniszeilen der zusammengefassten Anfrage
+    :param group: Wortpaare der Anfrage
+    :param forms: Dictionary mit Wortpaaren als Keys und Listen von Listen der möglichen Kombinationen der morphologischen Formen als Values
+    """
+    sets = [(e, set(p[0] for p in forms[e]), set(p[1] for p in forms[e])) for e in group]
+    res = {e: [] for e in group}
+    for line in lines:
+        position, match = line.split(":", 1)
+        tokens = re.sub(r"[<>]", "", match).split()
+        for e, xs, ys in sets:
+            if len(tokens) < 3 or tokens[-2] not in ys:
+                continue
+            for i in range(max(0, len(tokens) - 6), len(tokens) - 2):
+                if tokens[i] in xs:
+                    start = max(0, i - 1)
+                    if start == 0:
+                        res[e].append(line)
+                    else:
+                        res[e].append("%8d: <%s>\n" % (int(position) + start, " ".join(tokens[start:])))
+                    break
+    return res
+
+def write_cqp_script(pair:str, combinations:List[List[str]], corpusname:str, querymode:str='combinations') -> Tuple[str, str]:
+    """
+    Schreibt das CQP-Script für ein Wortpaar, das der Reihe nach alle Anfragen aus pair_queries() stellt und die Ergebnisse in einer Datei sammelt. Gibt den Namen des Scripts und den Namen der Ergebnisdatei zurück.
+
+    :param pair: Wortpaar der Form <Wort1>:<Wort2>
+    :param combinations: Liste von Listen der möglichen Kombinationen der morphologischen Formen des Wortpaares
+    :param corpusname: Name bzw. Aktivierung des CQP-Korpus, das verwendet werden soll
+    :param querymode: 'combinations' für eine Anfrage je Kombination, 'alternation' für eine Anfrage je Wortpaar, siehe pair_queries()
+    """
+    lines = [corpusname, 'set Context 0;']
+    res = str(pair)
+    for s1 in pair_queries(combinations, querymode):
+        s2 = 'cat rs >> "' + res + ':.txt.data";'
+        lines.append(s1)
+        lines.append(s2)
+    name = res + '.script'
+    with open(name, 'w') as f:
+        for item in lines:
+            f.write("%s\n" % item)
+    return name, res + ':.txt.data'
+
+def write_cqp_scripts(forms:Dict[str, List[List[str]]], corpusname:str, querymode:str='combinations') -> Tuple[List[str], List[str]]: 
     """
     Nimmt Dictionary mit Wortpaaren als Keys und Listen von Listen der möglichen Kombinationen der morphologischen Formen entgegen. Schreibt für jedes Wortpaar ein CQP-Script, das der Reihe nach alle diese Kombinationen abfragt und die Ergebnisse in einer Datei je Wortpaar sammelt. Gibt die Namen der produzierten Scripte als Liste und die Namen der Ergebnisdateien als Liste zurück.
 
     :param forms: Dictionary mit Wortpaaren als Keys und Listen von Listen der möglichen Kombinationen der morphologischen Formen als Values
     :param corpusname: Name bzw. Aktivierung des CQP-Korpus, das verwendet werden soll
+    :param querymode: 'combinations' für eine Anfrage je Kombination, 'alternation' für eine Anfrage je Wortpaar, siehe pair_queries()
     """
     names = []
     files = []
     for e in forms.keys():
-        lines = [corpusname, 'set Context 0;']
-        res = str(e)
-        for p in forms[e]:
-            s1 = 'rs  = []? "' + p[0] + '" []{0,3} "' + p[1] + '" [];' #hier abweichend vom Vorlagepaper mit erzwungenem Wort am Schluss (vgl. Bericht)
-            s2 = 'cat rs >> "' + res + ':.txt.data";'
-            lines.append(s1)
-            lines.append(s2)
-        name = res + '.script'
-        with open(name, 'w') as f:
-            for item in lines:
-                f.write("%s\n" % item)
+        name, res = write_cqp_script(e, forms[e], corpusname, querymode)
         names.append(name)
-        files.append(res + ':.txt.data')
+        files.append(res)
     return names, files
 
+def write_packed_cqp_script(i:int, query:str, corpusname:str) -> Tuple[str, str]:
+    """
+    Schreibt das CQP-Script für die i-te zusammengefasste Anfrage aus make_packs(), das ihre Ergebnisse in einer eigenen Datei sammelt. Gibt den Namen des Scripts und den Namen der Ergebnisdatei zurück.
+
+    :param i: Nummer der Anfrage
+    :param query: zusammengefasste Anfrage
+    :param corpusname: Name bzw. Aktivierung des CQP-Korpus, das verwendet werden soll
+    """
+    name = 'pack' + str(i) + '.script'
+    res = 'pack' + str(i) + '.txt.pack'
+    with open(name, 'w') as f:
+        for item in [corpusname, 'set Context 0;', query, 'cat rs > "' + res + '";']:
+            f.write("%s\n" % item)
+    return name, res
+
+def write_packed_cqp_scripts(packs:List[Tuple[List[str], str]], corpusname:str) -> Tuple[List[str], List[str]]:
+    """
+    Schreibt für jede zusammengefasste Anfrage aus make_packs() ein CQP-Script, das ihre Ergebnisse in einer eigenen Datei sammelt. Gibt die Namen der Scripte und die Namen der Ergebnisdateien als Listen zurück.
+
+    :param packs: Liste von Tupeln aus Wortpaaren und Anfrage
+    :param corpusname: Name bzw. Aktivierung des CQP-Korpus, das verwendet werden soll
+    """
+    names = []
+    files = []
+    for i, (group, query) in enumerate(packs):
+        name, res = write_packed_cqp_script(i, query, corpusname)
+        names.append(name)
+        files.append(res)
+    return names, files
+
+QUERY_VERSION = "1"                               #bei Änderungen an make_query() oder celex_generate() erhöhen, damit das Manifest neu suchen lässt
 NPROCS=8                                          #Anzahl der Kerne, die für Multiprocessing zur Verfügung stehen
-def run_cqp_queries(nameslist:List[str]) -> None:
+def run_cqp_queries(nameslist:List[str], nprocs:int=NPROCS) -> List[int]:
     """
-    Führt mit Verwendung von threading und subprocess sämtliche CQP-Scripte aus einer Liste aus.
+    Führt mit Verwendung von threading und subprocess sämtliche CQP-Scripte aus einer Liste aus. Gibt die Rückgabewerte der CQP-Prozesse parallel zu nameslist zurück; ein Wert ungleich 0 bedeutet, dass das Script fehlschlug und seine Ergebnisdateien unvollständig sind oder fehlen.
 
     :param nameslist: Liste von Namen von CQP-Scripten
+    :param nprocs: Anzahl der gleichzeitig laufenden CQP-Prozesse
     """
-    sem = threading.Semaphore(NPROCS)
+    sem = threading.Semaphore(nprocs)
     t = []
-    def proc(s):
-        subprocess.call(s)
-        sem.release()
-    for e in nameslist:
+    codes = [0] * len(nameslist)
+    def proc(i, s):
+        start = time.perf_counter()
+        try:
+            codes[i] = subprocess.call(s)
+        except OSError:                           #cqp nicht gefunden oder nicht ausführbar
+            codes[i] = 127
+        finally:
+            sem.release()
+        PROFILER.observe("cqp_script_seconds", time.perf_counter() - start)
+    for i, e in enumerate(nameslist):
         sem.acquire()
         s = ['cqp','-f', e]
-        tt = threading.Thread(target=proc,args=(s,))
+        tt = threading.Thread(target=proc,args=(i, s))
         t.append(tt)
         tt.start()
     for tt in t:
         tt.join()
+    return codes
+
+def append_result(name:str, lines:List[str]) -> None:
+    """
+    Hängt Ergebniszeilen an eine Ergebnisdatei an und legt sie dabei an, falls es sie noch nicht gibt.
+
+    :param name: Name der Ergebnisdatei, <Wort1>:<Wort2>:.txt.data
+    :param lines: Ergebniszeilen im Format von 'cat' bei CQP
+    """
+    with open(name, 'a') as f:
+        f.writelines(lines)
+
+def run_cqp_pool(forms:Dict[str, List[List[str]]], corpusname:str, nprocs:int=NPROCS, command:str='cqp', querymode:str='combinations', packsize:int=50, write:Callable[[str, List[str]], None]=append_result) -> Tuple[List[str], List[str]]:
+    """
+    Alternative zu write_cqp_scripts() und run_cqp_queries(): Führt die Anfragen für alle Kombinationen der morphologischen Formen auf einem CQPPool aus langlebigen CQP-Prozessen aus, statt je Wortpaar ein Script zu schreiben und einen eigenen CQP-Prozess zu starten. Schreibt die Ergebnisse wie diese in eine Datei je Wortpaar. Gibt die Namen der Ergebnisdateien als Liste und die Wortpaare, deren Anfragen fehlschlugen, als Liste zurück.
+
+    :param forms: Dictionary mit Wortpaaren als Keys und Listen von Listen der möglichen Kombinationen der morphologischen Formen als Values
+    :param corpusname: Name bzw. Aktivierung des CQP-Korpus, das verwendet werden soll
+    :param nprocs: Anzahl der CQP-Prozesse
+    :param command: Befehl zum Starten von CQP
+    :param querymode: 'combinations' oder 'alternation' wie bei pair_queries(), 'packed' für eine Anfrage je packsize Wortpaare wie bei make_packs()
+    :param packsize: Anzahl der Wortpaare je Anfrage im Modus 'packed'
+    :param write: Funktion, die die Ergebniszeilen eines Wortpaares unter dem Namen seiner Ergebnisdatei ablegt, z.B. append_result() oder ResultStore.append()
+    """
+    def sink(pair, results):
+        write(pair + ':.txt.data', [line for lines in results for line in lines])
+    if querymode == 'packed':
+        packs = make_packs(forms, packsize)
+        def packsink(i, results):
+            for pair, lines in split_packed_hits(results[0], packs[i][0], forms).items():
+                sink(pair, [lines])
+        failed = CQPPool(nprocs, corpusname, command).run([(i, [pack[1]]) for i, pack in enumerate(packs)], packsink)
+        failed = [pair for i in failed for pair in packs[i][0]]
+    else:
+        jobs = [(e, pair_queries(forms[e], querymode)) for e in forms.keys()]
+        failed = CQPPool(nprocs, corpusname, command).run(jobs, sink)
+    return [e + ':.txt.data' for e in forms.keys()], failed
+
+def run_index_queries(forms:Dict[str, List[List[str]]], index:CorpusIndex, querymode:str='combinations', write:Callable[[str, List[str]], None]=append_result) -> List[str]:
+    """
+    Alternative zu CQP: Beantwortet die Anfragen für alle Wortpaare mit einem CorpusIndex im eigenen Prozess und schreibt die Ergebnisse im Format von CQP in eine Datei je Wortpaar. Gibt die Namen der Ergebnisdateien als Liste zurück.
+
+    :param forms: Dictionary mit Wortpaaren als Keys und Listen von Listen der möglichen Kombinationen der morphologischen Formen als Values
+    :param index: geöffneter CorpusIndex des Korpus
+    :param querymode: 'combinations' für eine Anfrage je Kombination der Formen, 'alternation' und 'packed' für eine Anfrage je Wortpaar über alle Formen
+    :param write: Funktion, die die Ergebniszeilen eines Wortpaares ablegt, siehe run_cqp_pool()
+    """
+    names = []
+    for e in forms.keys():
+        if querymode == 'combinations':
+            hits = [h for p in forms[e] for h in index.window_query([p[0]], [p[1]])]
+        else:
+            hits = index.window_query([p[0] for p in forms[e]], [p[1] for p in forms[e]])
+        write(e + ':.txt.data', index.lines(hits))
+        names.append(e + ':.txt.data')
+    return names
+
+def collect_packed_hits(forms:Dict[str, List[List[str]]], packs:List[Tuple[List[str], str]], pnames:List[str], write:Callable[[str, List[str]], None]=append_result) -> List[str]:
+    """
+    Verteilt die Ergebnisse der zusammengefassten Anfragen aus make_packs() mit split_packed_hits() auf Ergebnisdateien je Wortpaar und löscht die Ergebnisdateien der Anfragen. Gibt die Namen der Ergebnisdateien je Wortpaar als Liste zurück.
+
+    :param forms: Dictionary mit Wortpaaren als Keys und Listen von Listen der möglichen Kombinationen der morphologischen Formen als Values
+    :param packs: Liste von Tupeln aus Wortpaaren und Anfrage
+    :param pnames: Namen der Ergebnisdateien der Anfragen, parallel zu packs
+    :param write: Funktion, die die Ergebniszeilen eines Wortpaares ablegt, siehe run_cqp_pool()
+    """
+    rnames = [e + ':.txt.data' for e in forms.keys()]
+    for (group, query), pname in zip(packs, pnames):
+        try:
+            with open(pname) as f:
+                hits = split_packed_hits(f.readlines(), group, forms)
+        except FileNotFoundError:
+            continue
+        os.remove(pname)
+        for pair, lines in hits.items():
+            write(pair + ':.txt.data', lines)
+    return rnames
+
+def run_cqp_async(forms:Dict[str, List[List[str]]], corpusname:str, scheduler:CQPScheduler, querymode:str='combinations', packsize:int=50, write:Callable[[str, List[str]], None]=append_result) -> Tuple[List[str], List[str], Dict[str, str]]:
+    """
+    Alternative zu run_cqp_queries(): Führt die CQP-Scripte mit einem CQPScheduler aus, mit Zeitbeschränkung und Wiederholung fehlgeschlagener Scripte. Die Scripte werden erst geschrieben, wenn der Scheduler sie anfordert. Gibt die Namen der Scripte und der Ergebnisdateien als Listen sowie die Wortpaare, deren Anfragen endgültig fehlschlugen, als Dictionary mit dem Grund zurück.
+
+    :param forms: Dictionary mit Wortpaaren als Keys und Listen von Listen der möglichen Kombinationen der morphologischen Formen als Values
+    :param corpusname: Name bzw. Aktivierung des CQP-Korpus, das verwendet werden soll
+    :param scheduler: CQPScheduler, der die Scripte ausführt
+    :param querymode: 'combinations', 'alternation' oder 'packed' wie bei prepare_cqp()
+    :param packsize: Anzahl der Wortpaare je Anfrage im Modus 'packed'
+    :param write: Funktion, die die aufgeteilten Ergebniszeilen im Modus 'packed' ablegt, siehe run_cqp_pool()
+    """
+    snames = []
+    if querymode == 'packed':
+        packs = make_packs(forms, packsize)
+        pnames = []
+        def packjobs():
+            for i, (group, query) in enumerate(packs):
+                name, res = write_packed_cqp_script(i, query, corpusname)
+                snames.append(name)
+                pnames.append(res)
+                yield i, name, [res]
+        failures = scheduler.run(packjobs())
+        failed = {pair: failures[i] for i in failures for pair in packs[i][0]}
+        rnames = collect_packed_hits(forms, packs, pnames, write)
+    else:
+        rnames = []
+        def jobs():
+            for e in forms.keys():
+                name, res = write_cqp_script(e, forms[e], corpusname, querymode)
+                snames.append(name)
+                rnames.append(res)
+                yield e, name, [res]
+        failed = scheduler.run(jobs())
+    return snames, rnames, failed
+
+def write_part_script(pair:str, combinations:List[Tuple[str, str]], corpusname:str) -> Tuple[str, List[str]]:
+    """
+    Schreibt ein CQP-Script, das die Anfragen für einzelne Kombinationen von Wortformen stellt und die Ergebnisse jeder Anfrage in eine eigene Datei schreibt. Gibt den Namen des Scripts und die Namen der Ergebnisdateien, parallel zu combinations, zurück.
+
+    :param pair: Wortpaar, nach dem Script und Ergebnisdateien benannt werden
+    :param combinations: Liste von Tupeln aus erster und zweiter Wortform
+    :param corpusname: Name bzw. Aktivierung des CQP-Korpus, das verwendet werden soll
+    """
+    lines = [corpusname, 'set Context 0;']
+    parts = []
+    for i, (x, y) in enumerate(combinations):
+        part = pair + ':' + str(i) + '.txt.part'
+        lines.append(make_query(x, y))
+        lines.append('cat rs > "' + part + '";')
+        parts.append(part)
+    name = pair + '.script'
+    with open(name, 'w') as f:
+        for item in lines:
+            f.write("%s\n" % item)
+    return name, parts
+
+def run_cached_queries(forms:Dict[str, List[List[str]]], cache:QueryCache, runner:str, corpusname:str, nprocs:int=NPROCS, command:str='cqp', index:CorpusIndex=None, scheduler:CQPScheduler=None, write:Callable[[str, List[str]], None]=append_result) -> Tuple[List[str], List[str], Dict[str, str]]:
+    """
+    Stellt die Anfragen je Kombination der morphologischen Formen wie im Modus 'combinations', aber jede Kombination nur einmal und nur, wenn ihre Treffer nicht schon im QueryCache stehen. Die Anfragen, die fehlen, werden je Wortpaar, das sie zuerst braucht, mit dem angegebenen runner gestellt und im Cache gespeichert. Die Ergebnisse jedes Wortpaares werden danach aus den Einträgen seiner Kombinationen in deren Reihenfolge zusammengesetzt. Gibt die Namen der Scripte und der Ergebnisdateien als Listen sowie die Wortpaare, deren Anfragen fehlschlugen, als Dictionary mit dem Grund zurück.
+
+    :param forms: Dictionary mit Wortpaaren als Keys und Listen von Listen der möglichen Kombinationen der morphologischen Formen als Values
+    :param cache: QueryCache
+    :param runner: 'scripts', 'pool', 'async' oder 'index' wie bei prepare_cqp()
+    :param corpusname: Name bzw. Aktivierung des CQP-Korpus, das verwendet werden soll
+    :param nprocs: Anzahl der gleichzeitig laufenden CQP-Prozesse
+    :param command: Befehl zum Starten von CQP
+    :param index: geöffneter CorpusIndex im Modus 'index'
+    :param scheduler: CQPScheduler im Modus 'async'
+    :param write: Funktion, die die Ergebniszeilen eines Wortpaares ablegt, siehe run_cqp_pool()
+    """
+    combos = {e: [(p[0], p[1]) for p in forms[e]] for e in forms.keys()}
+    found = cache.get_many(c for e in combos for c in combos[e])
+    owners = {}                                       #Wortpaar, das eine fehlende Kombination zuerst braucht
+    for e in combos:
+        for c in combos[e]:
+            if c not in found and c not in owners:
+                owners[c] = e
+    groups = {}
+    for c, e in owners.items():
+        groups.setdefault(e, []).append(c)
+    snames = []
+    failedcombos = {}
+    if runner == 'index':
+        for c in owners:
+            found[c] = index.lines(index.window_query([c[0]], [c[1]]))
+    elif runner == 'pool':
+        def sink(c, results):
+            found[c] = results[0]
+        for c in CQPPool(nprocs, corpusname, command).run([(c, [make_query(c[0], c[1])]) for c in owners], sink):
+            failedcombos[c] = "CQP-Prozess wurde unerwartet beendet"
+    else:
+        parts = {}
+        def jobs():
+            for e, cs in groups.items():
+                name, partnames = write_part_script(e, cs, corpusname)
+                snames.append(name)
+                parts[e] = partnames
+                yield e, name, partnames
+        if runner == 'async':
+            failures = scheduler.run(jobs())
+        else:
+            batch = list(jobs())
+            codes = run_cqp_queries([name for e, name, partnames in batch], nprocs)
+            failures = {e: "Rückgabewert " + str(code) for (e, name, partnames), code in zip(batch, codes) if code}  #nie als Anfragen ohne Treffer in den Cache
+        for e, cs in groups.items():
+            for c, part in zip(cs, parts.get(e, [])):
+                if e in failures:
+                    failedcombos[c] = failures[e]
+                    if os.path.exists(part):          #unvollständige Ergebnisse eines abgebrochenen Scripts
+                        os.remove(part)
+                    continue
+                try:
+                    with open(part) as f:
+                        found[c] = f.readlines()
+                    os.remove(part)
+                except FileNotFoundError:
+                    found[c] = []                     #CQP legt für Anfragen ohne Treffer keine Datei an
+    for c in owners:
+        if c in found:
+            cache.put(c, found[c])
+    cache.commit()
+    rnames = []
+    failed = {}
+    for e in combos:
+        reasons = [failedcombos[c] for c in combos[e] if c in failedcombos]
+        if reasons:
+            failed[e] = reasons[0]
+        write(e + ':.txt.data', [line for c in combos[e] for line in found.get(c, [])])
+        rnames.append(e + ':.txt.data')
+    return snames, rnames, failed
+
+def move_to_store(names:List[str], store:ResultStore) -> None:
+    """
+    Übernimmt die Ergebnisdateien, die CQP-Scripte geschrieben haben, in einen ResultStore und löscht sie.
+
+    :param names: Namen der Ergebnisdateien
+    :param store: ResultStore
+    """
+    for name in names:
+        try:
+            with open(name) as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            continue
+        store.append(name, lines)
+        os.remove(name)
 
 def read_in_cqp_result_extra(file:str) -> Any:
     """
@@ -102,69 +468,318 @@ def read_in_cqp_result_extra(file:str) -> Any:
     else:
         return s.st_size > 0
 
-def prepare_cqp(chunk:List[List[str]], lemmaform:Dict[str, str], corpusname:str) -> Tuple[List[str], List[List[str]]]:
+def observe_queries(forms:Dict[str, List[List[str]]], querymode:str='combinations', packsize:int=50) -> None:
+    """
+    Hält für --profile die Anzahl der CQP-Anfragen je Wortpaar fest. Im Modus 'packed' teilen sich die Wortpaare eines Pakets eine Anfrage.
+
+    :param forms: Dictionary mit Wortpaaren als Keys und Listen von Listen der möglichen Kombinationen der morphologischen Formen als Values
+    :param querymode: 'combinations', 'alternation' oder 'packed' wie bei prepare_cqp()
+    :param packsize: Anzahl der Wortpaare je Anfrage im Modus 'packed'
+    """
+    if querymode == 'packed':
+        for group, query in make_packs(forms, packsize):
+            for e in group:
+                PROFILER.observe("queries_per_pair", 1 / len(group))
+        return
+    for e in forms.keys():
+        PROFILER.observe("queries_per_pair", len(pair_queries(forms[e], querymode)))
+
+def observe_hits(names:List[str], store:ResultStore=None) -> None:
+    """
+    Hält für --profile die Anzahl der Treffer je Wortpaar fest, gezählt als Zeilen der Ergebnisdateien bzw. der Ergebnisse im ResultStore.
+
+    :param names: Namen der Ergebnisdateien der Wortpaare
+    :param store: ResultStore, in dem die Ergebnisse abgelegt sind
+    """
+    if store is not None:
+        hits = {name: content.count("\n") for name, content in store.iter_results(names)}
+    else:
+        hits = {}
+        for name in names:
+            if os.path.exists(name):
+                with open(name) as f:
+                    hits[name] = sum(1 for _ in f)
+    for name in names:
+        PROFILER.observe("hits_per_pair", hits.get(name, 0))
+
+def prepare_cqp(chunk:List[List[str]], lemmaform:Dict[str, str], corpusname:str, runner:str='scripts', nprocs:int=NPROCS, command:str='cqp', querymode:str='combinations', packsize:int=50, index:CorpusIndex=None, scheduler:CQPScheduler=None, store:ResultStore=None, cache:QueryCache=None, lexicon:CorpusLexicon=None) -> Tuple[List[str], List[List[str]], List[List[str]]]:
     """
-    Nimmt Liste von Wortpaaren entgegen. Generiert mit Hilfe von CELEX alle bekannten morphologischen Varianten für jedes Paar. Schreibt die CQP-Scirpte für die einzelenen Paare. Führt diese Scripte aus. Ermittelt, für welche Wortpaare im Korpus Ergebnisse gefunden wurden. Löscht alle entstandene leere Ergebnisdateien. Gibt eine Liste der Wortpaare, die nicht gefunden wurden, und eine Liste der Namen der Ergebnisdateien mit Inhalt zurück.
+    Nimmt Liste von Wortpaaren entgegen. Generiert mit Hilfe von CELEX alle bekannten morphologischen Varianten für jedes Paar. Schreibt die CQP-Scirpte für die einzelenen Paare. Führt diese Scripte aus. Ermittelt, für welche Wortpaare im Korpus Ergebnisse gefunden wurden. Löscht alle entstandene leere Ergebnisdateien. Gibt eine Liste der Namen der Ergebnisdateien mit Inhalt, eine Liste der Wortpaare, die nicht gefunden wurden, und eine Liste der Wortpaare, deren Anfragen fehlschlugen, zurück. Fehlgeschlagene Wortpaare werden nicht als nicht gefunden gezählt, damit sie später erneut gesucht werden können.
 
     :param chunk: Liste von Wortpaaren, je als Liste
     :param lemmaform: Lemma-Wortformen-Dictionary
     :param corpusname: Name bzw. Aktivierung des CQP-Korpus, das verwendet werden soll
+    :param runner: 'scripts' für ein CQP-Script und einen CQP-Prozess je Wortpaar, 'pool' für einen CQPPool aus nprocs langlebigen CQP-Prozessen, 'index' für Anfragen an index statt an CQP, 'async' für CQP-Scripte, die scheduler ausführt
+    :param nprocs: Anzahl der gleichzeitig laufenden CQP-Prozesse
+    :param command: Befehl zum Starten von CQP im Modus 'pool'
+    :param querymode: 'combinations' für eine Anfrage je Kombination der Formen, 'alternation' für eine Anfrage je Wortpaar, 'packed' für eine Anfrage je packsize Wortpaare
+    :param packsize: Anzahl der Wortpaare je Anfrage im Modus 'packed'
+    :param index: geöffneter CorpusIndex im Modus 'index'
+    :param scheduler: CQPScheduler im Modus 'async'
+    :param store: ResultStore, in dem die Ergebnisse statt in einer Datei je Wortpaar abgelegt werden; bisherige Ergebnisse der Wortpaare werden wie bei den Dateien ersetzt
+    :param cache: QueryCache, aus dem schon gestellte Anfragen beantwortet werden; nur im Modus 'combinations'
+    :param lexicon: CorpusLexicon, mit dem Kombinationen von Formen, die im Korpus nicht vorkommen, vor der Suche verworfen werden; Wortpaare ohne verbleibende Kombination kommen ohne Anfrage auf die Blacklist
     """
     results = []
     blacklisted = []
-    forms = celex_generate(chunk, lemmaform)
-    snames, rnames = write_cqp_scripts(forms, corpusname)
-    run_cqp_queries(snames)
-    for name in rnames:
-        indicator = read_in_cqp_result_extra(name)
-        if indicator:
-            results.append(name)
+    failed = {}
+    with PROFILER.stage("celex_generate"):
+        forms = celex_generate(chunk, lemmaform)
+    order = {e: i for i, e in enumerate(forms.keys())}
+    if lexicon is not None:
+        with PROFILER.stage("prune"):
+            forms, empty = lexicon.prune(forms)
+        for e in empty:
+            if os.path.exists(e + ':.txt.data'):
+                os.remove(e + ':.txt.data')
+        if store is not None:
+            store.delete(e + ':.txt.data' for e in empty)
+        blacklisted.extend(e.split(":") for e in empty)
+    write = append_result
+    if store is not None:
+        store.delete(e + ':.txt.data' for e in forms.keys())
+        write = store.append
+    else:
+        for e in forms.keys():                        #Ergebnisse früherer Suchen ersetzen statt sie zu verdoppeln
+            if os.path.exists(e + ':.txt.data'):
+                os.remove(e + ':.txt.data')
+    PROFILER.count("pairs", len(forms))
+    if PROFILER.enabled:
+        observe_queries(forms, querymode, packsize)
+    with PROFILER.stage("queries"):
+        if cache is not None:
+            snames, rnames, failed = run_cached_queries(forms, cache, runner, corpusname, nprocs, command, index, scheduler, write)
+        elif runner == 'index':
+            snames = []
+            rnames = run_index_queries(forms, index, querymode, write)
+        elif runner == 'pool':
+            snames = []
+            rnames, failedpairs = run_cqp_pool(forms, corpusname, nprocs, command, querymode, packsize, write)
+            failed = {pair: "CQP-Prozess wurde unerwartet beendet" for pair in failedpairs}
+        elif runner == 'async':
+            snames, rnames, failed = run_cqp_async(forms, corpusname, scheduler, querymode, packsize, write)
+            if store is not None and querymode != 'packed':
+                move_to_store(rnames, store)
+        elif querymode == 'packed':
+            packs = make_packs(forms, packsize)
+            snames, pnames = write_packed_cqp_scripts(packs, corpusname)
+            codes = run_cqp_queries(snames, nprocs)
+            failed = {pair: "Rückgabewert " + str(code) for (group, query), code in zip(packs, codes) if code for pair in group}
+            rnames = collect_packed_hits(forms, packs, pnames, write)
         else:
-            blacklisted.append(name[:-9].split(":")[:-1])
-            os.remove(name)
-    for sna in snames:
-        os.remove(sna)
-    return results, blacklisted
+            snames, rnames = write_cqp_scripts(forms, corpusname, querymode)
+            codes = run_cqp_queries(snames, nprocs)
+            failed = {e: "Rückgabewert " + str(code) for e, code in zip(forms.keys(), codes) if code}
+            if store is not None:
+                move_to_store(rnames, store)
+    for pair, reason in failed.items():
+        print("CQP-Anfragen fehlgeschlagen für " + pair + ": " + reason)
+    with PROFILER.stage("collect_results"):
+        if PROFILER.enabled:
+            observe_hits([name for name in rnames if name[:-10] not in failed], store)
+        if store is not None:
+            store.delete(e + ':.txt.data' for e in failed)
+            for name in rnames:
+                if name[:-10] in failed:
+                    continue
+                if store.has_hits(name):
+                    results.append(name)
+                else:
+                    blacklisted.append(name[:-9].split(":")[:-1])
+            store.commit()
+            rnames = []
+        for name in rnames:
+            if name[:-10] in failed:
+                if os.path.exists(name):
+                    os.remove(name)
+                continue
+            indicator = read_in_cqp_result_extra(name)
+            if indicator:
+                results.append(name)
+            else:
+                blacklisted.append(name[:-9].split(":")[:-1])
+                if indicator is not None:
+                    os.remove(name)
+        for sna in snames:
+            os.remove(sna)
+    blacklisted.sort(key=lambda e: order[":".join(e)])  #Reihenfolge der Wortpaare auch mit verworfenen Wortpaaren
+    return results, blacklisted, [pair.split(":") for pair in failed]
+
+def prepare_cqp_resumable(chunk:List[List[str]], manifest:Manifest, search:Callable[[List[List[str]]], Tuple[List[str], List[List[str]], List[List[str]]]], batchsize:int=100, resume:bool=True) -> Tuple[List[str], List[List[str]], List[List[str]]]:
+    """
+    Sucht Wortpaare stapelweise mit search, z.B. prepare_cqp() mit festen weiteren Argumenten, und hält den Status jedes Wortpaares im Manifest fest: vor der Suche 'queued', danach 'hits', 'nohits' oder 'failed', je Stapel in einer Transaktion. Mit resume werden Wortpaare, die für Korpus und Anfrageversion des Manifests schon gesucht wurden, übersprungen. Gibt wie prepare_cqp() die Ergebnisdateien, die nicht gefundenen und die fehlgeschlagenen Wortpaare zurück, und zwar für alle Wortpaare aus chunk einschließlich der übersprungenen, in der Reihenfolge von chunk.
 
+    :param chunk: Liste von Wortpaaren, je als Liste
+    :param manifest: Manifest
+    :param search: Funktion, die einen Stapel von Wortpaaren sucht und Ergebnisse wie prepare_cqp() zurückgibt
+    :param batchsize: Anzahl der Wortpaare je Stapel, 0 für einen einzigen Stapel
+    :param resume: ob schon gesuchte Wortpaare übersprungen werden
+    """
+    rows = {":".join(e): e for e in chunk}
+    todo = manifest.pending(rows) if resume else list(rows)
+    step = batchsize or max(1, len(todo))
+    for i in range(0, len(todo), step):
+        batch = todo[i:i+step]
+        manifest.mark(batch, 'queued')
+        results, blacklisted, failed = search([rows[pair] for pair in batch])
+        statuses = {pair: 'failed' for pair in batch}
+        statuses.update({name[:-10]: 'hits' for name in results})
+        statuses.update({":".join(e): 'nohits' for e in blacklisted})
+        statuses.update({":".join(e): 'failed' for e in failed})
+        manifest.update(statuses)
+        print(str(min(i + step, len(todo))) + " von " + str(len(todo)) + " Wortpaaren gesucht, " + str(len(rows) - len(todo)) + " übersprungen")
+    status = manifest.status(rows)
+    results = [pair + ':.txt.data' for pair in rows if status.get(pair) == 'hits']
+    blacklisted = [rows[pair] for pair in rows if status.get(pair) == 'nohits']
+    failed = [rows[pair] for pair in rows if status.get(pair) not in ('hits', 'nohits')]
+    return results, blacklisted, failed
 
+def check_jobs(ctx:Any, param:Any, value:str) -> Any:
+    """
+    Prüft den Wert von --jobs: 'auto' oder eine positive ganze Zahl.
+    """
+    if value == 'auto':
+        return value
+    try:
+        if int(value) > 0:
+            return int(value)
+    except ValueError:
+        pass
+    raise click.BadParameter('must be "auto" or a positive integer')
 
 @click.command()
-@click.option('--lemmaformname', default='LemmaForm.json', help='Name of file containing lemma-wordforms-dictionary. Defaults to "LemmaForm.json".')
+@click.option('--lemmaformname', default='LemmaForm.json', help='Name of file containing lemma-wordforms-dictionary or of lexicon directory written by MakeCELEXDictFiles.py. Defaults to "LemmaForm.json".')
 @click.option('--files', '-f', multiple=True, default=['antonyms_long.csv','synonyms.csv', 'nonyms.csv'], help='Name files from which to take data to be preprocessed. Defaults to "antonyms_long.csv", "synonyms.csv" and "nonyms.csv".')
 @click.option('--beginrange', default=0, help='Beginning of chunk to be preprocessed. Defaults to 0.')
 @click.option('--endrange', default=200, help='End of chunk to be preprocessed. Defaults to 200.')
 @click.option('--corpusname', default='EXAMPLE;', help='Name or activation phrase of CQP-corpus to be searched. Of form "<name>;" Defaults to "EXAMPLE;"')
-def main(lemmaformname, files, beginrange, endrange, corpusname):
+@click.option('--runner', default='scripts', type=click.Choice(['scripts', 'pool', 'async', 'index']), help='How to run the queries: "scripts" starts one cqp process per word pair, "pool" keeps --nprocs cqp processes running and feeds them queries, "async" runs the scripts under an asyncio scheduler with --jobs, --timeout and --retries, "index" answers them in-process from the positional index in --indexdir without cqp. Defaults to "scripts".')
+@click.option('--nprocs', default=NPROCS, help='Number of cqp processes running at the same time. Defaults to ' + str(NPROCS) + '.')
+@click.option('--cqp', 'command', default='cqp', help='Command to start cqp with --runner=pool or --runner=async, e.g. "cqp -r /path/to/registry" or "python3 FakeCQP.py". Defaults to "cqp".')
+@click.option('--querymode', default='combinations', type=click.Choice(['combinations', 'alternation', 'packed']), help='How to query the forms of a wordpair: "combinations" issues one query per combination of forms, "alternation" one query per wordpair with all forms as regex alternatives, "packed" one such query for --packsize wordpairs at once, split afterwards by the matched forms. Defaults to "combinations".')
+@click.option('--lossy/--exact', default=False, help='Whether to allow --querymode=alternation or --querymode=packed. Their hits are only a subset of those of "combinations", so the pattern counts of MakeVectors.py change; --lossy accepts that loss. Defaults to exact, which rejects both modes.')
+@click.option('--packsize', default=50, help='Number of wordpairs per query with --querymode=packed. Defaults to 50.')
+@click.option('--indexdir', default='corpus.idx', help='Directory of positional index built by CorpusIndex.py, used with --runner=index. Defaults to "corpus.idx".')
+@click.option('--corpusfile', default=None, help='Plain text or CWB-style vertical file to build the index in --indexdir from if it does not exist yet. Defaults to None.')
+@click.option('--jobs', default='auto', callback=check_jobs, help='Number of cqp scripts running at the same time with --runner=async, or "auto" to adapt it to observed throughput and system load. Defaults to "auto".')
+@click.option('--timeout', default=600.0, help='Seconds after which a cqp script is killed and retried with --runner=async. Defaults to 600.')
+@click.option('--retries', default=2, help='Number of retries of a failed or timed out cqp script with --runner=async. Defaults to 2.')
+@click.option('--store', default=None, help='Full path to or name of a result store database. If given, the hits of all wordpairs are kept there instead of in one file per wordpair; pass the same --store to MakeVectors.py. Defaults to one file per wordpair.')
+@click.option('--manifest', default=None, help='Full path to or name of a manifest database recording for each wordpair whether it was searched with or without hits or failed, per corpus and query version. Defaults to "manifest.sqlite" with --resume or --all, otherwise no manifest.')
+@click.option('--resume/--no-resume', default=False, help='Whether to skip wordpairs the manifest lists as already searched. Defaults to no.')
+@click.option('--all', 'all_', is_flag=True, default=False, help='Process all wordpairs of the files instead of --beginrange to --endrange; output files are named "actual_results_all_<file>.pckl" etc.')
+@click.option('--batchsize', default=100, help='Number of wordpairs searched and recorded in the manifest at a time. 0 searches all at once. Defaults to 100.')
+@click.option('--querycache', default=None, help='Full path to or name of a query cache database. If given, each query for a combination of two wordforms is sent to cqp only once per corpus, across wordpairs, files and runs. Only with --querymode=combinations. Defaults to no cache.')
+@click.option('--prune/--no-prune', default=False, help='Whether to drop combinations of wordforms occurring less than --minfreq times in the corpus before querying. Wordpairs left without any combination are blacklisted without a query. Defaults to no.')
+@click.option('--minfreq', default=1, help='Minimum corpus frequency of both wordforms of a combination with --prune. Defaults to 1.')
+@click.option('--lexicon', 'lexiconfile', default=None, help='File to cache the corpus lexicon with frequencies in with --prune; it is read again when the corpus changes. Defaults to "lexicon_<corpusname>.pckl", or "lexicon_<absolute path of indexdir>.pckl" with --runner=index.')
+@click.option('--lexdecode', default='cwb-lexdecode', help='Command to run cwb-lexdecode with to read the lexicon with --prune, unless --runner=index. Defaults to "cwb-lexdecode".')
+@profile_options
+def main(lemmaformname, files, beginrange, endrange, corpusname, runner, nprocs, command, querymode, lossy, packsize, indexdir, corpusfile, jobs, timeout, retries, store, manifest, resume, all_, batchsize, querycache, prune, minfreq, lexiconfile, lexdecode):
     """
     Run script to search for wordpairs in corpus and save results for later usage.
     """
-    with open(lemmaformname) as f:                    #Öffnet Lemma-Wortformen-Dictionary.
-        lemmaform = json.load(f)
+    if querymode != 'combinations' and not lossy:     #Treffer wären nur eine Teilmenge derer von 'combinations'.
+        raise click.UsageError("--querymode=" + querymode + " liefert nicht alle Treffer von --querymode=combinations und verändert damit die Patterns von MakeVectors.py; mit --lossy zulassen.")
+    with PROFILER.stage("load_lemmaform"):
+        if is_lexicon(lemmaformname):                 #Mappt kompaktes Lexikon, statt das Dictionary einzulesen.
+            newlemmaform = Lexicon(lemmaformname).lemmaform
+        else:
+            with open(lemmaformname) as f:            #Öffnet Lemma-Wortformen-Dictionary.
+                lemmaform = json.load(f)
 
-    if lemmaformname=='LemmaForm.txt':
-        newlemmaform = {}
-        for k in lemmaform.keys():
-            kn = k[:-1]
-            newlemmaform[kn] = lemmaform[k]
-    else:
-        newlemmaform=lemmaform
+            if lemmaformname=='LemmaForm.txt':
+                newlemmaform = {}
+                for k in lemmaform.keys():
+                    kn = k[:-1]
+                    newlemmaform[kn] = lemmaform[k]
+            else:
+                newlemmaform=lemmaform
+
+    index = None
+    if runner == 'index':
+        if not os.path.exists(indexdir):
+            if corpusfile is None:
+                raise click.UsageError("Kein Index in " + indexdir + " gefunden; --corpusfile angeben, um ihn aufzubauen.")
+            build_index(corpusfile, indexdir)          #Baut Index einmalig aus Korpusdatei auf.
+        index = CorpusIndex(indexdir)
+    scheduler = CQPScheduler(jobs, timeout, retries, command) if runner == 'async' else None
+    rs = ResultStore(store) if store else None
+
+    corpus = os.path.abspath(indexdir) if runner == 'index' else corpusname
+    if manifest is None and (resume or all_):
+        manifest = 'manifest.sqlite'
+    mf = None
+    if manifest:                                      #Öffnet Manifest für Korpus und Version der Anfragen.
+        mf = Manifest(manifest, corpus, QUERY_VERSION + ":" + querymode + ":" + file_hash(lemmaformname) + (":" + str(minfreq) if prune and minfreq > 1 else ""))
+    qc = None
+    if querycache:                                    #Öffnet Anfrage-Cache für Korpus und Version der Anfragen.
+        if querymode != 'combinations':
+            raise click.UsageError("--querycache ist nur mit --querymode=combinations möglich.")
+        qc = QueryCache(querycache, corpus + ":" + QUERY_VERSION)
+    lx = None
+    if prune:                                         #Lädt Lexikon des Korpus mit Häufigkeiten einmal je Korpus.
+        if lexiconfile is None:
+            lexiconfile = "lexicon_" + re.sub(r"\W", "_", os.path.abspath(indexdir) if runner == 'index' else corpusname.strip().rstrip(";")) + ".pckl"
+        if runner == 'index':                         #Signatur des Korpus, damit ein neu kodiertes Korpus das Lexikon neu einlesen lässt.
+            source = lambda: read_index_lexicon(index)
+            signature = index_signature(indexdir)
+        else:
+            source = lambda: read_lexdecode(corpusname, lexdecode)
+            signature = lexdecode_signature(corpusname, lexdecode)
+        lx = CorpusLexicon.load(lexiconfile, source, minfreq, signature)
+
+    span = "all" if all_ else str(beginrange) + "-" + str(endrange)
 
     for file in files:
 
         with open(file, "r", newline="") as f:        #Liest Wortpaar-Datei zeilenweise ein.
             lines = [x for x in csv.reader(f)]
     
-        chunk = lines[beginrange:endrange]            #Beschränkt Wortpaare auf gewünschten Abschnitt.
+        chunk = lines if all_ else lines[beginrange:endrange]  #Beschränkt Wortpaare auf gewünschten Abschnitt.
 
-        results, blacklisted = prepare_cqp(chunk, newlemmaform, corpusname)  #Lässt Wortpaare mit CQP vorverarbeiten.
+        search = lambda c: prepare_cqp(c, newlemmaform, corpusname, runner, nprocs, command, querymode, packsize, index, scheduler, rs, qc, lx)
+        with PROFILER.stage("search"):
+            if mf:                                    #Lässt Wortpaare stapelweise vorverarbeiten und hält Stand im Manifest fest.
+                results, blacklisted, failed = prepare_cqp_resumable(chunk, mf, search, batchsize, resume)
+            else:
+                results, blacklisted, failed = search(chunk)  #Lässt Wortpaare mit CQP vorverarbeiten.
+        PROFILER.count("results", len(results))
+        PROFILER.count("blacklisted", len(blacklisted))
+        PROFILER.count("failed", len(failed))
 
-    
-        with open("actual_results_" + str(beginrange) + "-" + str(endrange) + "_" + file[:-4] + ".pckl", "wb") as fp:
-            pickle.dump(results, fp)
-    
-        with open("actual_blacklisted_" + str(beginrange) + "-" + str(endrange) + "_" + file, "w", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerows(blacklisted)
+        with PROFILER.stage("write_lists"):
+            with open("actual_results_" + span + "_" + file[:-4] + ".pckl", "wb") as fp:
+                pickle.dump(results, fp)
+
+            with open("actual_blacklisted_" + span + "_" + file, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerows(blacklisted)
+
+        if failed:                                    #Fehlgeschlagene Wortpaare getrennt von der Blacklist, um sie erneut suchen zu können.
+            with open("actual_failed_" + span + "_" + file, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerows(failed)
+            print(str(len(failed)) + " Wortpaare aus " + file + " fehlgeschlagen, siehe actual_failed_" + span + "_" + file)
+        elif os.path.exists("actual_failed_" + span + "_" + file):
+            os.remove("actual_failed_" + span + "_" + file) #Veraltete Liste aus einem früheren Lauf
+
+    if rs is not None:
+        rs.close()
+
+    if lx is not None:
+        print(lx.report())
+
+    if qc is not None:
+        print(qc.report())
+        qc.close()
+
+    if mf is not None:
+        print("Manifest: " + ", ".join(status + " " + str(n) for status, n in sorted(mf.counts().items())))
+        mf.close()
+
+    if scheduler is not None:
+        print("CQP-Scripte: " + str(scheduler.stats["completed"]) + " erfolgreich, " + str(scheduler.stats["retried"]) + " Wiederholungen, " + str(scheduler.stats["timeouts"]) + " Zeitüberschreitungen, " + str(scheduler.stats["failed"]) + " fehlgeschlagen")
 
 if __name__ == "__main__":
     
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2022 franka.beyer@fau.de
+
+"""
+Gemeinsame Messschicht für alle Skripte. Mit --profile misst PROFILER je Stufe Wanduhr- und CPU-Zeit und den Spitzenwert des RSS und sammelt fachliche Zähler und Histogramme, z.B. Anfragen und Treffer je Wortpaar oder die Latenz von CQP. Alles wird als JSON-Zeilen in eine Trace-Datei geschrieben:
+
+{"event": "start", ...}     Skript, Argumente, Prozess-ID
+{"event": "stage", ...}     je beendeter Stufe: Name, übergeordnete Stufe, Beginn, Wanduhr- und CPU-Zeit in s, RSS bei Beginn und Ende und Spitzenwert in MB
+{"event": "summary", ...}   am Ende: Stufen je Name zusammengefasst, Zähler, Histogramme, Gesamtzeiten und größter RSS des Prozesses und seiner Kindprozesse
+
+Ohne --profile sind alle Aufrufe nahezu kostenlos. Mit --profiledump wird jede Stufe der obersten Ebene mit cProfile gemessen und die Stufe mit der längsten Wanduhrzeit als pstats-Datei und als Datei mit gefalteten Aufrufstapeln für Flamegraphs gespeichert.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import pstats
+import cProfile
+import resource
+import functools
+import threading
+import contextlib
+from collections import Counter
+from typing import Dict, Iterator, Callable, Any, Optional
+import click
+
+def current_rss() -> Optional[int]:
+    """
+    Gibt den aktuellen RSS des Prozesses in Bytes zurück, oder None, wenn /proc nicht verfügbar ist.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def max_rss(who:int=resource.RUSAGE_SELF) -> int:
+    """
+    Gibt den größten RSS des Prozesses bzw. seiner beendeten Kindprozesse seit dem Start in Bytes zurück.
+
+    :param who: resource.RUSAGE_SELF oder resource.RUSAGE_CHILDREN
+    """
+    rss = resource.getrusage(who).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+class Histogram:
+    """
+    Histogramm mit Zweierpotenzen als oberen Grenzen der Buckets, sodass der Speicher auch bei Millionen Werten klein bleibt. Quantile werden als obere Grenze ihres Buckets angegeben.
+    """
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.buckets = Counter()
+
+    def add(self, value:float) -> None:
+        """
+        Zählt einen Wert.
+
+        :param value: Wert, z.B. eine Latenz in Sekunden oder eine Anzahl
+        """
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.buckets[0.0 if value <= 0 else 2.0 ** math.ceil(math.log2(value))] += 1
+
+    def quantile(self, q:float) -> float:
+        """
+        Gibt die obere Grenze des Buckets zurück, in dem das q-Quantil liegt.
+
+        :param q: Quantil zwischen 0 und 1
+        """
+        seen = 0
+        for bound in sorted(self.buckets):
+            seen += self.buckets[bound]
+            if seen >= q * self.count:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Gibt Anzahl, Summe, Mittelwert, Minimum, Maximum, Quantile und Buckets als Dictionary zurück.
+        """
+        if not self.count:
+            return {"count": 0}
+        return {"count": self.count, "sum": self.total, "mean": self.total / self.count, "min": self.min, "max": self.max,
+                "p50": self.quantile(0.5), "p90": self.quantile(0.9), "p99": self.quantile(0.99),
+                "buckets": {repr(bound): n for bound, n in sorted(self.buckets.items())}}
+
+class Profiler:
+    """
+    Sammelt Stufen, Zähler und Histogramme eines Laufs. Solange start() nicht aufgerufen wurde, tun stage(), count() und observe() nichts. Die Methoden dürfen aus mehreren Threads aufgerufen werden; in Prozessen eines Pools wird nichts gemessen.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+
+    def start(self, script:str, tracefile:str, dumpfile:Optional[str]=None, interval:float=0.01) -> None:
+        """
+        Schaltet die Messung ein und beginnt die Trace-Datei.
+
+        :param script: Name des Skripts
+        :param tracefile: Pfad zu bzw. Name der Trace-Datei
+        :param dumpfile: Pfad zu bzw. Name der pstats-Datei der Stufe mit der längsten Wanduhrzeit oder None
+        :param interval: Sekunden zwischen zwei Messungen des RSS
+        """
+        self.enabled = True
+        self.pid = os.getpid()
+        self.script = script
+        self.dumpfile = dumpfile
+        self.trace = open(tracefile, "w")
+        self.counters = Counter()
+        self.histograms = {}
+        self.stages = {}
+        self.open = []                                    #offene Stufen mit ihrem bisher höchsten RSS
+        self.profiles = {}                                #cProfile.Profile je Aufruf der Stufen der obersten Ebene, nach Name
+        self.wall, self.cpu = time.perf_counter(), time.process_time()
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.sampler = None
+        if current_rss() is not None:
+            self.sampler = threading.Thread(target=self._sample, daemon=True)
+            self.sampler.start()
+        self._emit({"event": "start", "script": script, "argv": sys.argv[1:], "pid": self.pid, "time": time.strftime("%Y-%m-%dT%H:%M:%S")})
+
+    def _sample(self) -> None:
+        while not self.stopped.wait(self.interval):
+            rss = current_rss()
+            with self.lock:
+                for s in self.open:
+                    s["rss_peak"] = max(s["rss_peak"], rss)
+
+    def _emit(self, event:Dict[str, Any]) -> None:
+        self.trace.write(json.dumps(event) + "\n")
+
+    def _active(self) -> bool:
+        return self.enabled and os.getpid() == self.pid
+
+    @contextlib.contextmanager
+    def stage(self, name:str) -> Iterator[None]:
+        """
+        Misst den Block als Stufe name. Stufen dürfen geschachtelt sein und mehrfach vorkommen; in der Zusammenfassung werden gleichnamige Stufen addiert.
+
+        :param name: Name der Stufe
+        """
+        if not self._active():
+            yield
+            return
+        rss = current_rss() or max_rss()
+        s = {"name": name, "rss_start": rss, "rss_peak": rss}
+        with self.lock:
+            parent = self.open[-1]["name"] if self.open else None
+            self.open.append(s)
+        profile = cProfile.Profile() if self.dumpfile and parent is None and threading.current_thread() is threading.main_thread() else None
+        begin, cpu = time.perf_counter(), time.process_time()
+        if profile:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile:
+                profile.disable()
+            wall, cpu = time.perf_counter() - begin, time.process_time() - cpu
+            rss = current_rss()
+            with self.lock:
+                self.open.remove(s)
+                peak = max(s["rss_peak"], rss) if rss is not None else max_rss()
+                total = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0, "cpu_seconds": 0.0, "rss_peak_mb": 0.0})
+                total["calls"] += 1
+                total["seconds"] += wall
+                total["cpu_seconds"] += cpu
+                total["rss_peak_mb"] = max(total["rss_peak_mb"], peak / 2**20)
+                if profile:
+                    self.profiles.setdefault(name, []).append(profile)
+                self._emit({"event": "stage", "name": name, "parent": parent, "begin": round(begin - self.wall, 6), "seconds": round(wall, 6), "cpu_seconds": round(cpu, 6),
+                            "rss_start_mb": round(s["rss_start"] / 2**20, 3), "rss_end_mb": round((rss or peak) / 2**20, 3), "rss_peak_mb": round(peak / 2**20, 3)})
+
+    def count(self, name:str, n:int=1) -> None:
+        """
+        Erhöht einen Zähler.
+
+        :param name: Name des Zählers
+        :param n: Betrag
+        """
+        if self._active():
+            with self.lock:
+                self.counters[name] += n
+
+    def observe(self, name:str, value:float) -> None:
+        """
+        Trägt einen Wert in ein Histogramm ein.
+
+        :param name: Name des Histogramms
+        :param value: Wert
+        """
+        if self._active():
+            with self.lock:
+                h = self.histograms.get(name)
+                if h is None:
+                    h = self.histograms[name] = Histogram()
+                h.add(value)
+
+    def finish(self) -> Dict[str, Any]:
+        """
+        Schreibt die Zusammenfassung, ggf. die pstats-Datei der Stufe mit der längsten Wanduhrzeit, schließt die Trace-Datei und schaltet die Messung aus. Gibt die Zusammenfassung zurück.
+        """
+        if not self._active():
+            return {}
+        self.stopped.set()
+        if self.sampler is not None:
+            self.sampler.join()
+        summary = {"event": "summary", "script": self.script, "seconds": round(time.perf_counter() - self.wall, 6), "cpu_seconds": round(time.process_time() - self.cpu, 6),
+                   "maxrss_mb": round(max_rss() / 2**20, 3), "maxrss_children_mb": round(max_rss(resource.RUSAGE_CHILDREN) / 2**20, 3),
+                   "stages": self.stages, "counters": dict(self.counters), "histograms": {name: h.summary() for name, h in self.histograms.items()}}
+        if self.profiles:
+            name = max(self.profiles, key=lambda n: self.stages[n]["seconds"])
+            stats = pstats.Stats(*self.profiles[name])        #alle Aufrufe der Stufe zusammen
+            stats.dump_stats(self.dumpfile)
+            write_folded(stats, self.dumpfile + ".folded")
+            summary["profiled_stage"] = name
+        self._emit(summary)
+        self.trace.close()
+        self.enabled = False
+        return summary
+
+    def report(self, summary:Dict[str, Any]) -> str:
+        """
+        Gibt eine kurze Tabelle der Stufen und die Zähler einer Zusammenfassung als String zurück.
+
+        :param summary: Rückgabe von finish()
+        """
+        lines = ["%-32s %6s %10s %10s %10s" % ("Stufe", "Aufr.", "Wand s", "CPU s", "RSS MB")]
+        for name, s in sorted(summary["stages"].items(), key=lambda item: -item[1]["seconds"]):
+            lines.append("%-32s %6d %10.3f %10.3f %10.1f" % (name, s["calls"], s["seconds"], s["cpu_seconds"], s["rss_peak_mb"]))
+        lines.append("gesamt %.3f s Wanduhr, %.3f s CPU, RSS höchstens %.1f MB (Kindprozesse %.1f MB)" % (summary["seconds"], summary["cpu_seconds"], summary["maxrss_mb"], summary["maxrss_children_mb"]))
+        for name, n in sorted(summary["counters"].items()):
+            lines.append("%s: %d" % (name, n))
+        for name, h in sorted(summary["histograms"].items()):
+            if h["count"]:
+                lines.append("%s: %d Werte, Mittel %.4g, p50 %.4g, p90 %.4g, max %.4g" % (name, h["count"], h["mean"], h["p50"], h["p90"], h["max"]))
+        return "\n".join(lines)
+
+def write_folded(stats:pstats.Stats, filename:str, mintime:float=1e-5) -> None:
+    """
+    Schreibt die Aufrufe aus cProfile als gefaltete Aufrufstapel, eine Zeile 'f1;f2;f3 <Mikrosekunden>' je Pfad, wie sie flamegraph.pl oder speedscope lesen. Da cProfile nur Aufrufer und Aufgerufene kennt, wird die Zeit einer Funktion auf ihre Aufrufer im Verhältnis der Zeit verteilt, die sie unter jedem verbracht hat, und die Pfade werden daraus zusammengesetzt; das ist eine Näherung. Pfade unter mintime Sekunden und Rekursionen werden ausgelassen.
+
+    :param stats: pstats.Stats einer Stufe
+    :param filename: Pfad zu bzw. Name der Ausgabedatei
+    :param mintime: kürzeste Zeit eines Pfades in Sekunden
+    """
+    entries = stats.stats
+    label = lambda func: "%s:%d:%s" % (os.path.basename(func[0]), func[1], func[2])
+    callees = {}
+    for func, (cc, nc, tt, ct, callers) in entries.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+    out = []
+    def walk(func, path, seen, share):
+        tt, ct = entries[func][2], entries[func][3]
+        if tt * share * 1e6 >= 1:
+            out.append("%s %d" % (";".join(path), round(tt * share * 1e6)))
+        for callee, edgect in callees.get(func, []):
+            t = edgect * share                           #Zeit des Aufgerufenen auf diesem Pfad
+            if callee in seen or t < mintime:
+                continue
+            walk(callee, path + [label(callee)], seen | {callee}, t / entries[callee][3])
+    for func, entry in entries.items():
+        if not entry[4]:                                 #ohne Aufrufer
+            walk(func, [label(func)], {func}, 1.0)
+    with open(filename, "w") as f:
+        f.write("\n".join(out) + ("\n" if out else ""))
+
+PROFILER = Profiler()
+
+def profile_options(func:Callable) -> Callable:
+    """
+    Ergänzt den main()-Befehl eines Skripts um --profile, --profiletrace und --profiledump und schaltet PROFILER für den ganzen Lauf ein. Unter @click.command() und den übrigen Optionen direkt über main() zu setzen.
+
+    :param func: main()-Funktion des Skripts
+    """
+    @click.option('--profile/--no-profile', default=False, help='Whether to record wall time, cpu time and peak RSS per stage plus counters as json lines in --profiletrace and print a summary. Defaults to no.')
+    @click.option('--profiletrace', default=None, help='Full path to or name of the json lines trace file written with --profile. Defaults to "profile_<script>.jsonl".')
+    @click.option('--profiledump', default=None, help='Full path to or name of a pstats file to contain a cProfile dump of the slowest top-level stage with --profile; a collapsed-stack file for flamegraphs is written next to it with suffix ".folded". Defaults to none.')
+    @functools.wraps(func)
+    def wrapper(*args, profile, profiletrace, profiledump, **kwargs):
+        if not profile:
+            return func(*args, **kwargs)
+        script = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+        PROFILER.start(script, profiletrace or "profile_" + script + ".jsonl", profiledump)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            sys.stderr.write(PROFILER.report(PROFILER.finish()) + "\n")
+    return wrapper
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2022 franka.beyer@fau.de
+
+import io
+import zlib
+import sqlite3
+from typing import List, Dict, Tuple, Iterable
+
+class QueryCache:
+    """
+    Dauerhafter Cache der Treffer einzelner CQP-Anfragen nach zwei Wortformen in einer SQLite-Datenbank. Ein Eintrag ist über das Korpus und das geordnete Paar der Wortformen gekennzeichnet; gespeichert werden auch Anfragen ohne Treffer. Da dieselben Wortformen in vielen Wortpaaren und Dateien vorkommen, z.B. in beiden Richtungen in antonyms_long.csv, muss jede Anfrage so nur einmal an CQP gestellt werden.
+
+    :param path: Pfad zu bzw. Name der Datenbankdatei
+    :param corpus: Name des Korpus bzw. des Index, einschließlich der Version der Anfragen
+    """
+    def __init__(self, path:str, corpus:str):
+        self.corpus = corpus
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS queries (corpus TEXT, x TEXT, y TEXT, data BLOB, PRIMARY KEY (corpus, x, y))")
+        self.lookups = 0
+        self.unique = 0
+        self.hits = 0
+
+    def get_many(self, combinations:Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], List[str]]:
+        """
+        Gibt die gespeicherten Ergebniszeilen der Anfragen als Dictionary zurück; Anfragen ohne Eintrag fehlen darin. Zählt dabei Anfragen, verschiedene Anfragen und Treffer im Cache.
+
+        :param combinations: Tupel aus erster und zweiter Wortform, je eines je Anfrage, auch mehrfach
+        """
+        res = {}
+        seen = set()
+        for x, y in combinations:
+            self.lookups += 1
+            if (x, y) in seen:
+                continue
+            seen.add((x, y))
+            row = self.db.execute("SELECT data FROM queries WHERE corpus = ? AND x = ? AND y = ?", (self.corpus, x, y)).fetchone()
+            if row is not None:
+                res[(x, y)] = io.StringIO(zlib.decompress(row[0]).decode("utf-8"), newline="\n").readlines()
+        self.unique += len(seen)
+        self.hits += len(res)
+        return res
+
+    def put(self, combination:Tuple[str, str], lines:List[str]) -> None:
+        """
+        Speichert die Ergebniszeilen einer Anfrage.
+
+        :param combination: Tupel aus erster und zweiter Wortform
+        :param lines: Ergebniszeilen im Format von 'cat' bei CQP, je mit Zeilenumbruch
+        """
+        data = zlib.compress("".join(lines).encode("utf-8"))
+        self.db.execute("INSERT OR REPLACE INTO queries VALUES (?, ?, ?, ?)", (self.corpus, combination[0], combination[1], data))
+
+    def report(self) -> str:
+        """
+        Gibt die Statistik seit dem Öffnen als Text zurück.
+        """
+        rate = 100.0 * (self.lookups - (self.unique - self.hits)) / self.lookups if self.lookups else 0.0
+        return "Anfrage-Cache: " + str(self.lookups) + " Anfragen, " + str(self.unique) + " verschiedene, " + str(self.hits) + " aus dem Cache, " + str(self.unique - self.hits) + " an CQP gestellt (" + "%.1f" % rate + " % eingespart)"
+
+    def commit(self) -> None:
+        """
+        Schreibt alle Änderungen in die Datenbank.
+        """
+        self.db.commit()
+
+    def close(self) -> None:
+        """
+        Schreibt alle Änderungen in die Datenbank und schließt sie.
+        """
+        self.db.commit()
+        self.db.close()
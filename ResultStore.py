@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2022 franka.beyer@fau.de
+
+import os
+import zlib
+import pickle
+import sqlite3
+import click
+from typing import List, Iterable, Iterator, Tuple
+from Profiling import PROFILER, profile_options
+
+class ResultStore:
+    """
+    Ablage der CQP-Ergebnisse aller Wortpaare in einer einzigen SQLite-Datenbank statt in einer Datei <Wort1>:<Wort2>:.txt.data je Wortpaar. Ergebniszeilen werden nur angehängt; die Zeilen eines Wortpaares sind alle zu ihm gespeicherten Blöcke in der Reihenfolge, in der sie angehängt wurden, und entsprechen dem Inhalt seiner Ergebnisdatei.
+    Wortpaare werden wie in den Ergebnislisten von PreprocessingCQP über den Namen ihrer Ergebnisdatei angesprochen, sodass diese Listen unverändert bleiben.
+
+    :param path: Pfad zu bzw. Name der Datenbankdatei
+    """
+    def __init__(self, path:str):
+        self.db = sqlite3.connect(path, check_same_thread=False) #Zugriffe aus mehreren Threads werden von den Aufrufern serialisiert
+        self.db.execute("CREATE TABLE IF NOT EXISTS hits (pair TEXT, data BLOB)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS hits_pair ON hits (pair)")
+
+    def append(self, name:str, lines:List[str]) -> None:
+        """
+        Hängt Ergebniszeilen an die Ergebnisse eines Wortpaares an.
+
+        :param name: Name der Ergebnisdatei des Wortpaares, <Wort1>:<Wort2>:.txt.data
+        :param lines: Ergebniszeilen im Format von 'cat' bei CQP, je mit Zeilenumbruch
+        """
+        if lines:
+            self.db.execute("INSERT INTO hits VALUES (?, ?)", (name, zlib.compress("".join(lines).encode("utf-8"))))
+
+    def delete(self, names:Iterable[str]) -> None:
+        """
+        Löscht alle Ergebnisse der Wortpaare, z.B. bevor sie erneut gesucht werden.
+
+        :param names: Namen der Ergebnisdateien der Wortpaare
+        """
+        self.db.executemany("DELETE FROM hits WHERE pair = ?", ((name,) for name in names))
+
+    def has_hits(self, name:str) -> bool:
+        """
+        Prüft, ob zu einem Wortpaar Ergebnisse gespeichert sind.
+
+        :param name: Name der Ergebnisdatei des Wortpaares
+        """
+        return self.db.execute("SELECT 1 FROM hits WHERE pair = ? LIMIT 1", (name,)).fetchone() is not None
+
+    def iter_results(self, names:Iterable[str]) -> Iterator[Tuple[str, str]]:
+        """
+        Generiert für alle Wortpaare mit Ergebnissen Tupel aus Namen und Inhalt der Ergebnisse in der Reihenfolge von names. Alle Wortpaare werden mit einer einzigen Abfrage gelesen.
+
+        :param names: Namen der Ergebnisdateien der Wortpaare
+        """
+        self.db.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (seq INTEGER PRIMARY KEY, pair TEXT)")
+        self.db.execute("DELETE FROM wanted")
+        self.db.executemany("INSERT INTO wanted (pair) VALUES (?)", ((name,) for name in names))
+        rows = self.db.execute("SELECT w.seq, w.pair, h.data FROM wanted w JOIN hits h ON h.pair = w.pair ORDER BY w.seq, h.rowid")
+        current = None
+        parts = []
+        for seq, name, data in rows:
+            if seq != current:
+                if parts:
+                    yield pair, "".join(parts)
+                current = seq
+                pair = name
+                parts = []
+            parts.append(zlib.decompress(data).decode("utf-8"))
+        if parts:
+            yield pair, "".join(parts)
+
+    def import_files(self, listnames:List[str], delete:bool=False) -> Tuple[int, int]:
+        """
+        Übernimmt einmalig bestehende Ergebnisdateien in die Datenbank. Die Ergebnisdateien werden den gepickelten Ergebnislisten von PreprocessingCQP entnommen; bereits gespeicherte Ergebnisse derselben Wortpaare werden ersetzt. Gibt die Anzahl der übernommenen und der fehlenden Ergebnisdateien zurück.
+
+        :param listnames: Pfade zu bzw. Namen der gepickelten Ergebnislisten
+        :param delete: ob die übernommenen Ergebnisdateien anschließend gelöscht werden
+        """
+        imported = 0
+        missing = 0
+        for listname in listnames:
+            with open(listname, "rb") as f:
+                names = pickle.load(f)
+            directory = os.path.dirname(listname)
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    with open(path) as f:
+                        lines = f.readlines()
+                except FileNotFoundError:
+                    missing += 1
+                    continue
+                self.delete([name])
+                self.append(name, lines)
+                imported += 1
+            self.db.commit()
+            if delete:
+                for name in names:
+                    path = os.path.join(directory, name)
+                    if os.path.exists(path):
+                        os.remove(path)
+        return imported, missing
+
+    def commit(self) -> None:
+        """
+        Schreibt alle Änderungen in die Datenbank.
+        """
+        self.db.commit()
+
+    def close(self) -> None:
+        """
+        Schreibt alle Änderungen in die Datenbank und schließt sie.
+        """
+        self.db.commit()
+        self.db.close()
+
+
+@click.command()
+@click.option('--store', default='results.db', help='Full path to or name of result store database to import into. Defaults to "results.db".')
+@click.option('--resultfiles', '-f', multiple=True, required=True, help='Pickled result lists written by PreprocessingCQP.py whose result files to import.')
+@click.option('--delete/--keep', default=False, help='Whether to delete the imported result files afterwards. Defaults to keep.')
+@profile_options
+def main(store, resultfiles, delete):
+    """
+    Import existing CQP result files into a result store once.
+    """
+    rs = ResultStore(store)
+    with PROFILER.stage("import"):
+        imported, missing = rs.import_files(list(resultfiles), delete)
+    PROFILER.count("imported", imported)
+    PROFILER.count("missing", missing)
+    rs.close()
+    print(str(imported) + " Ergebnisdateien übernommen, " + str(missing) + " nicht gefunden.")
+
+if __name__ == "__main__":
+
+    main()
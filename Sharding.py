@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2022 franka.beyer@fau.de
+
+import os
+import gzip
+import json
+import zlib
+import heapq
+import pickle
+import socket
+import hashlib
+from collections import Counter
+from typing import List, Dict, Any, Tuple, Iterator, Iterable
+
+FORMAT = "MakeVectors-Shard"
+VERSION = 1
+
+def input_fingerprint(resultnames:List[str], labelsdict:Dict[str, str], formlemmahash:str) -> str:
+    """
+    Gibt einen Hash über die Ergebnisdateien aller Wortpaare, ihre Label und das Wortform-Lemma-Dictionary zurück. Nur Shards mit gleichem Fingerabdruck lassen sich zusammenführen.
+
+    :param resultnames: Namen der Ergebnisdateien aller Wortpaare in globaler Reihenfolge
+    :param labelsdict: Wortpaar-Label/Relation-Dictionary
+    :param formlemmahash: Hash des Wortform-Lemma-Dictionary, z.B. von PatternCache.file_hash()
+    """
+    h = hashlib.sha1()
+    h.update(json.dumps([resultnames, [labelsdict[r[:-10]] for r in resultnames], formlemmahash]).encode("utf-8"))
+    return h.hexdigest()
+
+def select_shard(resultnames:List[str], shard:int, shards:int, shardby:str) -> List[int]:
+    """
+    Gibt die Nummern der Ergebnisdateien zurück, die zu einem Shard gehören. 'hash' verteilt die Wortpaare nach dem CRC32 ihres Namens, der auf allen Rechnern gleich ist, 'range' teilt die Liste in zusammenhängende, gleich große Abschnitte.
+
+    :param resultnames: Namen der Ergebnisdateien aller Wortpaare ohne Doppelungen
+    :param shard: Nummer des Shards, 0 bis shards-1
+    :param shards: Anzahl der Shards
+    :param shardby: 'hash' oder 'range'
+    """
+    if shardby == 'range':
+        n = len(resultnames)
+        return list(range(shard * n // shards, (shard + 1) * n // shards))
+    if shardby == 'hash':
+        return [i for i, name in enumerate(resultnames) if zlib.crc32(name.encode("utf-8")) % shards == shard]
+    raise ValueError("Unbekannte Aufteilung: " + shardby)
+
+def shard_path(sharddir:str, shard:int, shards:int) -> str:
+    """
+    Gibt den Pfad eines Shards ohne Endung zurück; dazu gehören '.json' (Kopf), '.totals.pckl.gz', '.pairs.pckl.gz' und während der Bearbeitung '.claim'.
+
+    :param sharddir: gemeinsames Verzeichnis aller Shards
+    :param shard: Nummer des Shards
+    :param shards: Anzahl der Shards
+    """
+    return os.path.join(sharddir, "shard-%05d-of-%05d" % (shard, shards))
+
+def claim_shard(sharddir:str, shards:int) -> Any:
+    """
+    Beansprucht den ersten Shard, der weder fertig noch von einem anderen Prozess beansprucht ist, indem seine '.claim'-Datei exklusiv angelegt wird. Das gelingt auch bei gleichzeitigen Versuchen mehrerer Rechner im selben Verzeichnis nur einem. Gibt die Nummer des Shards oder None zurück, wenn alle vergeben sind.
+
+    :param sharddir: gemeinsames Verzeichnis aller Shards
+    :param shards: Anzahl der Shards
+    """
+    os.makedirs(sharddir, exist_ok=True)
+    for shard in range(shards):
+        path = shard_path(sharddir, shard, shards)
+        if os.path.exists(path + ".json"):
+            continue
+        try:
+            fd = os.open(path + ".claim", os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            continue
+        with os.fdopen(fd, "w") as f:
+            f.write(socket.gethostname() + ":" + str(os.getpid()) + "\n")
+        return shard
+    return None
+
+def _replace(path:str, write:Any) -> None:
+    tmp = path + ".tmp-" + socket.gethostname() + "-" + str(os.getpid())
+    try:
+        write(tmp)
+        os.replace(tmp, path)                            #andere Prozesse sehen nur die fertige Datei
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def write_shard(path:str, header:Dict[str, Any], rows:Iterable[Tuple[int, str, str, Counter]], decode:Any=None, empty:Any='') -> Dict[str, Any]:
+    """
+    Schreibt einen Shard: die Counter(Patterns) seiner Wortpaare, die Gesamtzählung aller Patterns mit der Position ihres ersten Auftretens und zuletzt den Kopf als JSON. Erst der Kopf macht den Shard für reduce sichtbar; jede Datei wird unter einem temporären Namen geschrieben und dann umbenannt. Gibt den Kopf zurück.
+
+    :param path: Pfad des Shards ohne Endung, z.B. von shard_path()
+    :param header: Angaben zu Eingaben und Aufteilung, werden um Format, Version und Umfang ergänzt
+    :param rows: Tupel aus globaler Nummer, Wortpaar, Label und Counter(Patterns) in aufsteigender Reihenfolge der Nummern
+    :param decode: Funktion, die Pattern-Schlüssel in Strings übersetzt, z.B. PatternEncoder.decode; None, wenn die Patterns schon Strings sind
+    :param empty: Schlüssel des leeren Patterns, das nicht übernommen wird
+    """
+    totals = {}
+    names = {}
+    npairs = 0
+
+    def write_pairs(tmp:str) -> None:
+        nonlocal npairs
+        with gzip.open(tmp, "wb", compresslevel=1) as f:
+            for index, pair, label, c in rows:
+                if decode:                               #Strings statt Schlüsseln, damit Shards nicht vom PatternEncoder eines Rechners abhängen
+                    strings = {}
+                    for key, count in c.items():
+                        if key != empty:
+                            s = names.get(key)
+                            if s is None:
+                                s = names[key] = decode(key)
+                            strings[s] = strings.get(s, 0) + count
+                else:
+                    strings = {p: count for p, count in c.items() if p != empty}
+                for pos, (pattern, count) in enumerate(strings.items()):
+                    entry = totals.get(pattern)
+                    if entry is None:
+                        totals[pattern] = [count, index, pos]
+                    else:
+                        entry[0] += count
+                pickle.dump((index, pair, label, strings), f, pickle.HIGHEST_PROTOCOL)
+                npairs += 1
+
+    def write_totals(tmp:str) -> None:
+        with gzip.open(tmp, "wb", compresslevel=1) as f:
+            pickle.dump(totals, f, pickle.HIGHEST_PROTOCOL)
+
+    def write_header(tmp:str) -> None:
+        with open(tmp, "w") as f:
+            json.dump(header, f, indent=1)
+
+    _replace(path + ".pairs.pckl.gz", write_pairs)
+    _replace(path + ".totals.pckl.gz", write_totals)
+    header = dict(header, format=FORMAT, version=VERSION, pairs=npairs, patterns=len(totals))
+    _replace(path + ".json", write_header)
+    return header
+
+def check_shards(sharddir:str) -> Tuple[List[str], Dict[str, Any]]:
+    """
+    Sucht die fertigen Shards im Verzeichnis und prüft, dass sie aus denselben Eingaben und derselben Aufteilung stammen und vollständig sind. Gibt die Pfade der Shards nach Nummer und den Kopf des ersten zurück; wirft sonst ValueError mit den fehlenden oder abweichenden Shards.
+
+    :param sharddir: gemeinsames Verzeichnis aller Shards
+    """
+    if not os.path.isdir(sharddir):
+        raise ValueError("Kein Verzeichnis mit Shards: " + sharddir)
+    headers = {}
+    for name in sorted(os.listdir(sharddir)):
+        if name.startswith("shard-") and name.endswith(".json"):
+            with open(os.path.join(sharddir, name)) as f:
+                header = json.load(f)
+            if header.get("format") != FORMAT or header.get("version") != VERSION:
+                raise ValueError("Kein Shard dieser Version: " + name)
+            headers[name[:-5]] = header
+    if not headers:
+        raise ValueError("Keine Shards in " + sharddir)
+    first = next(iter(headers.values()))
+    for name, header in headers.items():
+        for field in ("inputs", "shards", "shardby", "npairs"):
+            if header[field] != first[field]:
+                raise ValueError("Shard " + name + " passt nicht zu den übrigen: " + field + " weicht ab")
+    shards = first["shards"]
+    paths = [shard_path(sharddir, shard, shards) for shard in range(shards)]
+    missing = [str(shard) + (" (beansprucht)" if os.path.exists(path + ".claim") else "") for shard, path in enumerate(paths) if os.path.basename(path) not in headers]
+    if missing:
+        raise ValueError("Es fehlen " + str(len(missing)) + " von " + str(shards) + " Shards: " + ", ".join(missing))
+    return paths, first
+
+def read_totals(path:str) -> Dict[str, List[int]]:
+    """
+    Liest die Gesamtzählung eines Shards als Pattern-[Häufigkeit, Nummer, Position]-Dictionary.
+
+    :param path: Pfad des Shards ohne Endung
+    """
+    with gzip.open(path + ".totals.pckl.gz", "rb") as f:
+        return pickle.load(f)
+
+def iter_shard_pairs(path:str) -> Iterator[Tuple[int, str, str, Dict[str, int]]]:
+    """
+    Generiert die Wortpaare eines Shards als Tupel aus globaler Nummer, Wortpaar, Label und Pattern-Häufigkeit-Dictionary.
+
+    :param path: Pfad des Shards ohne Endung
+    """
+    with gzip.open(path + ".pairs.pckl.gz", "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+class ShardCounter:
+    """
+    Exakter Pattern-Zähler, der die Gesamtzählungen mehrerer Shards zusammenführt. Für jedes Pattern wird die Position seines ersten Auftretens als globale Nummer des Wortpaares und Position im Counter des Wortpaares mitgeführt; bei gleicher Häufigkeit entscheidet sie wie bei StreamCounter, sodass most_common() dem Ergebnis eines einzelnen Laufs über alle Wortpaare gleicht.
+    """
+    exact = True
+
+    def __init__(self):
+        self.counts = {}
+
+    def merge(self, totals:Dict[str, List[int]]) -> None:
+        """
+        Zählt die Gesamtzählung eines Shards hinzu.
+
+        :param totals: Pattern-[Häufigkeit, Nummer, Position]-Dictionary, z.B. von read_totals()
+        """
+        counts = self.counts
+        if not counts:
+            self.counts = totals
+            return
+        for pattern, entry in totals.items():
+            old = counts.get(pattern)
+            if old is None:
+                counts[pattern] = entry
+            else:
+                old[0] += entry[0]
+                if entry[1:] < old[1:]:
+                    old[1:] = entry[1:]
+
+    def most_common(self, n:int) -> List[Tuple[str, int]]:
+        """
+        Gibt die n häufigsten Patterns mit ihren Häufigkeiten zurück.
+
+        :param n: Anzahl der zurückzugebenden Patterns
+        """
+        top = heapq.nsmallest(n, self.counts.items(), key=lambda x: (-x[1][0], x[1][1], x[1][2]))
+        return [(pattern, entry[0]) for pattern, entry in top]
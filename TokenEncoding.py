@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2022 franka.beyer@fau.de
+
+from array import array
+from itertools import chain
+from collections import Counter
+from typing import List, Dict, Iterator, NamedTuple, Any
+import numpy
+from PatternEncoding import PatternEncoder
+
+class EncodedLines(NamedTuple):
+    """
+    Bereinigte CQP-Ergebniszeilen eines Wortpaares als Token-IDs einer TokenTable: alle Tokens hintereinander und der Anfang jeder Zeile darin.
+    """
+    tokens: Any                                          #Token-IDs (int32)
+    offsets: Any                                         #Anfang jeder Zeile in tokens, Länge Anzahl der Zeilen+1 (int64)
+
+class TokenTable:
+    """
+    Globales Vokabular der Tokens aller CQP-Ergebniszeilen. Zeilen werden einmal in Arrays von Token-IDs übersetzt; Lemmatisierung und Ersetzung des Wortpaares durch X und Y geschehen dann auf den Arrays statt auf Strings. Das Lemma wird je Token des Vokabulars nur einmal nachgeschlagen und als ID des PatternEncoder in einem Array abgelegt.
+    Das Ergebnis entspricht celex_lemmatize(), x_y_out() und PatternEncoder.patternize() auf den Strings. Zeilen mit einem Lemma, das leer ist oder Leerzeichen enthält und deshalb dort neu zerlegt wird, werden wie dort über Strings verarbeitet.
+    """
+    def __init__(self):
+        self.ids = {}
+        self.tokens = []
+        self.lemmas = numpy.zeros(0, dtype=numpy.int32)  #ID des Lemmas im PatternEncoder je Token-ID, -1 für Zeilen über Strings
+
+    def encode(self, lines:List[str]) -> EncodedLines:
+        """
+        Übersetzt Zeilen in Token-IDs und vergibt dabei neue IDs für unbekannte Tokens.
+
+        :param lines: bereinigte CQP-Ergebniszeilen eines Wortpaares
+        """
+        ids = self.ids
+        split = [line.split() for line in lines]
+        flat = list(chain.from_iterable(split))
+        try:
+            tokens = array("i", map(ids.__getitem__, flat))
+        except KeyError:                                 #neue Tokens in der Reihenfolge ihres ersten Auftretens
+            for t in dict.fromkeys(flat):
+                if t not in ids:
+                    ids[t] = len(self.tokens)
+                    self.tokens.append(t)
+            tokens = array("i", map(ids.__getitem__, flat))
+        offsets = numpy.zeros(len(split) + 1, dtype=numpy.int64)
+        numpy.cumsum(list(map(len, split)), out=offsets[1:])
+        return EncodedLines(numpy.frombuffer(tokens, dtype=numpy.int32) if len(tokens) else numpy.zeros(0, dtype=numpy.int32), offsets)
+
+    def encode_patterndict(self, patterndict:Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Ersetzt die Ergebniszeilen aller Wortpaare im Wortpaar-CQP-Ergebnisse-Dictionary durch EncodedLines. Bereits als Counter vorliegende Werte, z.B. aus einem PatternCache, bleiben unverändert.
+
+        :param patterndict: Wortpaar-CQP-Ergebnisse-Dictionary
+        """
+        for pair, v in patterndict.items():
+            if not isinstance(v, (Counter, EncodedLines)):
+                patterndict[pair] = self.encode(v)
+        return patterndict
+
+    def lemmatize(self, formlemma:Dict[str, str], encoder:PatternEncoder) -> None:
+        """
+        Schlägt die Lemmata aller neuen Tokens des Vokabulars nach und vergibt ihnen IDs im PatternEncoder. Da das vor dem Verteilen auf mehrere Prozesse geschieht, vergeben alle Prozesse dieselben IDs.
+
+        :param formlemma: Wortform-Lemma-Dictionary
+        :param encoder: PatternEncoder
+        """
+        start = len(self.lemmas)
+        if start == len(self.tokens):
+            return
+        new = numpy.empty(len(self.tokens) - start, dtype=numpy.int32)
+        for k, t in enumerate(self.tokens[start:]):
+            l = formlemma.get(t, t)
+            parts = l.split()
+            if parts == [l]:
+                new[k] = encoder.encode_tokens(parts)[0]
+            else:
+                encoder.register(parts)
+                new[k] = -1
+        self.lemmas = numpy.concatenate((self.lemmas, new))
+
+    def line_ids(self, pair:str, lines:EncodedLines, formlemma:Dict[str, str], encoder:PatternEncoder) -> Iterator[List[int]]:
+        """
+        Lemmatisiert die Zeilen eines Wortpaares und ersetzt das Wortpaar durch X und Y. Generiert je Zeile die Liste der IDs des PatternEncoder, wie sie encoder.encode_tokens() für die Zeile nach celex_lemmatize() und x_y_out() liefert.
+
+        :param pair: Wortpaar der Form <Wort1>:<Wort2>
+        :param lines: zugehörige EncodedLines
+        :param formlemma: Wortform-Lemma-Dictionary
+        :param encoder: PatternEncoder
+        """
+        self.lemmatize(formlemma, encoder)
+        words = pair.split(":")
+        lem = self.lemmas[lines.tokens]
+        x, y = encoder.fixed
+        i = encoder.ids.get(words[0])
+        if i is not None:
+            lem = numpy.where(lem == i, x, lem)
+        i = encoder.ids.get(words[1])
+        if i is not None:
+            lem = numpy.where(lem == i, y, lem)
+        bad = numpy.flatnonzero(lem < 0)
+        slow = set((numpy.searchsorted(lines.offsets, bad, side="right") - 1).tolist())  #Zeilen über Strings
+        offsets = lines.offsets.tolist()
+        lem = lem.tolist()
+        empty = [encoder.empty_key]
+        for n in range(len(offsets) - 1):
+            s, e = offsets[n], offsets[n+1]
+            if n in slow:
+                yield encoder.encode_tokens(self._string_line(lines.tokens[s:e], words, formlemma).split(" "))
+            else:
+                yield lem[s:e] or empty                  #leere Zeile wie der leere String
+
+    def patternize(self, pair:str, lines:EncodedLines, formlemma:Dict[str, str], encoder:PatternEncoder) -> Counter:
+        """
+        Entspricht PatternEncoder.patternize() auf den Zeilen nach celex_lemmatize() und x_y_out(), arbeitet aber auf den Token-IDs. Gibt Counter(Patterns) zurück.
+
+        :param pair: Wortpaar der Form <Wort1>:<Wort2>
+        :param lines: zugehörige EncodedLines
+        :param formlemma: Wortform-Lemma-Dictionary
+        :param encoder: PatternEncoder
+        """
+        c = Counter()
+        for ids in self.line_ids(pair, lines, formlemma, encoder):
+            c.update(encoder.line_patterns(ids))
+        return c
+
+    def _string_line(self, tokens:Any, words:List[str], formlemma:Dict[str, str]) -> str:
+        """
+        Lemmatisiert eine Zeile und ersetzt das Wortpaar wie celex_lemmatize() und x_y_out() über Strings.
+        """
+        line = " ".join([formlemma.get(self.tokens[t], self.tokens[t]) for t in tokens.tolist()])
+        res = []
+        for w in line.split():
+            if w == words[0]:
+                w = 'X'
+            if w == words[1]:
+                w = 'Y'
+            res.append(w)
+        return " ".join(res)
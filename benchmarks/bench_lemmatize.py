@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2022 franka.beyer@fau.de
+
+import os
+import sys
+import time
+import random
+import itertools
+import tempfile
+import tracemalloc
+from typing import List, Dict, Tuple, Callable, Any
+import click
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from MakeVectors import celex_lemmatize, x_y_out
+from PatternEncoding import PatternEncoder
+from TokenEncoding import TokenTable, EncodedLines
+from Lexicon import Lexicon, build_lexicon
+
+def make_data(npairs:int, nlines:int, nlemmas:int, nsentences:int, seed:int) -> Tuple[Dict[str, List[str]], Dict[str, str]]:
+    """
+    Erzeugt ein synthetisches Wortpaar-CQP-Ergebnisse-Dictionary mit bereinigten Zeilen und das zugehörige Wortform-Lemma-Dictionary. Jedes Lemma hat drei Wortformen; die Zeilen eines Wortpaares stammen aus einem gemeinsamen Vorrat von Sätzen, in die Formen des Wortpaares eingesetzt werden, sodass dieselben Sätze und Tokens wie in echten Ergebnissen bei vielen Wortpaaren wiederkehren.
+
+    :param npairs: Anzahl der Wortpaare
+    :param nlines: Anzahl der Zeilen je Wortpaar
+    :param nlemmas: Anzahl der Lemmata
+    :param nsentences: Größe des Vorrats an Sätzen
+    :param seed: seed, der für random gesetzt wird
+    """
+    rng = random.Random(seed)
+    lemmas = ["l" + str(i) for i in range(nlemmas)]
+    formlemma = {l + suffix: l for l in lemmas for suffix in ("", "e", "en")}
+    forms = list(formlemma)
+    weights = list(itertools.accumulate(1.0 / (i + 1) for i in range(len(forms))))  #Zipf-verteilte Tokens
+    sentences = [rng.choices(forms, cum_weights=weights, k=rng.randint(0, 3)) for _ in range(nsentences)]
+    patterndict = {}
+    for _ in range(npairs):
+        x, y = rng.sample(lemmas, 2)
+        lines = []
+        for _ in range(nlines):
+            middle = rng.choice(sentences)
+            line = rng.choices(forms, cum_weights=weights, k=1) + [x + rng.choice(("", "e", "en"))] + middle + [y + rng.choice(("", "e", "en"))] + rng.choices(forms, cum_weights=weights, k=1)
+            lines.append(" ".join(line))
+        patterndict[x + ":" + y] = lines
+    return patterndict, formlemma
+
+def timed(func:Callable[[], Any], repeat:int) -> Tuple[Any, float]:
+    """
+    Führt func repeat-mal aus und gibt das letzte Ergebnis und die kürzeste Laufzeit in Sekunden zurück.
+
+    :param func: Funktion ohne Argumente
+    :param repeat: Anzahl der Wiederholungen
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        res = func()
+        best = min(best, time.perf_counter() - t)
+    return res, best
+
+def peak_memory(func:Callable[[], Any]) -> int:
+    """
+    Führt func einmal aus und gibt den Spitzenwert des dabei mit tracemalloc gemessenen Speichers in Bytes zurück.
+
+    :param func: Funktion ohne Argumente
+    """
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+def string_size(patterndict:Dict[str, List[str]]) -> int:
+    """
+    Gibt den Speicherbedarf der Ergebniszeilen als Listen von Strings in Bytes zurück.
+    """
+    return sum(sys.getsizeof(lines) + sum(sys.getsizeof(line) for line in lines) for lines in patterndict.values())
+
+def id_size(encoded:Dict[str, EncodedLines], table:TokenTable) -> int:
+    """
+    Gibt den Speicherbedarf der Ergebniszeilen als EncodedLines einschließlich des Vokabulars der TokenTable in Bytes zurück.
+    """
+    arrays = sum(sys.getsizeof(lines) + sys.getsizeof(lines.tokens) + sys.getsizeof(lines.offsets) for lines in encoded.values())
+    return arrays + sys.getsizeof(table.ids) + sys.getsizeof(table.tokens) + sum(sys.getsizeof(t) for t in table.tokens)
+
+def string_path(patterndict:Dict[str, List[str]], formlemma:Dict[str, str], keep:bool=True) -> Tuple[List[List[List[int]]], PatternEncoder]:
+    """
+    Lemmatisiert und ersetzt das Wortpaar über Strings wie patternize_pair() und übersetzt die Zeilen wie PatternEncoder.patternize() in IDs. Ohne keep werden die IDs wie beim Patternisieren je Wortpaar gleich wieder verworfen.
+    """
+    encoder = PatternEncoder()
+    res = []
+    for pair, lines in patterndict.items():
+        ids = [encoder.encode_tokens(line.split(" ")) for line in x_y_out(celex_lemmatize(lines, formlemma), pair.split(":"))]
+        if keep:
+            res.append(ids)
+    return res, encoder
+
+def id_path(encoded:Dict[str, EncodedLines], table:TokenTable, formlemma:Dict[str, str], keep:bool=True) -> Tuple[List[List[List[int]]], PatternEncoder]:
+    """
+    Lemmatisiert und ersetzt das Wortpaar auf den Token-IDs einer TokenTable. Die Lemmata werden dabei für jede Wiederholung neu nachgeschlagen. Ohne keep werden die IDs je Wortpaar gleich wieder verworfen.
+    """
+    encoder = PatternEncoder()
+    table.lemmas = table.lemmas[:0]
+    res = []
+    for pair, lines in encoded.items():
+        ids = list(table.line_ids(pair, lines, formlemma, encoder))
+        if keep:
+            res.append(ids)
+    return res, encoder
+
+@click.command()
+@click.option('--pairs', 'npairs', default=2000, help='Number of synthetic word pairs. Defaults to 2000.')
+@click.option('--lines', 'nlines', default=50, help='Number of concordance lines per word pair. Defaults to 50.')
+@click.option('--lemmas', 'nlemmas', default=20000, help='Number of synthetic lemmata, each with three wordforms. Defaults to 20000.')
+@click.option('--sentences', 'nsentences', default=5000, help='Number of distinct sentence middles shared by all word pairs. Defaults to 5000.')
+@click.option('--lexicon/--no-lexicon', default=False, help='Whether to look up lemmata in a memory-mapped Lexicon instead of a dictionary. Defaults to no.')
+@click.option('--seed', default=3, help='Seed to be used by random module. Defaults to 3.')
+@click.option('--repeat', default=3, help='Number of timed repetitions; the best one is reported. Defaults to 3.')
+def main(npairs, nlines, nlemmas, nsentences, lexicon, seed, repeat):
+    """
+    Compare lemmatization and X/Y substitution of concordance lines as strings (celex_lemmatize() and x_y_out()) with the token-ID path of TokenTable, report runtime and peak memory of both and check that they yield the same pattern input.
+    """
+    patterndict, formlemma = make_data(npairs, nlines, nlemmas, nsentences, seed)
+    if lexicon:
+        lexicondir = tempfile.mkdtemp()
+        build_lexicon({}, formlemma, lexicondir)
+        formlemma = Lexicon(lexicondir).formlemma
+
+    table = TokenTable()
+    encoded, t_encode = timed(lambda: TokenTable().encode_patterndict(dict(patterndict)), repeat)
+    encoded = table.encode_patterndict(dict(patterndict))
+    (strings, senc), t_strings = timed(lambda: string_path(patterndict, formlemma), repeat)
+    (ids, ienc), t_ids = timed(lambda: id_path(encoded, table, formlemma), repeat)
+    peak_strings = peak_memory(lambda: string_path(patterndict, formlemma, False))
+    peak_ids = peak_memory(lambda: id_path(encoded, table, formlemma, False))
+
+    same = all(len(a) == len(b) and all(senc.decode_all(x) == ienc.decode_all(y) for x, y in zip(a, b)) for a, b in zip(strings, ids))
+    print("pairs: %d, lines: %d, tokens: %d, distinct tokens: %d" % (len(patterndict), sum(len(v) for v in patterndict.values()), sum(len(v.tokens) for v in encoded.values()), len(table.tokens)))
+    print("lines as strings:   %.1f MB" % (string_size(patterndict) / 2**20))
+    print("lines as token ids: %.1f MB, encoded once in %.3fs" % (id_size(encoded, table) / 2**20, t_encode))
+    print("lemmatize+substitute, strings:   %.3fs, peak %.1f MB" % (t_strings, peak_strings / 2**20))
+    print("lemmatize+substitute, token ids: %.3fs, peak %.1f MB (%.1fx faster)" % (t_ids, peak_ids / 2**20, t_strings / t_ids))
+    print("identical pattern input: %s" % same)
+
+if __name__ == "__main__":
+
+    main()
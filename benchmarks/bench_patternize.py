@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2022 franka.beyer@fau.de
+
+import os
+import sys
+import time
+import random
+from collections import Counter
+from typing import List
+import click
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from MakeVectors import patternize
+from PatternEncoding import PatternEncoder
+
+def make_lines(n:int, vocabsize:int, seed:int) -> List[str]:
+    """
+    Erzeugt n synthetische Zeilen in der Form, wie sie nach celex_lemmatize() und x_y_out() vorliegen: ein optionales Token, X, 0 bis 3 Tokens, Y und ein abschließendes Token.
+
+    :param n: Anzahl der Zeilen
+    :param vocabsize: Größe des synthetischen Vokabulars
+    :param seed: seed, der für random gesetzt wird
+    """
+    rng = random.Random(seed)
+    vocab = ["w" + str(i) for i in range(vocabsize)]
+    lines = []
+    for _ in range(n):
+        line = [rng.choice(vocab)] if rng.random() < 0.9 else []
+        line.append("X")
+        line.extend(rng.choice(vocab) for _ in range(rng.randint(0, 3)))
+        line.append("Y")
+        line.append(rng.choice(vocab))
+        lines.append(" ".join(line))
+    return lines
+
+@click.command()
+@click.option('--lines', 'nlines', default=20000, help='Number of synthetic concordance lines. Defaults to 20000.')
+@click.option('--vocabsize', default=2000, help='Size of the synthetic vocabulary. Defaults to 2000.')
+@click.option('--seed', default=3, help='Seed to be used by random module. Defaults to 3.')
+@click.option('--repeat', default=3, help='Number of timed repetitions; the best one is reported. Defaults to 3.')
+def main(nlines, vocabsize, seed, repeat):
+    """
+    Compare Counter(patternize()) based on the recursive vary() with the bitmask enumeration of PatternEncoder and check that both produce the same pattern multiset.
+    """
+    lines = make_lines(nlines, vocabsize, seed)
+
+    best_strings = best_bitmask = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        strings = Counter(patternize(lines))
+        best_strings = min(best_strings, time.perf_counter() - t)
+
+        encoder = PatternEncoder()
+        t = time.perf_counter()
+        keys = encoder.patternize(lines)
+        best_bitmask = min(best_bitmask, time.perf_counter() - t)
+
+    decoded = Counter({encoder.decode(key): count for key, count in keys.items()})
+    print("lines:    %d" % nlines)
+    print("patterns: %d (%d distinct)" % (sum(strings.values()), len(strings)))
+    print("vary/patternize: %.3fs" % best_strings)
+    print("bitmask:         %.3fs (%.1fx)" % (best_bitmask, best_strings / best_bitmask))
+    print("identical multiset: %s" % (decoded == strings))
+
+if __name__ == "__main__":
+
+    main()
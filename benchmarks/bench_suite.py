@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2022 franka.beyer@fau.de
+
+import os
+import sys
+import csv
+import json
+import time
+import random
+import platform
+import resource
+import tempfile
+import itertools
+import contextlib
+import tracemalloc
+from collections import Counter
+from typing import List, Dict, Tuple, Callable, Iterator, Any
+import click
+import numpy
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from MakeVectors import celex_lemmatize, x_y_out, patternize, patternize_and_master_list, mine_patterns, choose_patterns, generate_vectordict, generate_feature_matrix, normalize_vectors, read_in_cqp_result
+from MakeCELEXDictFiles import clean_lines, create_dicts
+from PreprocessingCQP import celex_generate, write_cqp_scripts, run_cqp_queries
+from MakeNonyms import find_new_combinations
+from PatternEncoding import PatternEncoder
+from PatternMining import PatternMiner
+
+SCALES = {                                               #Größen der synthetischen Eingaben je Stufe
+    "small":  {"lemmas": 2000,  "pairs": 300,  "lines": 20, "maxmiddle": 3, "cqppairs": 10},
+    "medium": {"lemmas": 10000, "pairs": 1500, "lines": 40, "maxmiddle": 4, "cqppairs": 40},
+    "large":  {"lemmas": 40000, "pairs": 6000, "lines": 60, "maxmiddle": 5, "cqppairs": 120},
+}
+STAGES = ("read_results", "vary", "patternize_and_master_list", "mine_patterns", "generate_vectordict", "normalize_vectors", "balance_lines", "celex_generate", "run_cqp_queries", "find_new_combinations")
+SUFFIXES = ("", "e", "en", "es")
+
+def make_celex(nlemmas:int, rng:random.Random) -> List[str]:
+    """
+    Erzeugt Zeilen im Format der CELEX-Datei, <Wortform>\\<Lemma>, mit ein bis vier Wortformen je Lemma und Umlauten in der Kodierung von CELEX.
+
+    :param nlemmas: Anzahl der Lemmata
+    :param rng: Zufallsgenerator
+    """
+    letters = ['a', 'e', 'i', 'n', 'r', 's', 't', '"a', '"o', '"u', '$']
+    lines = []
+    for i in range(nlemmas):
+        lemma = "".join(rng.choice(letters) for _ in range(rng.randint(2, 5))) + "x" * (i // 1000) + chr(ord("a") + i % 26) * (1 + i % 7)
+        for suffix in SUFFIXES[:rng.randint(1, 4)]:
+            lines.append(lemma + suffix + "\\" + lemma + "\n")
+    return lines
+
+def make_wordpairs(lemmas:List[str], npairs:int, rng:random.Random) -> List[List[str]]:
+    """
+    Zieht npairs verschiedene Wortpaare aus zwei verschiedenen Lemmata.
+
+    :param lemmas: Liste der Lemmata
+    :param npairs: Anzahl der Wortpaare
+    :param rng: Zufallsgenerator
+    """
+    pairs = {}
+    while len(pairs) < npairs:
+        x, y = rng.sample(lemmas, 2)
+        pairs[(x, y)] = None
+    return [list(p) for p in pairs]
+
+def make_lines(pair:List[str], lemmaform:Dict[str, List[str]], forms:List[str], weights:List[float], nlines:int, maxmiddle:int, rng:random.Random) -> List[str]:
+    """
+    Erzeugt Konkordanzzeilen eines Wortpaares: ein Token, eine Wortform des ersten Wortes, 0 bis maxmiddle Tokens, eine Wortform des zweiten Wortes und ein Token. Die Tokens sind Zipf-verteilte Wortformen.
+
+    :param pair: Wortpaar
+    :param lemmaform: Lemma-Wortformen-Dictionary
+    :param forms: Liste aller Wortformen
+    :param weights: kumulierte Gewichte der Wortformen
+    :param nlines: Anzahl der Zeilen
+    :param maxmiddle: höchste Anzahl der Tokens zwischen den Wörtern
+    :param rng: Zufallsgenerator
+    """
+    lines = []
+    for _ in range(nlines):
+        tokens = rng.choices(forms, cum_weights=weights, k=2 + rng.randint(0, maxmiddle))
+        line = tokens[:1] + [rng.choice(lemmaform[pair[0]])] + tokens[1:-1] + [rng.choice(lemmaform[pair[1]])] + tokens[-1:]
+        lines.append(" ".join(line))
+    return lines
+
+def write_csv(name:str, rows:List[List[str]]) -> None:
+    """
+    Speichert Zeilen als csv-Datei.
+    """
+    with open(name, "w", newline="") as f:
+        csv.writer(f).writerows(rows)
+
+def make_inputs(workdir:str, scale:Dict[str, int], seed:int) -> Dict[str, Any]:
+    """
+    Erzeugt alle synthetischen Eingaben einer Stufe im Verzeichnis workdir: CELEX-Datei und die Dictionaries daraus, drei Wortpaar-csv-Dateien, CQP-Ergebnisdateien je Wortpaar im Format von 'cat' und ein Korpus aus allen Konkordanzzeilen für den Ersatz von cqp.
+
+    :param workdir: Verzeichnis für die Dateien
+    :param scale: Größen aus SCALES
+    :param seed: seed, der für random gesetzt wird
+    """
+    rng = random.Random(seed)
+    celex = make_celex(scale["lemmas"], rng)
+    with open(os.path.join(workdir, "celex.txt"), "w") as f:
+        f.writelines(celex)
+    lemmaform, formlemma = create_dicts(clean_lines(celex))
+    lemmas = list(lemmaform)
+    forms = list(formlemma)
+    weights = list(itertools.accumulate(1.0 / (i + 1) for i in range(len(forms))))
+    pairs = make_wordpairs(lemmas, scale["pairs"], rng)
+    labels = ["antonyms", "synonyms", "nonyms"]
+    third = len(pairs) // 3
+    for i, label in enumerate(labels):
+        write_csv(os.path.join(workdir, label + ".csv"), pairs[i * third:(i + 1) * third] if i < 2 else pairs[2 * third:])
+    resultnames = []
+    corpus = []
+    for pair in pairs:
+        lines = make_lines(pair, lemmaform, forms, weights, scale["lines"], scale["maxmiddle"], rng)
+        name = os.path.join(workdir, ":".join(pair) + ":.txt.data")
+        with open(name, "w") as f:
+            f.writelines("%8d: <%s>\n" % (i, line) for i, line in enumerate(lines))
+        resultnames.append(name)
+        corpus.extend(lines)
+    with open(os.path.join(workdir, "corpus.txt"), "w") as f:
+        f.writelines(line + "\n" for line in corpus)
+    return {"lemmaform": lemmaform, "formlemma": formlemma, "pairs": pairs, "labels": [labels[min(i // third, 2)] for i in range(len(pairs))], "resultnames": resultnames}
+
+def measure(func:Callable[[], Any], repeat:int) -> Tuple[Any, float, float, int]:
+    """
+    Führt func repeat-mal aus und einmal zusätzlich unter tracemalloc. Gibt das letzte Ergebnis, die kürzeste Wanduhr- und die zugehörige CPU-Zeit in Sekunden und den Spitzenwert des Speichers in Bytes zurück.
+
+    :param func: Funktion ohne Argumente
+    :param repeat: Anzahl der gemessenen Wiederholungen
+    """
+    best = (float("inf"), 0.0)
+    for _ in range(repeat):
+        t, c = time.perf_counter(), time.process_time()
+        res = func()
+        best = min(best, (time.perf_counter() - t, time.process_time() - c))
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return res, best[0], best[1], peak
+
+@contextlib.contextmanager
+def fake_cqp(corpus:str, latency:float, startup:float) -> Iterator[None]:
+    """
+    Stellt für die Dauer des Kontexts benchmarks/bin/cqp, das FakeCQP.py aufruft, als cqp vor alle anderen in PATH und setzt Korpus und Latenzen in der Umgebung.
+
+    :param corpus: Pfad zur Korpusdatei
+    :param latency: Sekunden je Anfrage
+    :param startup: Sekunden beim Start jedes cqp-Prozesses
+    """
+    old = dict(os.environ)
+    os.environ["PATH"] = os.path.join(HERE, "bin") + os.pathsep + os.environ.get("PATH", "")
+    os.environ["PYTHON"] = sys.executable
+    os.environ["FAKECQP_CORPUS"] = corpus
+    os.environ["FAKECQP_LATENCY"] = str(latency)
+    os.environ["FAKECQP_STARTUP"] = str(startup)
+    try:
+        yield
+    finally:
+        os.environ.clear()
+        os.environ.update(old)
+
+def run_stages(workdir:str, inputs:Dict[str, Any], stages:List[str], scale:Dict[str, int], repeat:int, latency:float, startup:float, nprocs:int, seed:int) -> Dict[str, Dict[str, float]]:
+    """
+    Misst die gewählten Stufen auf den Eingaben aus make_inputs() und gibt je Stufe Wanduhr- und CPU-Zeit, Spitzenwert des Speichers in MB und die Anzahl der verarbeiteten Einheiten zurück. Stufen, deren Eingaben von einer früheren Stufe stammen, bauen diese auch dann auf, wenn die frühere nicht gewählt wurde.
+
+    :param workdir: Verzeichnis der Eingaben
+    :param inputs: Ergebnis von make_inputs()
+    :param stages: Namen der zu messenden Stufen aus STAGES
+    :param scale: Größen aus SCALES
+    :param repeat: Anzahl der gemessenen Wiederholungen
+    :param latency: Sekunden je Anfrage des Ersatzes von cqp
+    :param startup: Sekunden beim Start jedes cqp-Prozesses
+    :param nprocs: Anzahl der gleichzeitig laufenden cqp-Prozesse
+    :param seed: seed für find_new_combinations()
+    """
+    report = {}
+    def record(name, func, items, repeat=repeat):
+        res, wall, cpu, peak = measure(func, repeat)
+        report[name] = {"seconds": round(wall, 6), "cpu_seconds": round(cpu, 6), "peak_mb": round(peak / 2**20, 3), "items": items}
+        return res
+
+    formlemma = inputs["formlemma"]
+    patterndict = {}
+    for name in inputs["resultnames"]:
+        patterndict[os.path.basename(name)[:-10]] = read_in_cqp_result(name)[1]
+    if "read_results" in stages:
+        record("read_results", lambda: [read_in_cqp_result(name) for name in inputs["resultnames"]], len(inputs["resultnames"]))
+    if "vary" in stages:
+        xy = [line for pair, lines in patterndict.items() for line in x_y_out(celex_lemmatize(lines, formlemma), pair.split(":"))]
+        record("vary", lambda: Counter(patternize(xy)), len(xy))
+    patternized, master = patternize_and_master_list(dict(patterndict), formlemma)
+    if "patternize_and_master_list" in stages:
+        record("patternize_and_master_list", lambda: patternize_and_master_list(dict(patterndict), formlemma), len(patterndict))
+    chosen = choose_patterns(20, len(patternized), master)
+    if "mine_patterns" in stages:
+        def mine():
+            encoder = PatternEncoder()
+            miner = mine_patterns(patterndict, formlemma, PatternMiner(encoder), encoder)
+            return encoder.decode_all(key for key, count in miner.most_common(20 * len(patternized)))
+        if record("mine_patterns", mine, len(patterndict)) != chosen:
+            raise click.ClickException("mine_patterns wählt andere Patterns als patternize_and_master_list")
+    vd = generate_vectordict(patternized, chosen)
+    if "generate_vectordict" in stages:
+        record("generate_vectordict", lambda: generate_vectordict(patternized, chosen), len(patternized) * len(chosen))
+    if "normalize_vectors" in stages:
+        record("normalize_vectors", lambda: normalize_vectors(vd), len(vd) * len(chosen))
+    if "balance_lines" in stages:
+        labels = dict(zip((":".join(p) for p in inputs["pairs"]), inputs["labels"]))
+        matrix = generate_feature_matrix(patternized, chosen).normalize()
+        record("balance_lines", lambda: matrix.balance(labels), len(matrix.pairs))  #Name der Stufe wie in früheren Berichten
+    if "celex_generate" in stages:
+        record("celex_generate", lambda: celex_generate(inputs["pairs"], inputs["lemmaform"]), len(inputs["pairs"]))
+    if "run_cqp_queries" in stages:
+        cqpdir = os.path.join(workdir, "cqp")
+        os.makedirs(cqpdir, exist_ok=True)
+        cwd = os.getcwd()
+        os.chdir(cqpdir)
+        try:
+            forms = celex_generate(inputs["pairs"][:scale["cqppairs"]], inputs["lemmaform"])
+            names, _ = write_cqp_scripts(forms, "BENCH;")
+            with fake_cqp(os.path.join(workdir, "corpus.txt"), latency, startup):
+                record("run_cqp_queries", lambda: run_cqp_queries(names, nprocs), sum(len(v) for v in forms.values()), 1)
+            report["run_cqp_queries"]["child_rss_mb"] = round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 3)
+        finally:
+            os.chdir(cwd)
+    if "find_new_combinations" in stages:
+        files = [os.path.join(workdir, "antonyms.csv"), os.path.join(workdir, "synonyms.csv")]
+        n = len(inputs["pairs"]) // 4
+        record("find_new_combinations", lambda: find_new_combinations(files[0], files[1], seed, n), n)
+    return report
+
+def compare(report:Dict[str, Any], baseline:Dict[str, Any], tolerance:float, floor:float) -> List[str]:
+    """
+    Vergleicht Laufzeit und Speicher je Stufe mit einem früheren Bericht, gibt eine Tabelle aus und liefert die Namen der Stufen zurück, die um mehr als tolerance langsamer geworden sind oder mehr Speicher brauchen. Unterschiede unter floor Sekunden bzw. MB gelten als Rauschen.
+
+    :param report: aktueller Bericht
+    :param baseline: früherer Bericht
+    :param tolerance: erlaubte relative Verschlechterung, z.B. 0.25 für 25 %
+    :param floor: absolute Schwelle in Sekunden bzw. MB
+    """
+    if baseline.get("params") != report["params"]:
+        print("Warnung: Baseline mit anderen Parametern erzeugt: " + json.dumps(baseline.get("params")))
+    regressions = []
+    print("%-28s %10s %10s %7s %10s %10s %7s" % ("stage", "base s", "now s", "ratio", "base MB", "now MB", "ratio"))
+    for name, now in report["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if base is None:
+            print("%-28s %10s %10.4f %7s %10s %10.3f %7s" % (name, "-", now["seconds"], "-", "-", now["peak_mb"], "-"))
+            continue
+        worse = False
+        ratios = []
+        for key, unit in (("seconds", floor), ("peak_mb", floor)):
+            ratio = now[key] / base[key] if base[key] else float("inf") if now[key] else 1.0
+            ratios.append(ratio)
+            if ratio > 1 + tolerance and now[key] - base[key] > unit:
+                worse = True
+        print("%-28s %10.4f %10.4f %6.2fx %10.3f %10.3f %6.2fx%s" % (name, base["seconds"], now["seconds"], ratios[0], base["peak_mb"], now["peak_mb"], ratios[1], "  REGRESSION" if worse else ""))
+        if worse:
+            regressions.append(name)
+    return regressions
+
+@click.command()
+@click.option('--scale', default='small', type=click.Choice(list(SCALES)), help='Size of the synthetic inputs. Defaults to "small".')
+@click.option('--stage', 'stages', multiple=True, type=click.Choice(STAGES), help='Stage to measure; can be given several times. Defaults to all stages.')
+@click.option('--repeat', default=3, help='Number of timed repetitions per stage; the best one is reported. run_cqp_queries always runs once. Defaults to 3.')
+@click.option('--latency', default=0.0, help='Seconds the fake cqp waits per query. Defaults to 0.')
+@click.option('--startup', default=0.0, help='Seconds the fake cqp waits when starting. Defaults to 0.')
+@click.option('--nprocs', default=4, help='Number of fake cqp processes running at the same time. Defaults to 4.')
+@click.option('--seed', default=3, help='Seed to be used by random module. Defaults to 3.')
+@click.option('--workdir', default=None, help='Directory to write the synthetic inputs to and keep them in. Defaults to a temporary directory that is removed afterwards.')
+@click.option('--report', 'reportfile', default='bench_report.json', help='Full path to or filename of json file to contain the report. Defaults to "bench_report.json".')
+@click.option('--baseline', default=None, help='Report of an earlier run to compare with; exits with status 1 if a stage got slower or needs more memory beyond --tolerance. Defaults to no comparison.')
+@click.option('--tolerance', default=0.25, help='Allowed relative slowdown or memory growth per stage with --baseline. Defaults to 0.25.')
+@click.option('--floor', default=0.01, help='Differences below this many seconds or MB are ignored with --baseline. Defaults to 0.01.')
+def main(scale, stages, repeat, latency, startup, nprocs, seed, workdir, reportfile, baseline, tolerance, floor):
+    """
+    Generate synthetic word pairs, CELEX lexicon, CQP result files and concordance lines, measure time and peak memory of the pipeline stages on them, including run_cqp_queries() against a fake cqp, and write a json report that can be compared with a stored baseline.
+    """
+    stages = list(stages) or list(STAGES)
+    params = dict(SCALES[scale], scale=scale, seed=seed, repeat=repeat, latency=latency, startup=startup, nprocs=nprocs)
+    with contextlib.ExitStack() as stack:
+        if workdir is None:
+            workdir = stack.enter_context(tempfile.TemporaryDirectory())
+        workdir = os.path.abspath(workdir)
+        os.makedirs(workdir, exist_ok=True)
+        t = time.perf_counter()
+        inputs = make_inputs(workdir, SCALES[scale], seed)
+        print("inputs: %d lemmata, %d word pairs, %d lines in %.2fs" % (len(inputs["lemmaform"]), len(inputs["pairs"]), len(inputs["pairs"]) * SCALES[scale]["lines"], time.perf_counter() - t))
+        results = run_stages(workdir, inputs, stages, SCALES[scale], repeat, latency, startup, nprocs, seed)
+    report = {
+        "params": params,
+        "environment": {"python": platform.python_version(), "numpy": numpy.__version__, "machine": platform.machine(), "system": platform.system(), "cpus": os.cpu_count()},
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "stages": results,
+    }
+    with open(reportfile, "w") as f:
+        json.dump(report, f, indent=2)
+    for name, r in results.items():
+        print("%-28s %8.4fs  cpu %8.4fs  peak %8.3f MB  %d items" % (name, r["seconds"], r["cpu_seconds"], r["peak_mb"], r["items"]))
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(report, json.load(f), tolerance, floor)
+        if regressions:
+            raise click.ClickException("Verschlechtert: " + ", ".join(regressions))
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2022 franka.beyer@fau.de
+
+import os
+import sys
+import csv
+import json
+import sqlite3
+import tempfile
+import subprocess
+from typing import List, Dict
+import click
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(HERE, os.pardir, "PreprocessingCQP.py")
+
+LEMMAFORM = {"Tag": ["Tag", "Tage"], "Nacht": ["Nacht", "Nächte"], "Hund": ["Hund", "Hunde"], "Katze": ["Katze", "Katzen"]}
+PAIRS = [["Tag", "Nacht"], ["Hund", "Katze"]]
+CORPUS = "der Tag und die Nacht sind lang . die Tage und die Nächte auch . der Hund und die Katze schlafen . die Hunde jagen die Katzen heute .\n"
+FAIL = '"Hunde" \\[\\]\\{0,3\\} "Katze"'            #dritte von vier Anfragen zu Hund:Katze, sodass vorher schon Ergebnisse vorliegen
+
+def read_rows(name:str) -> List[str]:
+    """
+    Liest eine Wortpaar-Datei als Liste von Wortpaaren der Form '<Wort>:<Wort>'; eine fehlende Datei gilt als leer.
+
+    :param name: Pfad zur csv-Datei
+    """
+    if not os.path.exists(name):
+        return []
+    with open(name, newline="") as f:
+        return [":".join(row) for row in csv.reader(f)]
+
+def run_case(workdir:str, extra:List[str]) -> Dict[str, List[str]]:
+    """
+    Lässt PreprocessingCQP.py mit --runner=pool gegen FakeCQP.py laufen, wobei jede Anfrage nach FAIL den cqp-Prozess abbrechen lässt, und gibt die fehlgeschlagenen und verworfenen Wortpaare sowie die Wortpaare je Status im Manifest zurück.
+
+    :param workdir: leeres Verzeichnis mit Korpus, Lemma-Wortformen-Dictionary und Wortpaar-Datei
+    :param extra: weitere Argumente für PreprocessingCQP.py, z.B. ['--querycache', 'cache.sqlite']
+    """
+    env = dict(os.environ, PYTHON=sys.executable, FAKECQP_CORPUS=os.path.join(workdir, "corpus.txt"), FAKECQP_FAIL=FAIL)
+    args = [sys.executable, SCRIPT, "--lemmaformname", "LemmaForm.json", "-f", "pairs.csv", "--corpusname", "FAKE;", "--runner", "pool", "--nprocs", "2", "--cqp", os.path.join(HERE, "bin", "cqp"), "--manifest", "manifest.sqlite"] + extra
+    proc = subprocess.run(args, cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    if proc.returncode:
+        raise click.ClickException("PreprocessingCQP.py endete mit Rückgabewert " + str(proc.returncode) + ":\n" + proc.stdout)
+    with sqlite3.connect(os.path.join(workdir, "manifest.sqlite")) as db:
+        statuses = dict(db.execute("SELECT pair, status FROM pairs"))
+    return {
+        "failed": read_rows(os.path.join(workdir, "actual_failed_0-200_pairs.csv")),
+        "blacklisted": read_rows(os.path.join(workdir, "actual_blacklisted_0-200_pairs.csv")),
+        "manifest_failed": sorted(p for p, s in statuses.items() if s == 'failed'),
+        "manifest_nohits": sorted(p for p, s in statuses.items() if s == 'nohits'),
+        "manifest_hits": sorted(p for p, s in statuses.items() if s == 'hits'),
+    }
+
+@click.command()
+@click.option('--workdir', default=None, help='Directory to run the cases in and keep their files. Defaults to a temporary directory that is removed afterwards.')
+def main(workdir):
+    """
+    Check that a word pair whose cqp process crashes under --runner=pool, with and without --querycache, is reported as failed and not blacklisted as having no hits. Exits with status 1 otherwise.
+    """
+    expected = {"failed": ["Hund:Katze"], "blacklisted": [], "manifest_failed": ["Hund:Katze"], "manifest_nohits": [], "manifest_hits": ["Tag:Nacht"]}
+    errors = []
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.abspath(workdir) if workdir else tmp
+        for case, extra in (("pool", []), ("pool_querycache", ["--querycache", "cache.sqlite"])):
+            d = os.path.join(root, case)
+            os.makedirs(d, exist_ok=True)
+            with open(os.path.join(d, "corpus.txt"), "w") as f:
+                f.write(CORPUS)
+            with open(os.path.join(d, "LemmaForm.json"), "w") as f:
+                json.dump(LEMMAFORM, f)
+            with open(os.path.join(d, "pairs.csv"), "w", newline="") as f:
+                csv.writer(f).writerows(PAIRS)
+            for name in ("manifest.sqlite", "cache.sqlite", "actual_failed_0-200_pairs.csv"):
+                if os.path.exists(os.path.join(d, name)):
+                    os.remove(os.path.join(d, name)) #Reste eines früheren Laufs in --workdir
+            got = run_case(d, extra)
+            print("%-16s %s" % (case, json.dumps(got)))
+            errors.extend(case + ": " + key + " ist " + str(got[key]) + " statt " + str(value) for key, value in expected.items() if got[key] != value)
+    if errors:
+        raise click.ClickException("; ".join(errors))
+    print("ok")
+
+if __name__ == "__main__":
+
+    main()